@@ -0,0 +1,444 @@
+''' Block index for random access into bz2 compressed Reddit dumps.
+
+A bz2 file is a sequence of independently compressed blocks, each one
+starting with a 48 bit magic number at an arbitrary bit position. This
+module finds those boundaries once, counts the lines inside every block
+and stores the result in a sidecar file next to the dump. Any block can
+then be decompressed on its own by wrapping its bits into a single block
+bz2 stream, so a range of lines is read without decompressing everything
+before it.
+
+'''
+
+import os
+import argparse
+import logging
+import bz2
+import numpy as np
+
+BLOCK_MAGIC = 0x314159265359
+EOS_MAGIC = 0x177245385090
+MAGIC_BITS = 48
+CRC_BITS = 32
+
+
+def magic_patterns(magic):
+    '''Returns the byte patterns of a 48 bit magic at every bit shift.
+
+    For each shift s in 0..7 the magic starting at bit s of a byte covers
+    five or six whole bytes, which can be searched with bytes.find. The
+    result is a list of (shift, pattern, offset) where offset is the
+    distance in bytes from the byte holding the first magic bit to the
+    start of the pattern.
+
+    Parameters
+    ----------
+    magic : int
+        48 bit magic number.
+    '''
+
+    patterns = []
+    for shift in range(8):
+        window = (magic << (8 - shift)).to_bytes(7, 'big')
+        first = 0 if shift == 0 else 1
+        last = (shift + MAGIC_BITS) // 8
+        patterns.append((shift, window[first:last], first))
+
+    return patterns
+
+
+def read_bits(raw, start, nbits):
+    '''Returns nbits of a bytes object starting at bit start as an int.
+
+    Parameters
+    ----------
+    raw : bytes
+        Input buffer.
+    start : int
+        First bit position.
+    nbits : int
+        Number of bits to read.
+    '''
+
+    first = start // 8
+    last = (start + nbits + 7) // 8
+    value = int.from_bytes(raw[first:last], 'big')
+    return (value >> ((last - first) * 8 - (start % 8) - nbits)) & \
+        ((1 << nbits) - 1)
+
+
+def find_markers(file_path, chunk_size=1 << 24):
+    '''Returns the sorted bit offsets of block and end of stream magics.
+
+    The result is a list of (bit_offset, is_block) tuples. The search is
+    done on whole bytes and every hit is checked against the full magic,
+    compressed data can still contain a magic by chance, callers must
+    verify the blocks by decompressing them.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the bz2 file.
+    chunk_size : int, optional
+        Number of bytes read at a time.
+    '''
+
+    searches = [(True, BLOCK_MAGIC, magic_patterns(BLOCK_MAGIC)),
+                (False, EOS_MAGIC, magic_patterns(EOS_MAGIC))]
+    markers = set()
+    overlap = 8
+    base = 0
+    tail = b''
+
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            raw = tail + data
+            for is_block, magic, patterns in searches:
+                for shift, pattern, offset in patterns:
+                    pos = raw.find(pattern)
+                    while pos != -1:
+                        start = (pos - offset) * 8 + shift
+                        end = (start + MAGIC_BITS + 7) // 8
+                        if start >= 0 and end <= len(raw) and \
+                                read_bits(raw, start, MAGIC_BITS) == magic:
+                            markers.add((base * 8 + start, is_block))
+                        pos = raw.find(pattern, pos + 1)
+            tail = raw[-overlap:]
+            base += len(raw) - len(tail)
+
+    return sorted(markers)
+
+
+def decompress_block(f, start_bit, end_bit):
+    '''Decompresses the bz2 block stored between two bit offsets.
+
+    The bits are realigned to a byte boundary and wrapped into a stream
+    with its own header and end of stream marker. The stream checksum of
+    a single block stream is the block checksum itself.
+
+    Parameters
+    ----------
+    f : file
+        Bz2 file opened in binary mode.
+    start_bit : int
+        Bit offset of the block magic.
+    end_bit : int
+        Bit offset of the next block or end of stream magic.
+    '''
+
+    first = start_bit // 8
+    f.seek(first)
+    raw = f.read((end_bit + 7) // 8 - first)
+    nbits = end_bit - start_bit
+    block = read_bits(raw, start_bit % 8, nbits)
+    crc = read_bits(raw, start_bit % 8 + MAGIC_BITS, CRC_BITS)
+
+    stream = (((block << MAGIC_BITS) | EOS_MAGIC) << CRC_BITS) | crc
+    total = nbits + MAGIC_BITS + CRC_BITS
+    padding = -total % 8
+    stream <<= padding
+    size = (total + padding) // 8
+
+    return bz2.decompress(b'BZh9' + stream.to_bytes(size, 'big'))
+
+
+class BZ2Index:
+    '''
+    Block and line index of a bz2 file.
+
+    Attributes
+    ----------
+    file_path : str
+        Path to the bz2 file.
+    index_path : str
+        Path to the sidecar index file.
+    start_bits : array
+        Bit offset where every block starts.
+    end_bits : array
+        Bit offset where every block ends.
+    newlines : array
+        Number of newline characters in every block.
+    nlines : int
+        Total number of lines of the decompressed file.
+
+    Methods
+    -------
+    build(file_path, index_path=None)
+        Scans a bz2 file and saves its index.
+    open(file_path, index_path=None)
+        Loads the index of a file, building it when missing or stale.
+    read_block(f, block)
+        Returns the decompressed contents of a block.
+    iter_lines(start=0, stop=None, binary=False)
+        Yields the lines in a range decompressing only the blocks needed.
+    split(parts)
+        Returns disjoint line ranges aligned with block boundaries.
+    '''
+
+    SUFFIX = '.idx.npz'
+    MAX_FALSE_MARKERS = 8
+
+    def __init__(self, file_path, start_bits, end_bits, newlines,
+                 trailing_line, index_path=None):
+        '''
+        Parameters
+        ----------
+        file_path : str
+            Path to the bz2 file.
+        start_bits : array
+            Bit offset where every block starts.
+        end_bits : array
+            Bit offset where every block ends.
+        newlines : array
+            Number of newline characters in every block.
+        trailing_line : bool
+            Whether the file ends with a line without newline.
+        index_path : str, optional
+            Path to the sidecar index file.
+        '''
+
+        self.file_path = file_path
+        self.index_path = index_path or file_path + self.SUFFIX
+        self.start_bits = np.asarray(start_bits, dtype=np.int64)
+        self.end_bits = np.asarray(end_bits, dtype=np.int64)
+        self.newlines = np.asarray(newlines, dtype=np.int64)
+        self.trailing_line = bool(trailing_line)
+        # Number of newlines seen before the start of every block.
+        self.newlines_before = np.concatenate(
+            ([0], np.cumsum(self.newlines)[:-1])).astype(np.int64)
+        self.nlines = int(self.newlines.sum()) + int(self.trailing_line)
+
+    def __len__(self):
+        return len(self.start_bits)
+
+    @staticmethod
+    def _stat(file_path):
+        stat = os.stat(file_path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    @classmethod
+    def build(cls, file_path, index_path=None):
+        '''Scans a bz2 file, indexes its blocks and saves the sidecar.
+
+        Every candidate block is decompressed, which both counts its lines
+        and discards magic numbers found by chance inside compressed data.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the bz2 file.
+        index_path : str, optional
+            Path to the sidecar file, the file path plus SUFFIX by default.
+        '''
+
+        logging.debug('Building bz2 block index of %s.', file_path)
+
+        with open(file_path, 'rb') as f:
+            if f.read(3) != b'BZh':
+                raise ValueError(f'{file_path} is not a bz2 file')
+
+        markers = find_markers(file_path)
+        start_bits, end_bits, newlines = [], [], []
+        last_byte = b'\n'
+
+        with open(file_path, 'rb') as f:
+            i = 0
+            while i < len(markers):
+                start, is_block = markers[i]
+                if not is_block:
+                    i += 1
+                    continue
+
+                # Extend the block over markers that turn out to be false.
+                for j in range(i + 1, min(len(markers),
+                                          i + 2 + cls.MAX_FALSE_MARKERS)):
+                    try:
+                        data = decompress_block(f, start, markers[j][0])
+                        break
+                    except (OSError, ValueError, EOFError):
+                        continue
+                else:
+                    raise ValueError(f'Corrupt bz2 block at bit {start} '
+                                     f'of {file_path}')
+
+                start_bits.append(start)
+                end_bits.append(markers[j][0])
+                newlines.append(data.count(b'\n'))
+                if data:
+                    last_byte = data[-1:]
+                i = j
+
+        index = cls(file_path, start_bits, end_bits, newlines,
+                    last_byte != b'\n', index_path)
+        np.savez(index.index_path, start_bits=index.start_bits,
+                 end_bits=index.end_bits, newlines=index.newlines,
+                 trailing_line=np.array([index.trailing_line]),
+                 source=cls._stat(file_path))
+        # np.savez appends .npz when missing.
+        if not index.index_path.endswith('.npz'):
+            os.replace(index.index_path + '.npz', index.index_path)
+
+        logging.debug('Indexed %s blocks and %s lines.', len(index),
+                      index.nlines)
+
+        return index
+
+    @classmethod
+    def open(cls, file_path, index_path=None):
+        '''Loads the index of a file, building it when missing or stale.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the bz2 file.
+        index_path : str, optional
+            Path to the sidecar file.
+        '''
+
+        index_path = index_path or file_path + cls.SUFFIX
+
+        if os.path.exists(index_path):
+            with np.load(index_path) as stored:
+                if np.array_equal(stored['source'], cls._stat(file_path)):
+                    return cls(file_path, stored['start_bits'],
+                               stored['end_bits'], stored['newlines'],
+                               stored['trailing_line'][0], index_path)
+            logging.debug('Stale bz2 index %s.', index_path)
+
+        return cls.build(file_path, index_path)
+
+    @classmethod
+    def exists(cls, file_path, index_path=None):
+        '''Returns whether a sidecar index has been built for a file.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the bz2 file.
+        index_path : str, optional
+            Path to the sidecar file.
+        '''
+
+        return os.path.exists(index_path or file_path + cls.SUFFIX)
+
+    def read_block(self, f, block):
+        '''Returns the decompressed contents of a block.
+
+        Parameters
+        ----------
+        f : file
+            Bz2 file opened in binary mode.
+        block : int
+            Block number.
+        '''
+
+        return decompress_block(f, int(self.start_bits[block]),
+                                int(self.end_bits[block]))
+
+    def locate(self, line):
+        '''Returns the block where a line starts and the number of
+        newlines to skip inside that block to reach it.
+
+        Parameters
+        ----------
+        line : int
+            Line number, starting at zero.
+        '''
+
+        if line == 0:
+            return 0, 0
+
+        block = int(np.searchsorted(self.newlines_before, line - 1,
+                                    side='right')) - 1
+        return block, line - int(self.newlines_before[block])
+
+    def iter_lines(self, start=0, stop=None, binary=False):
+        '''Yields the lines in [start, stop) as strings ending in newline.
+
+        Only the blocks holding the range are decompressed, so resuming
+        a scan at line start costs nothing for the lines before it.
+
+        Parameters
+        ----------
+        start : int, optional
+            First line to read.
+        stop : int, optional
+            Line where reading stops, the end of the file by default.
+        binary : bool, optional
+            Yield undecoded bytes instead of strings.
+        '''
+
+        stop = self.nlines if stop is None else min(stop, self.nlines)
+        if start >= stop:
+            return
+
+        remaining = stop - start
+        block, skip = self.locate(start)
+        partial = b''
+
+        with open(self.file_path, 'rb') as f:
+            for block in range(block, len(self)):
+                data = self.read_block(f, block)
+
+                pos = 0
+                for _ in range(skip):
+                    pos = data.index(b'\n', pos) + 1
+                skip = 0
+
+                pieces = data[pos:].split(b'\n')
+                pieces[0] = partial + pieces[0]
+                partial = pieces.pop()
+
+                for piece in pieces:
+                    piece += b'\n'
+                    yield piece if binary else piece.decode('utf-8')
+                    remaining -= 1
+                    if not remaining:
+                        return
+
+        if partial:
+            yield partial if binary else partial.decode('utf-8')
+
+    def split(self, parts):
+        '''Returns up to parts disjoint (start, stop) line ranges covering
+        the file, cut where blocks start so every worker decompresses its
+        own blocks plus at most the head of the next one.
+
+        Parameters
+        ----------
+        parts : int
+            Number of ranges wanted.
+        '''
+
+        if not len(self) or not self.nlines:
+            return []
+
+        # First line starting in every block.
+        first_lines = np.minimum(self.newlines_before + 1, self.nlines)
+        first_lines[0] = 0
+        cuts = np.linspace(0, len(self), min(parts, len(self)) + 1)
+        starts = sorted(set(int(first_lines[int(b)]) for b in cuts[:-1]))
+        stops = starts[1:] + [self.nlines]
+
+        return [(a, b) for a, b in zip(starts, stops) if a < b]
+
+
+# Builds the index of every dump given in the command line.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Builds the block index of bz2 compressed dumps.')
+    parser.add_argument('dumps', nargs='+', help='bz2 compressed files')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=logging.DEBUG)
+    for file_path in args.dumps:
+        BZ2Index.build(file_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,640 @@
+''' Columnar store of the posts of a Reddit dump.
+
+Every run over a bz2 dump pays for decompressing it and for decoding the
+json of fields that are never used, only the domain and the text of the
+posts are needed. This module converts a dump once into a directory of
+numpy files next to it, all of them memory-mapped on load:
+
+- domains.npy, the sorted distinct domains, and domain.npy, the index of
+  the domain of every row into them.
+- domain_rows.npy, where rows domain_rows[i] to domain_rows[i + 1] hold
+  the posts of domains[i]. Rows are grouped by domain and keep the order
+  of the dump inside each domain, line.npy holds their line numbers.
+- text.offsets.npy and text.data.npy, the UTF-8 texts of all the rows
+  concatenated, row i spanning data[offsets[i]:offsets[i + 1]].
+- tokens.offsets.npy and tokens.ids.npy, optionally, the ids of the
+  tokens of every row, with the words of the ids in vocabulary.offsets.npy
+  and vocabulary.data.npy.
+- One offsets and data pair for every extra field kept, such as the id
+  of the posts, json encoded.
+
+The posts of a domain are therefore contiguous in every column, reading
+them touches about as many pages as their own size and none of the rest
+of the month. Word counts come from the token ids with array operations
+and equal those of the bz2 path, ids in order of first appearance
+included.
+
+'''
+
+import os
+import json
+import shutil
+import argparse
+import logging
+from array import array
+import numpy as np
+from numpy.lib.format import open_memmap
+from app.ingest import MultiDomainFilter, open_lines, tokenize_text
+from app.vocabulary import Vocabulary
+from app.instrument import get_recorder
+
+
+class StringColumn:
+    '''
+    Variable length strings stored as one UTF-8 buffer and the offsets
+    where every string starts.
+
+    Attributes
+    ----------
+    offsets : array
+        Start of every string in data, plus the end of the last one.
+    data : array
+        Concatenated UTF-8 bytes.
+
+    Methods
+    -------
+    save(prefix, strings)
+        Writes the strings of an iterable.
+    load(prefix)
+        Memory-maps a column.
+    size(start, stop)
+        Returns the number of bytes of a range of strings.
+    slice(start, stop)
+        Yields a range of strings.
+    '''
+
+    OFFSETS_SUFFIX = '.offsets.npy'
+    DATA_SUFFIX = '.data.npy'
+
+    def __init__(self, offsets, data):
+        '''
+        Parameters
+        ----------
+        offsets : array
+            Start of every string in data, plus the end of the last one.
+        data : array
+            Concatenated UTF-8 bytes.
+        '''
+
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def save(cls, prefix, strings):
+        '''Writes the strings of an iterable and returns the column.
+
+        Parameters
+        ----------
+        prefix : str
+            Path prefix of the two numpy files written.
+        strings : iterable
+            Strings, or UTF-8 encoded bytes.
+        '''
+
+        offsets = array('q', [0])
+        with open(prefix + '.tmp', 'wb') as buffer:
+            for string in strings:
+                if isinstance(string, str):
+                    string = string.encode('utf-8')
+                buffer.write(string)
+                offsets.append(offsets[-1] + len(string))
+
+        data = np.fromfile(prefix + '.tmp', dtype=np.uint8)
+        np.save(prefix + cls.DATA_SUFFIX, data)
+        np.save(prefix + cls.OFFSETS_SUFFIX,
+                np.frombuffer(offsets, dtype=np.int64))
+        os.remove(prefix + '.tmp')
+
+        return cls.load(prefix)
+
+    @classmethod
+    def load(cls, prefix):
+        '''Memory-maps a column written by save.
+
+        Parameters
+        ----------
+        prefix : str
+            Path prefix of the two numpy files.
+        '''
+
+        # Plain views of the mapped files, indexing a memmap is slow.
+        return cls(np.asarray(np.load(prefix + cls.OFFSETS_SUFFIX,
+                                      mmap_mode='r')),
+                   np.asarray(np.load(prefix + cls.DATA_SUFFIX,
+                                      mmap_mode='r')))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:stop].tobytes().decode('utf-8')
+
+    def size(self, start, stop):
+        '''Returns the number of bytes of the strings [start, stop).
+
+        Parameters
+        ----------
+        start : int
+            First string.
+        stop : int
+            String where the range stops.
+        '''
+
+        return int(self.offsets[stop] - self.offsets[start])
+
+    def slice(self, start, stop):
+        '''Yields the strings [start, stop), reading their bytes at once.
+
+        Parameters
+        ----------
+        start : int
+            First string.
+        stop : int
+            String where the range stops.
+        '''
+
+        offsets = np.asarray(self.offsets[start:stop + 1])
+        if len(offsets) < 2:
+            return
+        data = self.data[offsets[0]:offsets[-1]].tobytes()
+        bounds = (offsets - offsets[0]).tolist()
+        for a, b in zip(bounds, bounds[1:]):
+            yield data[a:b].decode('utf-8')
+
+
+class _Spool:
+    # Rows of one column appended to raw temporary files in the order of
+    # the dump, the values of the rows to one file and, for variable
+    # length rows, their lengths to another. At most flush_size values
+    # are buffered.
+
+    DTYPES = {'B': np.uint8, 'i': np.int32, 'q': np.int64}
+
+    def __init__(self, prefix, typecode='B', ragged=True,
+                 flush_size=1 << 16):
+        self.prefix = prefix
+        self.typecode = typecode
+        self.ragged = ragged
+        self.flush_size = flush_size
+        self._data = open(prefix + '.data.tmp', 'wb')
+        self._lengths = open(prefix + '.lengths.tmp', 'wb')
+        self._values = array(typecode)
+        self._sizes = array('q')
+
+    def append(self, values):
+        if self.typecode == 'B':
+            self._data.write(values)
+        else:
+            self._values.extend(values)
+        if self.ragged:
+            self._sizes.append(len(values))
+        if len(self._sizes) >= self.flush_size or \
+                len(self._values) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        self._values.tofile(self._data)
+        self._sizes.tofile(self._lengths)
+        self._values = array(self.typecode)
+        self._sizes = array('q')
+
+    def close(self):
+        self.flush()
+        self._data.close()
+        self._lengths.close()
+
+    def values(self):
+        return _map_raw(self.prefix + '.data.tmp',
+                        self.DTYPES[self.typecode])
+
+    def columns(self):
+        # Offsets of the rows and their memory-mapped values.
+        lengths = _map_raw(self.prefix + '.lengths.tmp', np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets, self.values()
+
+    def remove(self):
+        for suffix in ('.data.tmp', '.lengths.tmp'):
+            os.remove(self.prefix + suffix)
+
+
+def _map_raw(path, dtype):
+    # Plain view of a raw file mapped in memory, empty files included.
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=dtype)
+    return np.asarray(np.memmap(path, dtype=dtype, mode='r'))
+
+
+def _permute(offsets, data, order, data_path, offsets_path,
+             chunk_size=1 << 22):
+    # Writes the variable length rows of a column in the given row order,
+    # moving about chunk_size values at a time with one gather each.
+    lengths = np.diff(offsets)[order]
+    starts = offsets[:-1][order]
+    new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    output = open_memmap(data_path, mode='w+', dtype=data.dtype,
+                         shape=(int(new_offsets[-1]),))
+
+    first = 0
+    while first < len(order):
+        last = int(np.searchsorted(new_offsets,
+                                   new_offsets[first] + chunk_size,
+                                   side='right')) - 1
+        last = min(max(last, first + 1), len(order))
+        low, high = int(new_offsets[first]), int(new_offsets[last])
+        if high > low:
+            source = np.repeat(starts[first:last] -
+                               new_offsets[first:last],
+                               lengths[first:last]) + \
+                np.arange(low, high, dtype=np.int64)
+            output[low:high] = data[source]
+        first = last
+
+    output.flush()
+    del output
+    np.save(offsets_path, new_offsets)
+
+
+class CorpusStore:
+    '''
+    Posts of a dump in memory-mapped columns grouped by domain.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the store.
+    meta : dict
+        Source file, its size and modification time, the json key names
+        and the columns of the store.
+    domains : list
+        Sorted distinct domains.
+    domain_rows : array
+        First row of every domain, plus the number of rows.
+    lines : array
+        Line of the dump of every row.
+    text : StringColumn
+        Text of every row.
+
+    Methods
+    -------
+    convert(file_path, store_path=None, tokens=True, fields=('id',))
+        Converts a bz2 dump into a store in bounded memory.
+    load(store_path)
+        Memory-maps a store.
+    find(file_path, domain_id='domain', text_id='selftext')
+        Returns the store of a dump, None when missing or stale.
+    rows(topic, start=0, stop=None)
+        Returns the rows of a domain within a line range.
+    documents(topic, start=0, stop=None, fields=())
+        Yields the posts of a domain.
+    count(topic, start=0, stop=None, counter=None)
+        Counts the tokens of the posts of a domain.
+    '''
+
+    SUFFIX = '.corpus'
+    META_FILE = 'meta.json'
+
+    def __init__(self, path, meta):
+        '''
+        Parameters
+        ----------
+        path : str
+            Directory of the store.
+        meta : dict
+            Contents of the meta file.
+        '''
+
+        self.path = path
+        self.meta = meta
+
+        def column(name):
+            return os.path.join(path, name)
+
+        self.domains = [domain.decode('utf-8') for domain in
+                        np.load(column('domains.npy')).tolist()]
+        self._domain_index = {domain: i for i, domain in
+                              enumerate(self.domains)}
+        self.domain_rows = np.load(column('domain_rows.npy'))
+        self.domain = np.load(column('domain.npy'), mmap_mode='r')
+        self.lines = np.load(column('line.npy'), mmap_mode='r')
+        self.text = StringColumn.load(column('text'))
+        self.fields = {field: StringColumn.load(column('field.' + field))
+                       for field in meta['fields']}
+        self.token_offsets = self.token_ids = self.vocabulary = None
+        if meta['tokens']:
+            self.token_offsets = np.load(column('tokens.offsets.npy'),
+                                         mmap_mode='r')
+            self.token_ids = np.load(column('tokens.ids.npy'),
+                                     mmap_mode='r')
+            self.vocabulary = StringColumn.load(column('vocabulary'))
+
+    def __len__(self):
+        return len(self.lines)
+
+    @staticmethod
+    def _stat(file_path):
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    @classmethod
+    def convert(cls, file_path, store_path=None, tokens=True, fields=('id',),
+                domain_id='domain', text_id='selftext', chunk_size=1 << 22):
+        '''Converts a bz2 dump into a store in one pass over its lines.
+
+        The columns are first appended to temporary files in the order of
+        the dump, a few thousand rows at a time, then regrouped by domain
+        in chunks of about chunk_size values. Only the distinct domains
+        and words and a few numbers per row are held in memory, never the
+        texts or the token ids of the dump. The store is built in a
+        temporary directory renamed at the end, so an interrupted
+        conversion leaves no store.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the dataset compressed file.
+        store_path : str, optional
+            Directory of the store, the file path plus SUFFIX by default.
+        tokens : bool, optional
+            Tokenize the texts and store the token ids too.
+        fields : tuple, optional
+            Other json object key names kept.
+        domain_id : str, optional
+            Json object key name of the domain.
+        text_id : str, optional
+            Json object key name of the text.
+        chunk_size : int, optional
+            Number of bytes or token ids regrouped at a time.
+        '''
+
+        store_path = store_path or file_path + cls.SUFFIX
+        work_path = store_path + '.tmp'
+        logging.debug('Converting %s into %s.', file_path, store_path)
+        if os.path.exists(work_path):
+            shutil.rmtree(work_path)
+        os.makedirs(work_path)
+
+        def column(name):
+            return os.path.join(work_path, name)
+
+        posts = MultiDomainFilter(None, domain_id, text_id, fields)
+        codes = {}
+        vocabulary = Vocabulary()
+        rows = _Spool(column('rows'), 'q', ragged=False)
+        text = _Spool(column('text'))
+        extra = {field: _Spool(column('field.' + field))
+                 for field in fields}
+        token_ids = _Spool(column('tokens'), 'i') if tokens else None
+
+        for number, line in enumerate(open_lines(file_path, binary=True)):
+            post = posts.parse(line)
+            if post is None:
+                continue
+            value = post.get(text_id)
+            value = value if isinstance(value, str) else ''
+            # Every row adds its domain code and line number.
+            rows.append((codes.setdefault(post[domain_id], len(codes)),
+                         number))
+            text.append(value.encode('utf-8'))
+            for field, spool in extra.items():
+                spool.append(json.dumps(post.get(field)).encode('utf-8'))
+            if tokens:
+                token_ids.append(vocabulary.intern(tokenize_text(value)))
+
+        spools = [rows, text] + list(extra.values()) + \
+            ([token_ids] if tokens else [])
+        for spool in spools:
+            spool.close()
+
+        # Rows grouped by domain, in line order inside every domain.
+        pairs = rows.values().reshape(-1, 2)
+        names = sorted(codes)
+        rank = np.empty(len(codes), dtype=np.int32)
+        rank[[codes[name] for name in names]] = np.arange(len(names))
+        domain = rank[pairs[:, 0]]
+        order = np.argsort(domain, kind='stable')
+        domain = domain[order]
+        domain_rows = np.searchsorted(domain, np.arange(len(names) + 1))
+
+        np.save(column('domains.npy'),
+                np.array([name.encode('utf-8') for name in names],
+                         dtype=bytes))
+        np.save(column('domain_rows.npy'), domain_rows.astype(np.int64))
+        np.save(column('domain.npy'), domain)
+        np.save(column('line.npy'), pairs[:, 1][order])
+        del pairs
+        for name, spool in [('text', text)] + [
+                ('field.' + field, spool) for field, spool in extra.items()]:
+            _permute(*spool.columns(), order,
+                     column(name) + StringColumn.DATA_SUFFIX,
+                     column(name) + StringColumn.OFFSETS_SUFFIX, chunk_size)
+        if tokens:
+            _permute(*token_ids.columns(), order, column('tokens.ids.npy'),
+                     column('tokens.offsets.npy'), chunk_size)
+            StringColumn.save(column('vocabulary'),
+                              vocabulary.words.tolist())
+        for spool in spools:
+            spool.remove()
+
+        meta = {'source': os.path.abspath(file_path),
+                'stat': cls._stat(file_path), 'domain_id': domain_id,
+                'text_id': text_id, 'fields': list(fields),
+                'tokens': bool(tokens)}
+        with open(column(cls.META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2)
+
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+        os.replace(work_path, store_path)
+        store = cls.load(store_path)
+        logging.debug('Stored %s posts of %s domains.', len(store),
+                      len(store.domains))
+
+        return store
+
+    @classmethod
+    def load(cls, store_path):
+        '''Memory-maps a store written by convert.
+
+        Parameters
+        ----------
+        store_path : str
+            Directory of the store.
+        '''
+
+        with open(os.path.join(store_path, cls.META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+
+        return cls(store_path, meta)
+
+    @classmethod
+    def find(cls, file_path, domain_id='domain', text_id='selftext'):
+        '''Returns the store of a dump when one has been converted with
+        the same json key names, None otherwise.
+
+        The file path may be the dump, whose store is looked for next to
+        it, or the store directory itself. A store older than its dump is
+        stale and ignored.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the dataset compressed file or to a store.
+        domain_id : str, optional
+            Json object key name of the domain.
+        text_id : str, optional
+            Json object key name of the text.
+        '''
+
+        if os.path.isfile(os.path.join(file_path, cls.META_FILE)):
+            store_path = file_path
+        elif os.path.isfile(os.path.join(file_path + cls.SUFFIX,
+                                         cls.META_FILE)):
+            store_path = file_path + cls.SUFFIX
+        else:
+            return None
+
+        store = cls.load(store_path)
+        if (store.meta['domain_id'], store.meta['text_id']) != (
+                domain_id, text_id):
+            return None
+        if store_path != file_path and \
+                cls._stat(file_path) != store.meta['stat']:
+            logging.warning('Stale corpus store %s, reading %s.',
+                            store_path, file_path)
+            return None
+
+        return store
+
+    def rows(self, topic, start=0, stop=None):
+        '''Returns the (first, last) rows of the posts of a domain found
+        in the lines [start, stop) of the dump.
+
+        Parameters
+        ----------
+        topic : str
+            Domain of the posts.
+        start : int, optional
+            First line.
+        stop : int, optional
+            Line where the range stops, the end of the dump by default.
+        '''
+
+        i = self._domain_index.get(topic)
+        if i is None:
+            return 0, 0
+
+        first, last = int(self.domain_rows[i]), int(self.domain_rows[i + 1])
+        lines = self.lines[first:last]
+        if start:
+            first += int(np.searchsorted(lines, start))
+        if stop is not None:
+            last = int(self.domain_rows[i]) + \
+                int(np.searchsorted(lines, stop))
+
+        return first, max(first, last)
+
+    def documents(self, topic, start=0, stop=None, fields=()):
+        '''Yields the posts of a domain in the lines [start, stop) of the
+        dump as (line, text, metadata) tuples, in the order of the dump.
+
+        Parameters
+        ----------
+        topic : str
+            Domain of the posts.
+        start : int, optional
+            First line.
+        stop : int, optional
+            Line where the range stops.
+        fields : tuple, optional
+            Extra fields read into the metadata, they must be stored.
+        '''
+
+        missing = set(fields) - set(self.fields)
+        if missing:
+            raise ValueError(f'Fields {sorted(missing)} are not stored in '
+                             f'{self.path}')
+
+        first, last = self.rows(topic, start, stop)
+        columns = [(field, self.fields[field].slice(first, last))
+                   for field in fields]
+        for number, text in zip(self.lines[first:last].tolist(),
+                                self.text.slice(first, last)):
+            metadata = {field: json.loads(next(values))
+                        for field, values in columns}
+            yield number, text, metadata
+
+    def count(self, topic, start=0, stop=None, counter=None):
+        '''Counts the tokens of the posts of a domain in the lines
+        [start, stop) of the dump and returns the counter.
+
+        With token ids stored only those of the domain are read, the
+        counts and the order of first appearance of the words are those
+        of tokenizing the texts, which happens when no ids are stored.
+
+        Parameters
+        ----------
+        topic : str
+            Domain of the posts.
+        start : int, optional
+            First line.
+        stop : int, optional
+            Line where the range stops.
+        counter : Vocabulary or ApproximateCounter, optional
+            Counts updated in place, a new Vocabulary by default.
+        '''
+
+        recorder = get_recorder()
+        counter = Vocabulary() if counter is None else counter
+        first, last = self.rows(topic, start, stop)
+
+        with recorder.timer('corpus'):
+            if self.token_ids is None:
+                counts = Vocabulary()
+                for text in self.text.slice(first, last):
+                    counts.update(tokenize_text(text))
+                tokens = int(counts.counts.sum())
+            else:
+                ids = np.asarray(self.token_ids[self.token_offsets[first]:
+                                                self.token_offsets[last]])
+                unique, position, frequency = np.unique(
+                    ids, return_index=True, return_counts=True)
+                order = np.argsort(position, kind='stable')
+                counts = Vocabulary()
+                counts.add_counts(
+                    counts.intern([self.vocabulary[i] for i in
+                                   unique[order].tolist()]),
+                    frequency[order])
+                tokens = len(ids)
+            counter.update(counts)
+
+        recorder.count('lines_matched', last - first)
+        recorder.count('tokens', tokens)
+
+        return counter
+
+
+# Converts the dumps given in the command line.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Converts bz2 compressed dumps into columnar stores.')
+    parser.add_argument('dumps', nargs='+', help='bz2 compressed files')
+    parser.add_argument('--no-tokens', action='store_true',
+                        help='store only the texts, not their token ids')
+    parser.add_argument('--fields', nargs='*', default=['id'],
+                        help='other json fields kept')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=logging.DEBUG)
+    for file_path in args.dumps:
+        CorpusStore.convert(file_path, tokens=not args.no_tokens,
+                            fields=tuple(args.fields))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,644 @@
+''' Shared ingest routines for the Reddit dumps.
+
+This module holds the tokenizing and counting steps used by both the
+TextRank and the Root Log-Likelihood Ratio modules, together with a
+parallel mode that spreads the work of a dump over a pool of processes.
+
+The worker functions live here rather than in the analysis modules so the
+pool processes can import them without side effects.
+
+'''
+
+import logging
+import itertools
+import json
+import bz2
+import re
+import multiprocessing
+from collections import deque
+from functools import partial
+from app.bz2index import BZ2Index
+from app.vocabulary import Vocabulary
+from app.instrument import get_recorder
+from app.pipeline import Pipeline
+
+
+def word_tokenizer():
+    '''Returns nltk word_tokenize, importing nltk on first use only.
+
+    Parameters
+    ----------
+    None.
+    '''
+
+    from nltk.tokenize import word_tokenize
+    return word_tokenize
+
+
+def tokenize_text(text):
+    '''Returns the lower case alphabetic tokens of a text.
+
+    Parameters
+    ----------
+    text : str
+        Input text.
+    '''
+
+    tokens = word_tokenizer()(text)
+    tokens = [word for word in tokens if word.isalpha()]
+    return [word.lower() for word in tokens]
+
+
+def line_range(start=0, nlines=None):
+    '''Returns the (start, stop) line range of nlines lines from start.
+
+    Parameters
+    ----------
+    start : int, optional
+        First line.
+    nlines : int, optional
+        Number of lines, up to the end of the file by default.
+    '''
+
+    return start, (None if nlines is None else start + nlines)
+
+
+def open_lines(file_path, start=0, stop=None, binary=False):
+    '''Yields the raw lines [start, stop) of a bz2 dump.
+
+    When a block index has been built for the dump (see BZ2Index) only
+    the blocks holding the range are decompressed, otherwise the file is
+    decompressed from the beginning.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    start : int, optional
+        First line to read.
+    stop : int, optional
+        Line where reading stops, the end of the file by default.
+    binary : bool, optional
+        Yield undecoded bytes instead of strings.
+    '''
+
+    if BZ2Index.exists(file_path):
+        yield from BZ2Index.open(file_path).iter_lines(start, stop, binary)
+        return
+
+    with bz2.open(file_path, 'rb' if binary else 'rt') as reddit_file:
+        yield from itertools.islice(reddit_file, start, stop)
+
+
+def read_chunks(file_path, nlines=None, chunk_size=10000, start=0):
+    '''Yields lists of at most chunk_size raw lines from a bz2 dump.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    nlines : int, optional
+        Number of lines to read, all of them by default.
+    chunk_size : int, optional
+        Number of lines per chunk.
+    start : int, optional
+        First line to read.
+    '''
+
+    lines = open_lines(file_path, *line_range(start, nlines), binary=True)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def index_ranges(index, nlines=None, chunk_size=10000, start=0):
+    '''Splits a line range of an indexed dump into block aligned ranges
+    of about chunk_size lines.
+
+    Parameters
+    ----------
+    index : BZ2Index
+        Block index of the dump.
+    nlines : int, optional
+        Number of lines, up to the end of the file by default.
+    chunk_size : int, optional
+        Approximate number of lines per range.
+    start : int, optional
+        First line.
+    '''
+
+    stop = line_range(start, nlines)[1]
+    stop = index.nlines if stop is None else min(stop, index.nlines)
+    parts = max(1, -(-index.nlines // chunk_size))
+    ranges = []
+    for a, b in index.split(parts):
+        a, b = max(a, start), min(b, stop)
+        if a < b:
+            ranges.append((a, b))
+
+    return ranges
+
+
+class DomainFilter:
+    '''Selects the posts of one domain from raw json lines without a full
+    json parse of every line.
+
+    A line can only hold the domain if the json encoding of the topic
+    appears in it, which is checked with a plain substring search on the
+    undecoded bytes. Lines where a domain value is written with escape
+    sequences fall back to the parser, so no matching post is lost. The
+    lines that survive are decoded and only the domain and text fields
+    are read, the value of the domain is always verified.
+
+    Attributes
+    ----------
+    topic : str
+        Value of the domain field to keep.
+    domain_id : str
+        Json object key name of the domain.
+    text_id : str
+        Json object key name of the text.
+
+    Methods
+    -------
+    match(line)
+        Returns whether a line may hold a post of the topic.
+    read(line)
+        Returns a dict with just the wanted fields of a line.
+    parse(line)
+        Returns the fields of a post of the topic, None for other posts.
+    '''
+
+    COLON = re.compile(r'\s*:\s*')
+
+    def __init__(self, topic, domain_id='domain', text_id='selftext',
+                 fields=()):
+        '''
+        Parameters
+        ----------
+        topic : str
+            Value of the domain field to keep.
+        domain_id : str, optional
+            Json object key name of the domain.
+        text_id : str, optional
+            Json object key name of the text.
+        fields : tuple, optional
+            Other json object key names to read from the posts.
+        '''
+
+        self.topic = topic
+        self.domain_id = domain_id
+        self.text_id = text_id
+
+        # Every way an encoder may plausibly write the topic.
+        quoted = json.dumps(topic)
+        self.needles = tuple({
+            quoted.encode('utf-8'),
+            json.dumps(topic, ensure_ascii=False).encode('utf-8'),
+            quoted.replace('/', '\\/').encode('utf-8')})
+        # A domain value holding a backslash before its closing quote.
+        self.escaped = re.compile(
+            re.escape(json.dumps(domain_id).encode('utf-8')) +
+            rb'\s*:\s*"[^"\\]*\\')
+        self.tokens = {field: json.dumps(field)
+                       for field in (domain_id, text_id) + tuple(fields)}
+        self.decoder = json.JSONDecoder()
+
+    def match(self, line):
+        '''Returns whether a line may hold a post of the topic.
+
+        Parameters
+        ----------
+        line : bytes
+            Raw json line.
+        '''
+
+        for needle in self.needles:
+            if needle in line:
+                return True
+
+        # Verified fallback, any escape inside a domain value is parsed.
+        return self.escaped.search(line) is not None
+
+    def read(self, line):
+        '''Returns a dict with just the domain, text and extra fields of a
+        line.
+
+        Falls back to a full json parse when a field is missing or its key
+        appears more than once.
+
+        Parameters
+        ----------
+        line : bytes or str
+            Raw json line.
+        '''
+
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+
+        post = {}
+        for field, token in self.tokens.items():
+            pos = line.find(token)
+            if pos == -1 or line.find(token, pos + 1) != -1:
+                return json.loads(line)
+            colon = self.COLON.match(line, pos + len(token))
+            if colon is None:
+                # The name only appears as a value, not as a key.
+                return json.loads(line)
+            post[field] = self.decoder.raw_decode(line, colon.end())[0]
+
+        return post
+
+    def parse(self, line):
+        '''Returns the fields of a post of the topic, None for other posts.
+
+        Parameters
+        ----------
+        line : bytes
+            Raw json line.
+        '''
+
+        if not self.match(line):
+            return None
+
+        post = self.read(line)
+        if post.get(self.domain_id) != self.topic:
+            return None
+
+        return post
+
+
+class MultiDomainFilter(DomainFilter):
+    '''Selects the posts of a set of domains, or of every domain, from raw
+    json lines in a single pass.
+
+    The domain value is located with a regular expression on the
+    undecoded bytes and looked up in the set of topics, only the lines
+    that pass are decoded and read like DomainFilter does. Lines where
+    the domain value holds escape sequences or the domain key appears
+    more than once, as in crossposts, are always read, and the domain
+    read from the line is the one verified.
+
+    Attributes
+    ----------
+    topics : frozenset
+        Domains to keep, None keeps every domain.
+
+    Methods
+    -------
+    domain(line)
+        Returns the raw domain of a line if it may be one of the topics.
+    parse(line)
+        Returns the fields of a post of the topics, None for other posts.
+    '''
+
+    def __init__(self, topics=None, domain_id='domain', text_id='selftext',
+                 fields=()):
+        '''
+        Parameters
+        ----------
+        topics : iterable, optional
+            Domains to keep, every domain by default.
+        domain_id : str, optional
+            Json object key name of the domain.
+        text_id : str, optional
+            Json object key name of the text.
+        fields : tuple, optional
+            Other json object key names to read from the posts.
+        '''
+
+        super().__init__(None, domain_id, text_id, fields)
+        self.topics = None if topics is None else frozenset(topics)
+        self.key = json.dumps(domain_id).encode('utf-8')
+        self.value = re.compile(re.escape(self.key) +
+                                rb'\s*:\s*"([^"\\]*)"')
+
+    def domain(self, line):
+        '''Returns the domain of a line as written in it when it may be
+        one of the topics, None when it cannot be.
+
+        Parameters
+        ----------
+        line : bytes
+            Raw json line.
+        '''
+
+        found = self.value.search(line)
+        if found is not None and line.count(self.key) == 1:
+            domain = found.group(1).decode('utf-8')
+        elif found is not None or self.escaped.search(line) is not None:
+            # The value holds an escape, or the key also appears in a
+            # nested object such as a crosspost, the line is read.
+            domain = self.read(line).get(self.domain_id)
+        else:
+            return None
+
+        if not isinstance(domain, str) or (
+                self.topics is not None and domain not in self.topics):
+            return None
+
+        return domain
+
+    def match(self, line):
+        return self.domain(line) is not None
+
+    def parse(self, line):
+        '''Returns the fields of a post of one of the topics, None for
+        other posts.
+
+        Parameters
+        ----------
+        line : bytes
+            Raw json line.
+        '''
+
+        if self.domain(line) is None:
+            return None
+
+        post = self.read(line)
+        domain = post.get(self.domain_id)
+        if not isinstance(domain, str) or (
+                self.topics is not None and domain not in self.topics):
+            return None
+
+        return post
+
+
+def count_chunk(lines, topic, domain_id='domain', text_id='selftext',
+                counter=None):
+    '''Counts the tokens of the posts of a topic within a chunk of lines
+    into a Vocabulary, which is returned.
+
+    Parameters
+    ----------
+    lines : list
+        Raw json lines as bytes.
+    topic : str
+        Value of the domain field to keep.
+    domain_id : str, optional
+        Json object key name of the domain.
+    text_id : str, optional
+        Json object key name of the text.
+    counter : Vocabulary, optional
+        Vocabulary updated in place, a new one by default.
+    '''
+
+    recorder = get_recorder()
+    parse = recorder.wrap(DomainFilter(topic, domain_id, text_id).parse,
+                          'json')
+    tokenize = recorder.wrap(tokenize_text, 'nltk')
+    counter = Vocabulary() if counter is None else counter
+    matched = tokens = 0
+
+    for line in lines:
+        post = parse(line)
+        if post is not None:
+            words = tokenize(post[text_id])
+            counter.update(words)
+            matched += 1
+            tokens += len(words)
+
+    recorder.count('lines_matched', matched)
+    recorder.count('tokens', tokens)
+
+    return counter
+
+
+def count_range(file_path, start, stop, topic, domain_id='domain',
+                text_id='selftext'):
+    '''Counts the tokens of a topic within a line range of an indexed
+    dump, decompressing the range inside the worker process.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    start : int
+        First line.
+    stop : int
+        Line where counting stops.
+    topic : str
+        Value of the domain field to keep.
+    domain_id : str, optional
+        Json object key name of the domain.
+    text_id : str, optional
+        Json object key name of the text.
+    '''
+
+    return count_chunk(open_lines(file_path, start, stop, binary=True),
+                       topic, domain_id, text_id)
+
+
+class TreeReducer:
+    '''Merges a sequence of Vocabulary counts pairwise as they arrive.
+
+    Partial counts are kept on a stack tagged with their level, two
+    counters of the same level are merged into one of the next level,
+    like the carry of a binary counter. Merges therefore happen between
+    counters of similar size and at most log2(n) partial counters are
+    alive at once.
+    Merging always folds the later counter into the earlier one, so the
+    token ids of the result are the same as a serial count.
+
+    Methods
+    -------
+    push(counter)
+        Adds the next counter of the sequence.
+    result()
+        Returns the merge of every counter pushed.
+    '''
+
+    def __init__(self):
+        self._stack = []
+
+    def push(self, counter):
+        '''Adds the next counter of the sequence.
+
+        Parameters
+        ----------
+        counter : Vocabulary
+            Partial counts.
+        '''
+
+        level = 0
+        while self._stack and self._stack[-1][0] == level:
+            _, previous = self._stack.pop()
+            previous.update(counter)
+            counter = previous
+            level += 1
+        self._stack.append((level, counter))
+
+    def result(self):
+        '''Returns the merge of every counter pushed.'''
+
+        total = Vocabulary()
+        for _, counter in self._stack:
+            total.update(counter)
+
+        return total
+
+
+def parallel_count(file_path, topic, nlines=None, workers=None,
+                   chunk_size=10000, domain_id='domain', text_id='selftext',
+                   start=0, counter=None):
+    '''Counts the tokens of a topic over a dump using a process pool.
+
+    The main process decompresses the dump and hands chunks of lines to
+    the workers, which parse, tokenize and count them. When the dump has
+    a block index the workers get disjoint block aligned line ranges and
+    decompress them themselves instead. At most two tasks per worker are
+    in flight, so memory does not grow with the dump size. The per-task
+    counters are merged in order with a TreeReducer and the result holds
+    exactly the same counts as the serial path. A given Vocabulary is
+    updated with that result, while a bounded memory counter gets the
+    per-task counts folded into it in order instead, so it never holds
+    more than a task worth of exact counts.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    topic : str
+        Value of the domain field to keep.
+    nlines : int, optional
+        Number of lines to parse, all of them by default.
+    workers : int, optional
+        Number of worker processes, the number of CPUs by default.
+    chunk_size : int, optional
+        Number of lines per task.
+    domain_id : str, optional
+        Json object key name of the domain.
+    text_id : str, optional
+        Json object key name of the text.
+    start : int, optional
+        First line to parse.
+    counter : Vocabulary or ApproximateCounter, optional
+        Counts updated with the result, or with every task result for
+        an ApproximateCounter, and returned.
+    '''
+
+    workers = workers or multiprocessing.cpu_count()
+    logging.debug('Counting %s with %s workers and chunks of %s lines.',
+                  file_path, workers, chunk_size)
+
+    if BZ2Index.exists(file_path):
+        task = partial(count_range, file_path, topic=topic,
+                       domain_id=domain_id, text_id=text_id)
+        tasks = index_ranges(BZ2Index.open(file_path), nlines, chunk_size,
+                             start)
+    else:
+        task = partial(count_chunk, topic=topic, domain_id=domain_id,
+                       text_id=text_id)
+        tasks = ((chunk,) for chunk in read_chunks(file_path, nlines,
+                                                   chunk_size, start))
+    reducer = TreeReducer()
+    approximate = counter is not None and not isinstance(counter,
+                                                         Vocabulary)
+    push = counter.update if approximate else reducer.push
+    pending = deque()
+
+    with multiprocessing.Pool(workers) as pool:
+        for args in tasks:
+            pending.append(pool.apply_async(task, args))
+            if len(pending) >= 2 * workers:
+                push(pending.popleft().get())
+
+        while pending:
+            push(pending.popleft().get())
+
+    if counter is None:
+        return reducer.result()
+    if not approximate:
+        counter.update(reducer.result())
+
+    return counter
+
+
+def tokenize_chunk(lines, topic, domain_id='domain', text_id='selftext'):
+    '''Returns the tokens of every post of a topic within a chunk of
+    lines, as a list of token lists.
+
+    Parameters
+    ----------
+    lines : list
+        Raw json lines as bytes.
+    topic : str
+        Value of the domain field to keep.
+    domain_id : str, optional
+        Json object key name of the domain.
+    text_id : str, optional
+        Json object key name of the text.
+    '''
+
+    parse = DomainFilter(topic, domain_id, text_id).parse
+    return [tokenize_text(post[text_id])
+            for post in map(parse, lines) if post is not None]
+
+
+def pipelined_count(file_path, topic, nlines=None, workers=2,
+                    chunk_size=2000, queue_size=4, processes=False,
+                    domain_id='domain', text_id='selftext', start=0,
+                    counter=None):
+    '''Counts the tokens of a topic over a dump with decompression,
+    parsing and tokenizing, and counting running as overlapping stages.
+
+    A reader thread decompresses chunks of lines into a bounded queue,
+    workers parse and tokenize them and the calling thread counts the
+    tokens in the order of the lines, so the result holds exactly the
+    same counts and ids as the serial path. Memory is bounded by the
+    queue sizes. Worker threads share the GIL with the rest of the
+    pipeline, worker processes tokenize in parallel. The figures of
+    every stage are recorded as the pipeline value of the current
+    recorder.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    topic : str
+        Value of the domain field to keep.
+    nlines : int, optional
+        Number of lines to parse, all of them by default.
+    workers : int, optional
+        Number of parsing and tokenizing workers.
+    chunk_size : int, optional
+        Number of lines per queue item.
+    queue_size : int, optional
+        Capacity of each queue, in chunks.
+    processes : bool, optional
+        Run the workers in processes instead of threads.
+    domain_id : str, optional
+        Json object key name of the domain.
+    text_id : str, optional
+        Json object key name of the text.
+    start : int, optional
+        First line to parse.
+    counter : Vocabulary or ApproximateCounter, optional
+        Counts updated in place, a new Vocabulary by default.
+    '''
+
+    recorder = get_recorder()
+    counter = Vocabulary() if counter is None else counter
+    pipeline = Pipeline(workers, queue_size, processes)
+    matched = tokens = 0
+
+    def consume(chunk):
+        nonlocal matched, tokens
+        for words in chunk:
+            counter.update(words)
+            tokens += len(words)
+        matched += len(chunk)
+
+    pipeline.run(read_chunks(file_path, nlines, chunk_size, start),
+                 partial(tokenize_chunk, topic=topic, domain_id=domain_id,
+                         text_id=text_id),
+                 consume)
+
+    pipeline.log()
+    recorder.count('lines_matched', matched)
+    recorder.count('tokens', tokens)
+    recorder.set('pipeline', pipeline.report())
+
+    return counter
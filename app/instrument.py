@@ -0,0 +1,311 @@
+''' Timers and counters for the analysis pipelines.
+
+Code that wants to be measured asks for the current recorder with
+get_recorder and reports through it: stage and category timers, event
+counters and plain values. Outside a recording block the recorder is a
+NullRecorder whose methods do nothing and whose wrappers return the
+wrapped objects unchanged, so library use pays nothing. A recording
+block installs a Recorder, which adds the peak resident set size and
+writes everything as a json report.
+
+Timer categories used across the modules:
+
+- bz2: decompressing and splitting the dump into lines.
+- json: filtering and parsing the post lines.
+- nltk: sentence splitting and word tokenization.
+- numpy: array and matrix work, counting, graph build and solvers.
+
+Work done in worker processes of parallel_count is only seen as the
+time of the stage that waits for it.
+
+'''
+
+import sys
+import json
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the report then has no peak RSS.
+    resource = None
+
+
+def peak_rss():
+    '''Returns the peak resident set size of this process and of its
+    finished children in bytes, None values when it is not available.
+
+    Parameters
+    ----------
+    None.
+    '''
+
+    if resource is None:
+        return None, None
+
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return own * scale, children * scale
+
+
+class _NullTimer:
+    # Shared do-nothing context manager.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullRecorder:
+    '''
+    Recorder that records nothing, active outside recording blocks.
+
+    Methods
+    -------
+    stage(name)
+        Context manager timing a pipeline stage.
+    timer(name)
+        Context manager adding its time to a category.
+    timed(iterable, name, counter=None)
+        Wraps an iterable, timing and counting the items pulled.
+    wrap(function, name)
+        Wraps a function, timing its calls.
+    count(name, n=1)
+        Increments a counter.
+    set(name, value)
+        Records a value.
+    '''
+
+    _NULL_TIMER = _NullTimer()
+
+    def stage(self, name):
+        return self._NULL_TIMER
+
+    def timer(self, name):
+        return self._NULL_TIMER
+
+    def timed(self, iterable, name, counter=None):
+        return iterable
+
+    def wrap(self, function, name):
+        return function
+
+    def count(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+
+class Recorder(NullRecorder):
+    '''
+    Accumulates timers, counters and values of one run.
+
+    Attributes
+    ----------
+    name : str
+        Name of the run.
+    stages : OrderedDict
+        Seconds spent in every pipeline stage.
+    timers : OrderedDict
+        Seconds spent in every timer category.
+    counters : OrderedDict
+        Event counts.
+    values : OrderedDict
+        Other recorded values.
+
+    Methods
+    -------
+    report()
+        Returns the recorded data as a dict.
+    write(path)
+        Writes the report as json.
+    log()
+        Logs a summary of the report.
+    '''
+
+    def __init__(self, name):
+        '''
+        Parameters
+        ----------
+        name : str
+            Name of the run.
+        '''
+
+        self.name = name
+        self.stages = OrderedDict()
+        self.timers = OrderedDict()
+        self.counters = OrderedDict()
+        self.values = OrderedDict()
+        self.started = time.time()
+        self._clock = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + \
+                time.perf_counter() - start
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        '''Adds seconds to a timer category.
+
+        Parameters
+        ----------
+        name : str
+            Timer category.
+        seconds : float
+            Time to add.
+        '''
+
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def timed(self, iterable, name, counter=None):
+        '''Yields the items of an iterable, adding the time spent getting
+        each of them to a timer and their number to a counter.
+
+        Parameters
+        ----------
+        iterable : iterable
+            Wrapped iterable.
+        name : str
+            Timer category.
+        counter : str, optional
+            Counter incremented per item.
+        '''
+
+        clock = time.perf_counter
+        iterator = iter(iterable)
+        elapsed = 0.0
+        items = 0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += clock() - start
+                    return
+                elapsed += clock() - start
+                items += 1
+                yield item
+        finally:
+            self.add_time(name, elapsed)
+            if counter:
+                self.count(counter, items)
+
+    def wrap(self, function, name):
+        '''Returns a function that calls function and adds the time of
+        every call to a timer.
+
+        Parameters
+        ----------
+        function : callable
+            Wrapped function.
+        name : str
+            Timer category.
+        '''
+
+        clock = time.perf_counter
+        timers = self.timers
+
+        def timed_function(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timers[name] = timers.get(name, 0.0) + clock() - start
+
+        return timed_function
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def report(self):
+        '''Returns the recorded data as a json serializable dict.'''
+
+        rss, children_rss = peak_rss()
+
+        return OrderedDict([
+            ('name', self.name),
+            ('started', time.strftime('%Y-%m-%dT%H:%M:%S%z',
+                                      time.localtime(self.started))),
+            ('wall_seconds', time.perf_counter() - self._clock),
+            ('peak_rss_bytes', rss),
+            ('peak_rss_children_bytes', children_rss),
+            ('stages', self.stages),
+            ('timers', self.timers),
+            ('counters', self.counters),
+            ('values', self.values)])
+
+    def write(self, path):
+        '''Writes the report as a json file.
+
+        Parameters
+        ----------
+        path : str
+            Output file.
+        '''
+
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+
+    def log(self):
+        '''Logs the stages, timers and counters of the report.'''
+
+        for group in ('stages', 'timers'):
+            for name, seconds in getattr(self, group).items():
+                logging.info('%s %s: %.3f s', self.name, name, seconds)
+        for name, value in list(self.counters.items()) + \
+                list(self.values.items()):
+            logging.info('%s %s: %s', self.name, name, value)
+
+
+_recorder = NullRecorder()
+
+
+def get_recorder():
+    '''Returns the recorder of the current recording block, a
+    NullRecorder outside of them.'''
+
+    return _recorder
+
+
+@contextmanager
+def recording(name):
+    '''Context manager installing a new Recorder for its block.
+
+    Parameters
+    ----------
+    name : str
+        Name of the run.
+    '''
+
+    global _recorder
+    previous = _recorder
+    _recorder = Recorder(name)
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
@@ -0,0 +1,272 @@
+''' Word lists for dictionary filtering.
+
+A lexicon answers whether a token is a known word. The NLTK words corpus
+is read once and cached as a sorted numpy array of UTF-8 strings, later
+runs load the cache instead of the corpus. Lexicons are held in memory as
+a frozenset, very large ones can be memory-mapped from the same file
+format and searched with binary searches. Domain word lists, one word per
+line, can be merged with any of them.
+
+'''
+
+import os
+import logging
+import numpy as np
+from app.vocabulary import lookup_sorted
+
+
+def save_words(words, path):
+    '''Saves a collection of words as a sorted array of UTF-8 strings.
+
+    Parameters
+    ----------
+    words : iterable
+        Words to save.
+    path : str
+        Output .npy file.
+    '''
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    array = np.array(sorted(word.encode('utf-8') for word in set(words)),
+                     dtype=bytes)
+    np.save(path, array)
+
+
+def read_word_list(path):
+    '''Yields the words of a text file, one per line, skipping blank
+    lines and lines starting with #.
+
+    Parameters
+    ----------
+    path : str
+        Input text file.
+    '''
+
+    with open(path, 'r', encoding='utf8') as f:
+        for line in f:
+            word = line.strip()
+            if word and not word.startswith('#'):
+                yield word
+
+
+class Lexicon:
+    '''
+    In memory word list with constant time membership checks.
+
+    Attributes
+    ----------
+    words : frozenset
+        The words of the lexicon.
+
+    Methods
+    -------
+    from_nltk(cache_path=CACHE_PATH)
+        Returns the NLTK words corpus, cached across runs.
+    from_file(path)
+        Returns the lexicon of a word list or a saved lexicon.
+    union(*others)
+        Returns a lexicon with the words of several ones.
+    filter_sentence(sentence)
+        Keeps the words of a sentence found in the lexicon.
+    filter_sentences(sentences)
+        Filters a batch of sentences.
+    '''
+
+    CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                              'informationretrieval', 'nltk_words.npy')
+
+    def __init__(self, words=()):
+        '''
+        Parameters
+        ----------
+        words : iterable, optional
+            The words of the lexicon.
+        '''
+
+        self.words = frozenset(words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def from_nltk(cls, cache_path=CACHE_PATH):
+        '''Returns the NLTK words corpus as a lexicon.
+
+        The corpus is read only when the cache file does not exist yet.
+
+        Parameters
+        ----------
+        cache_path : str, optional
+            Cache file, None disables the cache.
+        '''
+
+        if cache_path and os.path.exists(cache_path):
+            return cls.load(cache_path)
+
+        logging.debug('Loading the NLTK words corpus.')
+        from nltk.corpus import words
+        lexicon = cls(words.words())
+        if cache_path:
+            lexicon.save(cache_path)
+
+        return lexicon
+
+    @classmethod
+    def from_file(cls, path):
+        '''Returns the lexicon stored in a file.
+
+        Parameters
+        ----------
+        path : str
+            A .npy file written by save, or a text file with one word
+            per line.
+        '''
+
+        if path.endswith('.npy'):
+            return cls.load(path)
+
+        return cls(read_word_list(path))
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a lexicon written by save.
+
+        Parameters
+        ----------
+        path : str
+            Input .npy file.
+        '''
+
+        return cls(word.decode('utf-8') for word in np.load(path))
+
+    def save(self, path):
+        '''Saves the lexicon as a sorted array of UTF-8 strings.
+
+        Parameters
+        ----------
+        path : str
+            Output .npy file.
+        '''
+
+        save_words(self.words, path)
+
+    def union(self, *others):
+        '''Returns a lexicon with the words of this and other lexicons.
+
+        Parameters
+        ----------
+        others : Lexicon or iterable
+            Lexicons or collections of words to merge.
+        '''
+
+        words = set(self.words)
+        for other in others:
+            words.update(other.words if isinstance(other, Lexicon)
+                         else other)
+
+        return Lexicon(words)
+
+    def filter_sentence(self, sentence):
+        '''Returns the words of a sentence found in the lexicon.
+
+        Parameters
+        ----------
+        sentence : list
+            Tokenized sentence.
+        '''
+
+        known = self.words
+        return [word for word in sentence if word in known]
+
+    def filter_sentences(self, sentences):
+        '''Returns the sentences keeping only the words in the lexicon.
+
+        Parameters
+        ----------
+        sentences : list
+            Tokenized sentences.
+        '''
+
+        return [self.filter_sentence(sentence) for sentence in sentences]
+
+
+class MappedLexicon:
+    '''
+    Memory-mapped word list for lexicons too large to hold as a set.
+
+    Uses the file format of Lexicon.save, membership is a binary search
+    and batches of sentences are filtered with a single vectorized one.
+
+    Attributes
+    ----------
+    words : array
+        Sorted UTF-8 words.
+
+    Methods
+    -------
+    filter_sentence(sentence)
+        Keeps the words of a sentence found in the lexicon.
+    filter_sentences(sentences)
+        Filters a batch of sentences.
+    '''
+
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path : str
+            A .npy file written by Lexicon.save or save_words.
+        '''
+
+        self.words = np.load(path, mmap_mode='r')
+
+    def __contains__(self, word):
+        return bool(self.lookup([word])[0])
+
+    def __len__(self):
+        return len(self.words)
+
+    def lookup(self, words):
+        '''Returns a boolean mask of the words found in the lexicon.
+
+        Parameters
+        ----------
+        words : list
+            Words to look up.
+        '''
+
+        keys = [word.encode('utf-8') for word in words]
+        return lookup_sorted(keys, self.words)[1]
+
+    def filter_sentence(self, sentence):
+        '''Returns the words of a sentence found in the lexicon.
+
+        Parameters
+        ----------
+        sentence : list
+            Tokenized sentence.
+        '''
+
+        return self.filter_sentences([sentence])[0]
+
+    def filter_sentences(self, sentences):
+        '''Returns the sentences keeping only the words in the lexicon.
+
+        Parameters
+        ----------
+        sentences : list
+            Tokenized sentences.
+        '''
+
+        sentences = list(sentences)
+        found = iter(self.lookup([word for sentence in sentences
+                                  for word in sentence]).tolist())
+
+        return [[word for word in sentence if next(found)]
+                for sentence in sentences]
@@ -0,0 +1,589 @@
+''' Map-reduce over many monthly Reddit dumps with mergeable partials.
+
+Every dump is reduced once to a PartialResult holding, for every topic,
+the token counts used by the log-likelihood ratio and the vocabulary and
+co-occurrence pair counts of its TextRank graph. Partials are saved as a
+single compressed npz file each, with the arrays of all the topics
+concatenated and an offset table per topic, and the names of the dumps
+they cover.
+
+Merging two partials sums their counts, so it is associative and any set
+of months, built in parallel, on other machines or re-built one at a
+time, combines into the partial of a date range without reading the raw
+dumps again. A dump is never counted twice, merging partials that share
+a source raises a ValueError.
+
+Usage::
+
+    ir-partials build RS_2017-*.bz2 --output-dir partials --workers 4
+    ir-partials merge partials/*.npz --since 2017-03 --until 2017-08 \\
+        --output spring.npz
+    ir-partials rank spring.npz --common-store count_1w --output-dir out
+
+'''
+
+import os
+import re
+import json
+import hashlib
+import argparse
+import logging
+import multiprocessing
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+
+from app.vocabulary import Vocabulary
+from app.instrument import recording
+
+# Year and month in the names of the Reddit dumps, as RS_2017-10.bz2.
+MONTH_RE = re.compile(r'(\d{4})-(\d{2})')
+
+
+def dump_month(path):
+    '''Returns the 'YYYY-MM' month in the name of a dump or partial,
+    None when the name holds no month.
+
+    Parameters
+    ----------
+    path : str
+        File path.
+    '''
+
+    found = MONTH_RE.search(os.path.basename(path))
+    return None if found is None else '-'.join(found.groups())
+
+
+def select_months(paths, since=None, until=None):
+    '''Returns the paths whose month lies in [since, until], sorted by
+    month. Paths without a month are only kept without bounds.
+
+    Parameters
+    ----------
+    paths : iterable
+        Dump or partial paths.
+    since : str, optional
+        First month, as 'YYYY-MM'.
+    until : str, optional
+        Last month, as 'YYYY-MM'.
+    '''
+
+    selected = []
+    for path in paths:
+        month = dump_month(path)
+        if since is None and until is None:
+            selected.append((month or '', path))
+        elif month is not None and (since is None or month >= since) and \
+                (until is None or month <= until):
+            selected.append((month, path))
+
+    return [path for _, path in sorted(selected)]
+
+
+def _pack_words(words):
+    # UTF-8 fixed width array, tokens never end with a NUL byte.
+    return np.array([word.encode('utf-8') for word in words], dtype=bytes)
+
+
+def _unpack_words(array):
+    return [word.decode('utf-8') for word in array.tolist()]
+
+
+class PartialResult:
+    '''
+    Token counts and TextRank graphs per topic of one or more dumps.
+
+    Attributes
+    ----------
+    sources : list
+        Base names of the dumps counted, in merge order.
+    window_size : int
+        Word window of the co-occurrence pairs.
+    counts : OrderedDict
+        Vocabulary of the tokens of every topic.
+    graphs : OrderedDict
+        TextRank of every topic, with its words and pairs counted.
+    parameters : dict
+        Topics, nlines, max_bytes and window_size the partial was built
+        with, None when unknown or mixed by a merge.
+
+    Methods
+    -------
+    build(file_path, topics=None, nlines=None, max_bytes=None)
+        Reduces a dump to its partial.
+    merge(other)
+        Adds the counts of another partial.
+    save(path)
+        Writes the partial as a compressed npz file.
+    load(path)
+        Reads a partial written by save.
+    read_parameters(path)
+        Returns the build parameters of a saved partial.
+    topics()
+        Returns the topics, in order of first appearance.
+    '''
+
+    def __init__(self, sources=(), window_size=4):
+        '''
+        Parameters
+        ----------
+        sources : iterable, optional
+            Base names of the dumps counted.
+        window_size : int, optional
+            Word window of the co-occurrence pairs.
+        '''
+
+        self.sources = list(sources)
+        self.window_size = window_size
+        self.counts = OrderedDict()
+        self.graphs = OrderedDict()
+        self.parameters = None
+
+    @staticmethod
+    def build_parameters(topics=None, nlines=None, max_bytes=None,
+                         window_size=4):
+        '''Returns the parameters of a build as a json serializable dict.
+
+        Parameters
+        ----------
+        topics : iterable, optional
+            Domains to count, every domain by default.
+        nlines : int, optional
+            Number of lines to parse, all of them by default.
+        max_bytes : int, optional
+            Per domain cap of the UTF-8 size of the texts.
+        window_size : int, optional
+            Word window of the co-occurrence pairs.
+        '''
+
+        return {'topics': None if topics is None else sorted(set(topics)),
+                'nlines': nlines, 'max_bytes': max_bytes,
+                'window_size': window_size}
+
+    def _graph(self):
+        from app.textrank import TextRank
+
+        text_rank = TextRank([])
+        text_rank.window_size = self.window_size
+        text_rank.get_vocabulary()
+        return text_rank
+
+    @classmethod
+    def build(cls, file_path, topics=None, nlines=None, max_bytes=None,
+              window_size=4):
+        '''Reads a dump once and returns the partial of its topics.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to the dataset compressed file.
+        topics : iterable, optional
+            Domains to count, every domain by default.
+        nlines : int, optional
+            Number of lines to parse, all of them by default.
+        max_bytes : int, optional
+            Per domain cap of the UTF-8 size of the texts.
+        window_size : int, optional
+            Word window of the co-occurrence pairs.
+        '''
+
+        from app.topics import TopicAggregator
+
+        result = cls([os.path.basename(file_path)], window_size)
+        result.parameters = cls.build_parameters(topics, nlines, max_bytes,
+                                                 window_size)
+        with TopicAggregator(file_path, topics,
+                             max_bytes=max_bytes) as aggregator:
+            aggregator.run(nlines)
+            for topic in aggregator.topic_names():
+                result.counts[topic] = aggregator.counts[topic]
+                graph = result._graph()
+                graph.add_sentences(aggregator.sentences(topic))
+                result.graphs[topic] = graph
+
+        return result
+
+    def topics(self):
+        '''Returns the topics, in order of first appearance.'''
+
+        return list(OrderedDict.fromkeys(list(self.counts) +
+                                         list(self.graphs)))
+
+    def merge(self, other):
+        '''Adds the sources, token counts and pair counts of another
+        partial. Returns this partial.
+
+        Parameters
+        ----------
+        other : PartialResult
+            Partial of other dumps, with the same window size.
+        '''
+
+        if other.window_size != self.window_size:
+            raise ValueError(f'Cannot merge a window size of '
+                             f'{other.window_size} into {self.window_size}')
+        shared = set(self.sources) & set(other.sources)
+        if shared:
+            raise ValueError(f'Sources counted twice: {sorted(shared)}')
+
+        self.sources.extend(other.sources)
+        if other.parameters != self.parameters:
+            self.parameters = None
+        for topic, counts in other.counts.items():
+            self.counts.setdefault(topic, Vocabulary()).merge(counts)
+        for topic, graph in other.graphs.items():
+            if topic not in self.graphs:
+                self.graphs[topic] = self._graph()
+            self.graphs[topic].merge(graph)
+
+        return self
+
+    def save(self, path):
+        '''Writes the partial as a single compressed npz file.
+
+        The words, counts and pair arrays of all the topics are
+        concatenated, the offsets arrays give the slice of every topic.
+        The file is written next to path and renamed, so an interrupted
+        job never leaves a truncated partial behind.
+
+        Parameters
+        ----------
+        path : str
+            Output file.
+        '''
+
+        from app.textrank import TokenPairCounter
+
+        topics = self.topics()
+        arrays = {'words': [], 'counts': [], 'graph_words': [],
+                  'frequencies': [], 'keys': [], 'pair_counts': []}
+        word_offsets = np.zeros((len(topics) + 1, 2), dtype=np.int64)
+        key_offsets = np.zeros(len(topics) + 1, dtype=np.int64)
+
+        for k, topic in enumerate(topics):
+            counts = self.counts.get(topic, Vocabulary())
+            graph = self.graphs.get(topic)
+            vocab = graph.vocab if graph is not None else Vocabulary()
+            pairs = graph.pairs if graph is not None else TokenPairCounter()
+            pairs.compact()
+
+            arrays['words'].extend(counts.words.tolist())
+            arrays['counts'].append(counts.counts)
+            arrays['graph_words'].extend(vocab.words.tolist())
+            arrays['frequencies'].append(vocab.counts)
+            arrays['keys'].append(pairs.keys)
+            arrays['pair_counts'].append(pairs.counts)
+            word_offsets[k + 1] = word_offsets[k] + [len(counts),
+                                                     len(vocab)]
+            key_offsets[k + 1] = key_offsets[k] + len(pairs.keys)
+
+        empty = np.empty(0, dtype=np.int64)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez_compressed(
+                f, topics=_pack_words(topics),
+                sources=_pack_words(self.sources),
+                window_size=np.array([self.window_size]),
+                parameters=np.array(json.dumps(self.parameters)),
+                word_offsets=word_offsets, key_offsets=key_offsets,
+                words=_pack_words(arrays['words']),
+                graph_words=_pack_words(arrays['graph_words']),
+                **{name: np.concatenate(arrays[name] + [empty])
+                   for name in ('counts', 'frequencies', 'keys',
+                                'pair_counts')})
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        '''Reads a partial written by save.
+
+        Parameters
+        ----------
+        path : str
+            Input file.
+        '''
+
+        from app.textrank import TokenPairCounter
+
+        with np.load(path) as stored:
+            result = cls(_unpack_words(stored['sources']),
+                         int(stored['window_size'][0]))
+            result.parameters = cls._stored_parameters(stored)
+            word_offsets = stored['word_offsets']
+            key_offsets = stored['key_offsets']
+            words = _unpack_words(stored['words'])
+            graph_words = _unpack_words(stored['graph_words'])
+            counts = stored['counts']
+            frequencies = stored['frequencies']
+            keys = stored['keys']
+            pair_counts = stored['pair_counts']
+
+            for k, topic in enumerate(_unpack_words(stored['topics'])):
+                (a, c), (b, d) = word_offsets[k], word_offsets[k + 1]
+                vocabulary = Vocabulary()
+                vocabulary.add_counts(vocabulary.intern(words[a:b]),
+                                      counts[a:b])
+                result.counts[topic] = vocabulary
+
+                graph = result._graph()
+                graph.vocab.add_counts(graph.vocab.intern(graph_words[c:d]),
+                                       frequencies[c:d])
+                graph.pairs = TokenPairCounter()
+                e, f = key_offsets[k], key_offsets[k + 1]
+                graph.pairs.keys = keys[e:f].copy()
+                graph.pairs.counts = pair_counts[e:f].copy()
+                result.graphs[topic] = graph
+
+        return result
+
+    @staticmethod
+    def _stored_parameters(stored):
+        if 'parameters' not in stored.files:
+            return None
+        return json.loads(str(stored['parameters']))
+
+    @classmethod
+    def read_parameters(cls, path):
+        '''Returns the build parameters of a saved partial, without
+        reading its counts.
+
+        Parameters
+        ----------
+        path : str
+            Input file.
+        '''
+
+        with np.load(path) as stored:
+            return cls._stored_parameters(stored)
+
+
+def partial_path(file_path, output_dir):
+    '''Returns the path of the partial of a dump in output_dir.
+
+    The name holds the name of the dump and a short hash of its absolute
+    path, so dumps of the same name in other directories never share a
+    partial.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    output_dir : str
+        Directory of the partials.
+    '''
+
+    stem = os.path.basename(file_path)
+    for extension in ('.bz2', '.json'):
+        if stem.endswith(extension):
+            stem = stem[:-len(extension)]
+    digest = hashlib.sha1(
+        os.path.abspath(file_path).encode('utf-8')).hexdigest()[:8]
+
+    return os.path.join(output_dir, f'{stem}.{digest}.partial.npz')
+
+
+def build_partial(file_path, output_dir, topics=None, nlines=None,
+                  max_bytes=None, window_size=4, force=False):
+    '''Builds and saves the partial of a dump, unless it already exists
+    with the same parameters. Returns the path of the partial.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    output_dir : str
+        Directory of the partials.
+    topics : iterable, optional
+        Domains to count, every domain by default.
+    nlines : int, optional
+        Number of lines to parse, all of them by default.
+    max_bytes : int, optional
+        Per domain cap of the UTF-8 size of the texts.
+    window_size : int, optional
+        Word window of the co-occurrence pairs.
+    force : bool, optional
+        Rebuild an existing partial.
+    '''
+
+    path = partial_path(file_path, output_dir)
+    if os.path.exists(path) and not force:
+        if PartialResult.read_parameters(path) == \
+                PartialResult.build_parameters(topics, nlines, max_bytes,
+                                               window_size):
+            logging.info('Keeping the partial %s.', path)
+            return path
+        logging.info('The partial %s was built with other parameters.',
+                     path)
+
+    logging.info('Building the partial of %s.', file_path)
+    PartialResult.build(file_path, topics, nlines, max_bytes,
+                        window_size).save(path)
+
+    return path
+
+
+def build_partials(file_paths, output_dir, topics=None, workers=1,
+                   nlines=None, max_bytes=None, window_size=4, force=False):
+    '''Builds the partials of many dumps, one dump per worker process.
+    Returns the paths of the partials in the order of the dumps.
+
+    Parameters
+    ----------
+    file_paths : list
+        Paths to the dataset compressed files.
+    output_dir : str
+        Directory of the partials.
+    topics : iterable, optional
+        Domains to count, every domain by default.
+    workers : int, optional
+        Number of worker processes, 1 builds in the current process.
+    nlines : int, optional
+        Number of lines to parse per dump, all of them by default.
+    max_bytes : int, optional
+        Per domain cap of the UTF-8 size of the texts.
+    window_size : int, optional
+        Word window of the co-occurrence pairs.
+    force : bool, optional
+        Rebuild existing partials.
+    '''
+
+    os.makedirs(output_dir, exist_ok=True)
+    task = partial(build_partial, output_dir=output_dir,
+                   topics=None if topics is None else list(topics),
+                   nlines=nlines, max_bytes=max_bytes,
+                   window_size=window_size, force=force)
+
+    if workers > 1 and len(file_paths) > 1:
+        with multiprocessing.Pool(min(workers, len(file_paths))) as pool:
+            return pool.map(task, file_paths, chunksize=1)
+
+    return [task(file_path) for file_path in file_paths]
+
+
+def merge_partials(paths):
+    '''Loads and merges partials in the given order. Returns the merged
+    PartialResult.
+
+    Consecutive pairs are merged first, like TreeReducer does, so merges
+    happen between partials of similar size.
+
+    Parameters
+    ----------
+    paths : list
+        Partial files.
+    '''
+
+    stack = []
+    for path in paths:
+        level, merged = 0, PartialResult.load(path)
+        while stack and stack[-1][0] == level:
+            merged = stack.pop()[1].merge(merged)
+            level += 1
+        stack.append((level, merged))
+
+    if not stack:
+        return PartialResult()
+    result = stack.pop(0)[1]
+    for _, merged in stack:
+        result.merge(merged)
+
+    return result
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Reduces monthly Reddit dumps to mergeable partial '
+                    'counts and ranks the topics of any range of months.')
+    parser.add_argument('--log-level', default='INFO')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build the partial of every '
+                                              'dump')
+    build.add_argument('inputs', nargs='+', help='bz2 compressed dumps')
+    build.add_argument('--output-dir', default='partials')
+    build.add_argument('--topics', nargs='+',
+                       help='domains of the posts, every domain when '
+                            'missing')
+    build.add_argument('--workers', type=int, default=1,
+                       help='dumps built in parallel')
+    build.add_argument('--nlines', type=int, default=0,
+                       help='number of lines read per dump, 0 for all')
+    build.add_argument('--max-bytes', type=int,
+                       help='cap of the text size taken per domain')
+    build.add_argument('--window-size', type=int, default=4)
+    build.add_argument('--force', action='store_true',
+                       help='rebuild existing partials')
+
+    merge = commands.add_parser('merge', help='merge partials into one')
+    merge.add_argument('partials', nargs='+')
+    merge.add_argument('--since', help='first month, as YYYY-MM')
+    merge.add_argument('--until', help='last month, as YYYY-MM')
+    merge.add_argument('--output', required=True)
+
+    rank = commands.add_parser('rank', help='rank the topics of partials')
+    rank.add_argument('partials', nargs='+')
+    rank.add_argument('--since', help='first month, as YYYY-MM')
+    rank.add_argument('--until', help='last month, as YYYY-MM')
+    rank.add_argument('--topics', nargs='+',
+                      help='domains to rank, every domain when missing')
+    rank.add_argument('--keywords', type=int, default=50,
+                      help='number of TextRank keywords written')
+    rank.add_argument('--number', type=int, default=50,
+                      help='words taken from each end of the scores')
+    rank.add_argument('--common-store',
+                      help='path prefix of a reference FrequencyTable, '
+                           'filled from the url when missing')
+    rank.add_argument('--no-llr', action='store_true',
+                      help='skip the log-likelihood ratio')
+    rank.add_argument('--output-dir', default='.')
+    rank.add_argument('--report', help='json run report, in the output '
+                                       'directory by default')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=args.log_level)
+
+    if args.command == 'build':
+        build_partials(args.inputs, args.output_dir, args.topics,
+                       args.workers, args.nlines or None, args.max_bytes,
+                       args.window_size, args.force)
+        return
+
+    paths = select_months(args.partials, args.since, args.until)
+    logging.info('Merging %s partials.', len(paths))
+    if args.command == 'merge':
+        merge_partials(paths).save(args.output)
+        return
+
+    from app.topics import rank_topic, topic_file_name
+    from app.rootloglikelihood import CommonWord
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with recording('partials') as recorder:
+        with recorder.stage('merge'):
+            merged = merge_partials(paths)
+        common_dataset = None
+        if not args.no_llr:
+            with recorder.stage('common_counts'):
+                common_dataset = CommonWord(args.common_store).getwords()
+
+        for topic in args.topics or merged.topics():
+            graph = merged.graphs.get(topic)
+            if graph is None or not len(graph.vocab):
+                continue
+            logging.info('Ranking %s.', topic)
+            rank_topic(os.path.join(args.output_dir, topic_file_name(topic)),
+                       graph, merged.counts.get(topic), common_dataset,
+                       args.keywords, args.number)
+        recorder.set('sources', merged.sources)
+
+    # Run report for the dashboards.
+    recorder.log()
+    recorder.write(args.report or os.path.join(args.output_dir,
+                                               'partials_report.json'))
+
+
+# Entry point.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+''' Staged producer/consumer pipeline with bounded queues.
+
+A Pipeline runs three stages concurrently: a reader thread pulls items
+from a source, such as batches of lines being decompressed, a pool of
+worker threads transforms them and the calling thread consumes the
+results in source order. Stages talk through bounded queues, so a slow
+stage blocks the ones before it instead of letting items pile up, and
+memory stays bounded by the queue sizes. The reader also waits while
+too many items are in flight, so results held back for the ones a slow
+worker is still processing stay bounded too.
+
+Threads only run Python code one at a time, but bz2 decompression and
+file reads release the GIL, so the reader overlaps with the workers and
+the consumer. Pure Python work in the workers does not get faster with
+more threads, with processes enabled every worker thread hands its items
+to a process of a pool instead and waits for the result without holding
+the GIL.
+
+Every stage reports its busy time, the time it was blocked on a full
+output queue or an empty input queue, and the depth of its input queue:
+a stage whose input queue is full is the one limiting the run.
+
+'''
+
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from collections import OrderedDict
+
+# Marks the end of the items of a queue.
+_DONE = object()
+
+
+class StageStats:
+    '''
+    Timers and queue depth samples of a pipeline stage.
+
+    Attributes
+    ----------
+    name : str
+        Name of the stage.
+    items : int
+        Number of items processed.
+    busy : float
+        Seconds spent processing items.
+    blocked : float
+        Seconds spent waiting on the queues.
+
+    Methods
+    -------
+    sample(inbox)
+        Records the depth of the input queue.
+    add(other)
+        Adds the figures of another thread of the same stage.
+    report(wall)
+        Returns the figures as a dict.
+    '''
+
+    def __init__(self, name):
+        '''
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        '''
+
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._depth_max = 0
+
+    def sample(self, inbox):
+        '''Records the depth of the input queue.
+
+        Parameters
+        ----------
+        inbox : Queue
+            Input queue of the stage.
+        '''
+
+        depth = inbox.qsize()
+        self._depth_total += depth
+        self._depth_samples += 1
+        self._depth_max = max(self._depth_max, depth)
+
+    def add(self, other):
+        '''Adds the figures of another thread of the same stage.
+
+        Parameters
+        ----------
+        other : StageStats
+            Figures of the other thread.
+        '''
+
+        self.items += other.items
+        self.busy += other.busy
+        self.blocked += other.blocked
+        self._depth_total += other._depth_total
+        self._depth_samples += other._depth_samples
+        self._depth_max = max(self._depth_max, other._depth_max)
+
+    def report(self, wall, threads=1):
+        '''Returns the figures of the stage as a dict.
+
+        Parameters
+        ----------
+        wall : float
+            Wall time of the run in seconds.
+        threads : int, optional
+            Number of threads running the stage.
+        '''
+
+        samples = self._depth_samples
+        return OrderedDict([
+            ('items', self.items),
+            ('busy_seconds', self.busy),
+            ('blocked_seconds', self.blocked),
+            ('items_per_second', self.items / self.busy if self.busy
+             else None),
+            ('utilization', self.busy / (wall * threads) if wall else None),
+            ('queue_mean', self._depth_total / samples if samples
+             else None),
+            ('queue_max', self._depth_max if samples else None)])
+
+
+def _apply(pool, work, item):
+    # Runs work on an item in a process of the pool.
+    return pool.apply(work, (item,))
+
+
+class _Stopped(Exception):
+    # Raised inside a stage thread when the pipeline is shutting down.
+    pass
+
+
+class Pipeline:
+    '''
+    Reader thread, worker threads and an ordered consumer connected by
+    bounded queues.
+
+    Attributes
+    ----------
+    workers : int
+        Number of worker threads.
+    queue_size : int
+        Capacity of each queue, in items.
+    processes : bool
+        Run the work of every worker thread in a process of a pool.
+    stats : OrderedDict
+        StageStats of the reader, work and consume stages.
+    wall : float
+        Wall time of the last run.
+
+    Methods
+    -------
+    run(source, work, consume)
+        Runs the pipeline until the source is exhausted.
+    report()
+        Returns the figures of every stage.
+    log()
+        Logs the figures of every stage.
+    '''
+
+    # Seconds between checks for a failed stage while waiting on a queue.
+    POLL = 0.1
+
+    def __init__(self, workers=2, queue_size=4, processes=False):
+        '''
+        Parameters
+        ----------
+        workers : int, optional
+            Number of worker threads.
+        queue_size : int, optional
+            Capacity of each queue, in items.
+        processes : bool, optional
+            Run the work in a pool of as many processes as workers, the
+            work function and items must then be picklable.
+        '''
+
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.processes = processes
+        self.stats = OrderedDict()
+        self.wall = 0.0
+        self._stop = threading.Event()
+        self._errors = []
+        self._slots = None
+
+    def _put(self, outbox, item, stats):
+        start = time.perf_counter()
+        while True:
+            try:
+                outbox.put(item, timeout=self.POLL)
+                break
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Stopped()
+        stats.blocked += time.perf_counter() - start
+
+    def _get(self, inbox, stats):
+        stats.sample(inbox)
+        start = time.perf_counter()
+        while True:
+            try:
+                item = inbox.get(timeout=self.POLL)
+                break
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise _Stopped()
+        stats.blocked += time.perf_counter() - start
+        return item
+
+    def _acquire(self, stats):
+        # Waits for room for one more item in flight.
+        start = time.perf_counter()
+        while not self._slots.acquire(timeout=self.POLL):
+            if self._stop.is_set():
+                raise _Stopped()
+        stats.blocked += time.perf_counter() - start
+
+    def _guard(self, target, *args):
+        # Runs a stage, any failure stops the whole pipeline.
+        try:
+            target(*args)
+        except _Stopped:
+            pass
+        except BaseException as error:
+            self._errors.append(error)
+            self._stop.set()
+
+    def _read(self, source, outbox, stats):
+        clock = time.perf_counter
+        iterator = iter(source)
+        sequence = 0
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stats.busy += clock() - start
+                break
+            stats.busy += clock() - start
+            stats.items += 1
+            self._acquire(stats)
+            self._put(outbox, (sequence, item), stats)
+            sequence += 1
+
+        for _ in range(self.workers):
+            self._put(outbox, _DONE, stats)
+
+    def _work(self, work, inbox, outbox, stats):
+        clock = time.perf_counter
+        while True:
+            item = self._get(inbox, stats)
+            if item is _DONE:
+                self._put(outbox, _DONE, stats)
+                return
+            sequence, value = item
+            start = clock()
+            result = work(value)
+            stats.busy += clock() - start
+            stats.items += 1
+            self._put(outbox, (sequence, result), stats)
+
+    def run(self, source, work, consume):
+        '''Runs the pipeline until the source is exhausted and every
+        result is consumed. The first error raised by any stage is raised
+        again here, after every thread has stopped.
+
+        Parameters
+        ----------
+        source : iterable
+            Items to process, iterated in the reader thread.
+        work : callable
+            Function applied to every item in the worker threads, or in
+            the pool processes.
+        consume : callable
+            Function called with every result in the calling thread, in
+            the order of the source items.
+        '''
+
+        inbox = queue.Queue(self.queue_size)
+        outbox = queue.Queue(self.queue_size)
+        reader = StageStats('read')
+        workers = [StageStats('work') for _ in range(self.workers)]
+        consumer = StageStats('consume')
+        self._stop.clear()
+        self._errors = []
+        # Items in the queues, being worked on or held for reordering.
+        self._slots = threading.Semaphore(2 * self.queue_size +
+                                          self.workers)
+
+        pool = None
+        if self.processes:
+            # Worker threads wait on the pool without holding the GIL.
+            pool = multiprocessing.Pool(self.workers)
+            work = partial(_apply, pool, work)
+
+        threads = [threading.Thread(target=self._guard, daemon=True,
+                                    args=(self._read, source, inbox,
+                                          reader))]
+        threads.extend(threading.Thread(target=self._guard, daemon=True,
+                                        args=(self._work, work, inbox,
+                                              outbox, stats))
+                       for stats in workers)
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            self._consume(consume, outbox, consumer)
+        except _Stopped:
+            pass
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            self.wall = time.perf_counter() - start
+            for stats in workers[1:]:
+                workers[0].add(stats)
+            self.stats = OrderedDict((stats.name, stats) for stats in
+                                     (reader, workers[0], consumer))
+
+        if self._errors:
+            raise self._errors[0]
+
+    def _consume(self, consume, outbox, stats):
+        # Results arrive out of order, they are held until their turn.
+        clock = time.perf_counter
+        held = {}
+        expected = 0
+        running = self.workers
+        while running:
+            item = self._get(outbox, stats)
+            if item is _DONE:
+                running -= 1
+                continue
+            sequence, result = item
+            held[sequence] = result
+            while expected in held:
+                start = clock()
+                consume(held.pop(expected))
+                stats.busy += clock() - start
+                stats.items += 1
+                expected += 1
+                self._slots.release()
+
+    def report(self):
+        '''Returns the figures of every stage of the last run.'''
+
+        threads = {'read': 1, 'work': self.workers, 'consume': 1}
+        report = OrderedDict([('wall_seconds', self.wall),
+                              ('workers', self.workers),
+                              ('queue_size', self.queue_size)])
+        for name, stats in self.stats.items():
+            report[name] = stats.report(self.wall, threads[name])
+
+        return report
+
+    def log(self):
+        '''Logs the figures of every stage of the last run.'''
+
+        for name, stats in self.stats.items():
+            figures = stats.report(self.wall)
+            logging.debug('Pipeline %s: %s items, %.3f s busy, %.3f s '
+                          'blocked, queue mean %s.', name, stats.items,
+                          stats.busy, stats.blocked, figures['queue_mean'])
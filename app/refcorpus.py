@@ -0,0 +1,197 @@
+''' Local store of reference word frequencies.
+
+Reference corpora such as Peter Norvig's count_1w.txt come as text files
+of ``word<TAB>count`` lines. This module converts them once into two numpy
+files, the sorted vocabulary as fixed width UTF-8 strings and the counts
+as int64, which are memory-mapped on load. Loading takes milliseconds, the
+pages are shared by every process reading the same store, and lookups are
+binary searches over the sorted vocabulary.
+
+'''
+
+import argparse
+import logging
+import numpy as np
+from app.vocabulary import lookup_sorted
+
+
+class FrequencyTable:
+    '''
+    Read only word frequency table backed by memory-mapped numpy files.
+
+    It behaves like the dict returned by CommonWord.getwords for the
+    operations the algorithms need: len, in, [], get and items.
+
+    Attributes
+    ----------
+    words : array
+        Sorted vocabulary as fixed width UTF-8 byte strings.
+    counts : array
+        Frequency of every word of the vocabulary.
+
+    Methods
+    -------
+    convert(source_path, prefix)
+        Converts a text frequency file into a binary store.
+    load(prefix)
+        Memory-maps a binary store.
+    get(word, default=0)
+        Returns the frequency of a word.
+    lookup(words)
+        Returns the frequencies of many words as an array.
+    '''
+
+    WORDS_SUFFIX = '.words.npy'
+    COUNTS_SUFFIX = '.counts.npy'
+
+    def __init__(self, words, counts):
+        '''
+        Parameters
+        ----------
+        words : array
+            Sorted vocabulary as fixed width UTF-8 byte strings.
+        counts : array
+            Frequency of every word of the vocabulary.
+        '''
+
+        self.words = words
+        self.counts = counts
+
+    @classmethod
+    def convert(cls, source_path, prefix):
+        '''Converts a text file of word and count lines into a binary store.
+
+        Repeated words keep their last count, as the dict parsing did.
+
+        Parameters
+        ----------
+        source_path : str
+            Path to the text file, one word and count per line.
+        prefix : str
+            Path prefix of the two numpy files written.
+        '''
+
+        logging.debug('Converting %s into %s.', source_path, prefix)
+
+        collection = {}
+        with open(source_path, 'r', encoding='utf8') as source:
+            for line in source:
+                parts = line.split()
+                if len(parts) == 2:
+                    collection[parts[0]] = int(parts[1])
+
+        return cls.from_dict(collection, prefix)
+
+    @classmethod
+    def from_dict(cls, collection, prefix):
+        '''Saves a dict of word frequencies as a binary store.
+
+        Parameters
+        ----------
+        collection : dict
+            Words and frequencies.
+        prefix : str
+            Path prefix of the two numpy files written.
+        '''
+
+        words = np.array([word.encode('utf-8') for word in collection],
+                         dtype=bytes)
+        counts = np.fromiter(collection.values(), dtype=np.int64,
+                             count=len(collection))
+        order = np.argsort(words, kind='stable')
+
+        np.save(prefix + cls.WORDS_SUFFIX, words[order])
+        np.save(prefix + cls.COUNTS_SUFFIX, counts[order])
+
+        return cls.load(prefix)
+
+    @classmethod
+    def load(cls, prefix):
+        '''Memory-maps a binary store written by convert.
+
+        Parameters
+        ----------
+        prefix : str
+            Path prefix of the two numpy files.
+        '''
+
+        return cls(np.load(prefix + cls.WORDS_SUFFIX, mmap_mode='r'),
+                   np.load(prefix + cls.COUNTS_SUFFIX, mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return self._position(word) is not None
+
+    def __getitem__(self, word):
+        position = self._position(word)
+        if position is None:
+            raise KeyError(word)
+        return int(self.counts[position])
+
+    def _position(self, word):
+        key = word.encode('utf-8')
+        if len(key) > self.words.dtype.itemsize:
+            return None
+        position = int(np.searchsorted(self.words, key))
+        if position < len(self.words) and self.words[position] == key:
+            return position
+        return None
+
+    def get(self, word, default=0):
+        '''Returns the frequency of a word, or default when missing.
+
+        Parameters
+        ----------
+        word : str
+            Word to look up.
+        default : int, optional
+            Value for missing words.
+        '''
+
+        position = self._position(word)
+        return default if position is None else int(self.counts[position])
+
+    def lookup(self, words):
+        '''Returns the frequencies of many words, zero for missing ones.
+
+        Parameters
+        ----------
+        words : iterable
+            Words to look up.
+        '''
+
+        keys = [word.encode('utf-8') for word in words]
+        result = np.zeros(len(keys), dtype=np.int64)
+        positions, found = lookup_sorted(keys, self.words)
+        result[found] = self.counts[positions[found]]
+
+        return result
+
+    def keys(self):
+        return (word.decode('utf-8') for word in self.words)
+
+    def items(self):
+        return zip(self.keys(), (int(count) for count in self.counts))
+
+
+# Converts the text file given in the command line into a binary store.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Converts a word<TAB>count text file into a binary '
+                    'frequency store.')
+    parser.add_argument('source', help='text file, one word and count per '
+                                       'line')
+    parser.add_argument('prefix', help='path prefix of the store')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=logging.DEBUG)
+    table = FrequencyTable.convert(args.source, args.prefix)
+    logging.debug('Stored %s words.', len(table))
+
+
+if __name__ == '__main__':
+    main()
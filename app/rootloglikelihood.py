@@ -1,17 +1,18 @@
+import argparse
 import logging
 import collections
-import itertools
-import bz2
-import json
-import nltk
 import urllib.request
 import tempfile
 import math
-import operator
-
-# basic logging configuration
-logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s',
-                    level=logging.DEBUG)
+import os
+import numpy as np
+from app.ingest import (parallel_count, pipelined_count, count_chunk,
+                        open_lines, line_range)
+from app.refcorpus import FrequencyTable
+from app.vocabulary import Vocabulary
+from app.sketch import ApproximateCounter
+from app.corpus import CorpusStore
+from app.instrument import get_recorder, recording
 
 
 class DataGenerator:
@@ -23,49 +24,95 @@ class DataGenerator:
     Attributes
     ----------
     filename : str
-        path to the source file.
+        path to the source file, or to a CorpusStore.
+    depr_value : str
+        domain of the posts whose words are counted.
+    depression_coll : Vocabulary or ApproximateCounter
+        words and their frequencies.
 
     Methods
     -------
-    getwords(nlines=50000)
-        returns a dictionary of words and frequencies.
+    getwords(nlines=50000, workers=1, chunk_size=10000, start=0,
+             pipeline=False)
+        returns a Vocabulary of words and frequencies.
     '''
 
     # Initializer method and initializer variables
-    def __init__(self, filename):
+    def __init__(self, filename, topic='self.depression', counter=None):
         '''
         Parameters
         ----------
         filename : str
             source file path.
+        topic : str, optional
+            domain of the posts.
+        counter : ApproximateCounter, optional
+            bounded memory counter used instead of an exact Vocabulary.
         '''
 
         logging.info('Executing __init__ method of %s', self.__class__.
                      __name__)
 
         # data attributes
-        self.depression_coll = collections.Counter()
+        self.depression_coll = Vocabulary() if counter is None else \
+            counter
         self.text_id = 'selftext'
         self.domain_id = 'domain'
-        self.depr_value = 'self.depression'
+        self.depr_value = topic
         self.filename = filename
 
-    def getwords(self, nlines=50000):
+    def getwords(self, nlines=50000, workers=1, chunk_size=10000, start=0,
+                 pipeline=False):
+        '''Counts the words of the posts in the target domain.
+
+        With more than one worker the lines are tokenized and counted in
+        a process pool, giving the same counts as the serial path. When
+        the dump has a CorpusStore the posts of the domain are read from
+        it instead and the other options are ignored.
+
+        Parameters
+        ----------
+        nlines : int, optional
+            number of lines to parse.
+        workers : int, optional
+            number of worker processes, 1 runs in the current process.
+        chunk_size : int, optional
+            number of lines handed to a worker at a time.
+        start : int, optional
+            first line to parse, used to resume an interrupted scan.
+        pipeline : bool, optional
+            overlap decompression, tokenizing and counting as stages of
+            a pipeline, tokenizing in a thread or in the worker
+            processes.
+        '''
 
         logging.info('Executing getwords method of %s', self.__class__.
                      __name__)
 
-        with bz2.open(self.filename, 'rt') as reddit_file:
-            for line in itertools.islice(reddit_file, 0, nlines):
-                dataset = json.loads(line)
-                if (dataset[self.domain_id] == self.depr_value):
-                    text = dataset[self.text_id]
-                    tokens = nltk.word_tokenize(text)
-                    tokens = [word for word in tokens if word.isalpha()]
-                    tokens = [word.lower() for word in tokens]
-                    self.depression_coll.update(tokens)
-
-            return self.depression_coll
+        store = CorpusStore.find(self.filename, self.domain_id,
+                                 self.text_id)
+        if store is not None:
+            return store.count(self.depr_value, *line_range(start, nlines),
+                               self.depression_coll)
+        if pipeline:
+            return pipelined_count(self.filename, self.depr_value, nlines,
+                                   workers, chunk_size,
+                                   processes=workers > 1,
+                                   domain_id=self.domain_id,
+                                   text_id=self.text_id, start=start,
+                                   counter=self.depression_coll)
+        if workers > 1:
+            return parallel_count(self.filename, self.depr_value, nlines,
+                                  workers, chunk_size, self.domain_id,
+                                  self.text_id, start, self.depression_coll)
+
+        lines = open_lines(self.filename, *line_range(start, nlines),
+                           binary=True)
+        count_chunk(get_recorder().timed(lines, 'bz2', 'lines_read'),
+                    self.depr_value, self.domain_id, self.text_id,
+                    self.depression_coll)
+
+        return self.depression_coll
 
 
 class CommonWord:
@@ -79,6 +126,8 @@ class CommonWord:
             resource for most common words.
         commonwords_coll : dict
             container for the results
+        store_prefix : string
+            path prefix of the local binary frequency store, if any.
 
         Methods
         -------
@@ -87,11 +136,13 @@ class CommonWord:
         '''
 
         # Initializer method
-        def __init__(self):
+        def __init__(self, store_prefix=None):
             '''
             Parameters
              ----------
-            none.
+            store_prefix : string, optional
+                path prefix of a store written by FrequencyTable.convert,
+                used instead of the url when present.
             '''
 
             logging.info('Executing __init__method of: ' + self.__class__.
@@ -99,12 +150,17 @@ class CommonWord:
 
             self.url = 'http://norvig.com/ngrams/count_1w.txt'
             self.commonwords_coll = {}
+            self.store_prefix = store_prefix
 
         def getwords(self):
             '''Downloads the contents of the file specified in the url
             and loads them into memory inside a dict object's member
             class for further usage, basically filtering common words.
 
+            When the local store exists it is memory-mapped instead and
+            no network access happens. A download is saved into the
+            store, if one was given, for the next runs.
+
             Parameters
             ----------
                 none.
@@ -113,6 +169,12 @@ class CommonWord:
             logging.info('Executing getwords method of %s', self.__class__.
                          __name__)
 
+            if self.store_prefix and os.path.exists(
+                    self.store_prefix + FrequencyTable.WORDS_SUFFIX):
+                self.commonwords_coll = FrequencyTable.load(
+                    self.store_prefix)
+                return self.commonwords_coll
+
             temp = tempfile.TemporaryFile(mode='w+t')
 
             try:
@@ -129,7 +191,12 @@ class CommonWord:
                 logging.info('Closing the temp file')
                 temp.close()
 
-            return self.strfreqtoint(self.commonwords_coll)
+            self.strfreqtoint(self.commonwords_coll)
+            if self.store_prefix:
+                self.commonwords_coll = FrequencyTable.from_dict(
+                    self.commonwords_coll, self.store_prefix)
+
+            return self.commonwords_coll
 
         # Converts frequency values to integers of the given collection
         def strfreqtoint(self, collection):
@@ -154,9 +221,19 @@ class RootLogLikelihoodRatio:
 
     Attributes
     ----------
+    words : array
+        vocabulary of the reddit collection, aligned with the arrays.
+    score_values : array
+        signed root log-likelihood ratio of every word.
 
     Methods
     -------
+    score_arrays(a, b, c, d)
+        vectorized version of calculate_score.
+    applyllr()
+        scores every word of the reddit collection.
+    extremes(k=50)
+        returns the k lowest and k highest scored words.
     '''
 
     # Class __init__ method
@@ -168,11 +245,13 @@ class RootLogLikelihoodRatio:
         self.reddit_collection = reddit_collection
         self.common_collection = common_collection
         self.scores = {}
+        self.words = np.array([], dtype=object)
+        self.score_values = np.array([], dtype='float')
 
     # Utility method for saving into a file in the same dir
-    def savetofile(self, dict):
+    def savetofile(self, dict, path='final_comparation.txt'):
 
-        with open('final_comparation.txt', 'w') as file:
+        with open(path, 'w') as file:
             for key, value in dict.items():
                 file.write(f'{key:<4} {value}')
                 file.write('\n')
@@ -186,9 +265,6 @@ class RootLogLikelihoodRatio:
     # Algorithm implementation
     def calculate_score(self, a, b, c, d):
 
-        logging.info('Executing impl method of %s',
-                     self.__class__.__name__)
-
         E1 = c*(a+b)/(c+d)
         E2 = d*(a+b)/(c+d)
         result = 2*(a*math.log(a/E1 + (1 if a == 0 else 0))
@@ -200,39 +276,189 @@ class RootLogLikelihoodRatio:
 
         return result
 
+    # Vectorized implementation of the algorithm
+    @staticmethod
+    def score_arrays(a, b, c, d):
+        '''Returns the signed root log-likelihood ratio of every pair of
+        frequencies, same as calling calculate_score element by element.
+
+        A zero frequency contributes nothing to the ratio, the result is
+        clipped at zero before the square root to absorb rounding.
+
+        Parameters
+        ----------
+        a : array
+            frequencies in the reddit collection.
+        b : array
+            frequencies in the common words collection.
+        c : int
+            size of the reddit collection.
+        d : int
+            size of the common words collection.
+        '''
+
+        a = np.asarray(a, dtype='float')
+        b = np.asarray(b, dtype='float')
+        E1 = c*(a+b)/(c+d)
+        E2 = d*(a+b)/(c+d)
+
+        term_a = np.zeros_like(a)
+        term_b = np.zeros_like(b)
+        np.multiply(a, np.log(a/E1, where=a > 0, out=np.ones_like(a)),
+                    out=term_a, where=a > 0)
+        np.multiply(b, np.log(b/E2, where=b > 0, out=np.ones_like(b)),
+                    out=term_b, where=b > 0)
+
+        result = np.sqrt(np.maximum(2*(term_a + term_b), 0))
+
+        return np.where(a/c < b/d, -result, result)
+
     # Apply the algorithm over all the words in the two datasets
     def applyllr(self):
 
         logging.info('Executing applyllr metho of %s',
                      self.__class__.__name__)
 
-        for word, frequency in self.reddit_collection.items():
-
-            a = frequency
-            b = self.common_collection.get(word, 0)
-            c = len(self.reddit_collection)
-            d = len(self.common_collection)
-            result = self.calculate_score(a, b, c, d)
-            self.scores[word] = result
+        # Align both collections over the reddit vocabulary.
+        size = len(self.reddit_collection)
+        if isinstance(self.reddit_collection, Vocabulary):
+            # Counts are already an array in id order.
+            self.words = self.reddit_collection.words
+            a = self.reddit_collection.counts
+        elif isinstance(self.reddit_collection, ApproximateCounter):
+            # Only the most frequent words are kept, the size of the
+            # collection is estimated by the sketch.
+            self.words = self.reddit_collection.words
+            a = self.reddit_collection.counts
+            size = max(len(a), self.reddit_collection.distinct())
+        else:
+            self.words = np.array(list(self.reddit_collection),
+                                  dtype=object)
+            a = np.fromiter(self.reddit_collection.values(),
+                            dtype=np.int64, count=size)
+        if isinstance(self.common_collection, FrequencyTable):
+            with get_recorder().timer('numpy'):
+                b = self.common_collection.lookup(self.words)
+        else:
+            b = np.fromiter((self.common_collection.get(word, 0)
+                             for word in self.words), dtype=np.int64,
+                            count=len(self.words))
+
+        with get_recorder().timer('numpy'):
+            self.score_values = self.score_arrays(
+                a, b, size, len(self.common_collection))
+        self.scores = dict(zip(self.words, self.score_values.tolist()))
 
         return self.scores
 
+    # Lowest and highest scored words without sorting the whole vocabulary
+    def extremes(self, k=50):
+        '''Returns an ordered dict with the k lowest followed by the k
+        highest scored words, sorted by score.
 
-# Main method.
-def main():
+        Uses np.argpartition so only the 2k selected words get sorted.
+        applyllr must have been called before.
 
+        Parameters
+        ----------
+        k : int, optional
+            number of words taken from each end, no words when k <= 0
+            and every word once when 2k reaches the number of words.
+        '''
+
+        values = self.score_values
+        k = min(k, len(values))
+        if k <= 0:
+            return collections.OrderedDict()
+        if 2*k >= len(values):
+            selected = np.argsort(values, kind='stable')
+        else:
+            bottom = np.argpartition(values, k)[:k]
+            top = np.argpartition(values, len(values) - k)[-k:]
+            bottom = bottom[np.argsort(values[bottom], kind='stable')]
+            top = top[np.argsort(values[top], kind='stable')]
+            selected = np.concatenate((bottom, top))
+
+        return collections.OrderedDict(
+            zip(self.words[selected], values[selected].tolist()))
+
+
+# Main method.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Compares the words of a Reddit domain with a reference '
+                    'corpus using the root log-likelihood ratio.')
+    parser.add_argument('--input', default='../../resources/RS_2017-10.bz2',
+                        help='bz2 compressed Reddit dump')
+    parser.add_argument('--topic', default='self.depression',
+                        help='domain of the posts')
+    parser.add_argument('--nlines', type=int, default=1000000,
+                        help='number of lines to read, 0 for all')
+    parser.add_argument('--start', type=int, default=0,
+                        help='first line to read')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes counting the words')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap reading, tokenizing and counting, '
+                             'per-stage figures go to the report')
+    parser.add_argument('--common-store',
+                        help='path prefix of a reference FrequencyTable, '
+                             'filled from the url when missing')
+    parser.add_argument('--capacity', type=int,
+                        help='count in fixed memory, keeping this many '
+                             'most frequent words')
+    parser.add_argument('--epsilon', type=float, default=1e-4,
+                        help='overcount bound of the approximate counts, '
+                             'relative to the total')
+    parser.add_argument('--delta', type=float, default=1e-3,
+                        help='probability of exceeding the bound')
+    parser.add_argument('--number', type=int, default=50,
+                        help='words taken from each end of the scores')
+    parser.add_argument('--output', default='final_comparation.txt',
+                        help='scored words file')
+    parser.add_argument('--report', default='llr_report.json',
+                        help='json run report')
+    parser.add_argument('--log-level', default='DEBUG')
+    args = parser.parse_args(argv)
+
+    # basic logging configuration
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s',
+                        level=args.log_level)
     logging.info('Executing main method')
-    datagenerator = DataGenerator('../../resources/RS_2017-10.bz2')
-    reddit_dataset = datagenerator.getwords(1000000)
-    commonword = CommonWord()
-    common_dataset = commonword.getwords()
-    rll = RootLogLikelihoodRatio(reddit_dataset, common_dataset)
-    result_dict = rll.applyllr()
-    result = sorted(result_dict.items(), key=operator.itemgetter(1))
-    final_result = collections.OrderedDict(result)
-    rll.printdict(final_result)
-    rll.savetofile(final_result)
+
+    with recording('rootloglikelihood') as recorder:
+        with recorder.stage('reddit_counts'):
+            counter = None
+            if args.capacity:
+                counter = ApproximateCounter(epsilon=args.epsilon,
+                                             delta=args.delta,
+                                             capacity=args.capacity)
+            datagenerator = DataGenerator(args.input, args.topic, counter)
+            reddit_dataset = datagenerator.getwords(args.nlines or None,
+                                                    args.workers,
+                                                    start=args.start,
+                                                    pipeline=args.pipeline)
+        with recorder.stage('common_counts'):
+            commonword = CommonWord(args.common_store)
+            common_dataset = commonword.getwords()
+        with recorder.stage('scoring'):
+            rll = RootLogLikelihoodRatio(reddit_dataset, common_dataset)
+            rll.applyllr()
+            final_result = rll.extremes(args.number)
+        with recorder.stage('output'):
+            rll.printdict(final_result)
+            rll.savetofile(final_result, args.output)
+        recorder.set('vocabulary', len(reddit_dataset))
+        recorder.set('common_vocabulary', len(common_dataset))
+        if counter is not None:
+            recorder.set('bounds', counter.bounds())
+
+    # Run report for the dashboards.
+    recorder.log()
+    recorder.write(args.report)
 
 
 # Entry point.
-main()
+if __name__ == '__main__':
+    main()
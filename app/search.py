@@ -0,0 +1,672 @@
+''' BM25 inverted index over the posts of a topic.
+
+The index maps every term to its postings, the posts where it appears
+and how many times, so the posts of the keywords ranked by TextRank can
+be retrieved without reading the dump again. It is written once into a
+directory of numpy files, memory-mapped on load:
+
+- terms, the sorted terms as a StringColumn, with df.npy and bound.npy
+  holding the number of posts of every term and the highest BM25 score
+  of its postings.
+- postings.docs.npy and postings.tfs.npy, the posting lists of all the
+  terms as varint bytes, the post numbers as gaps from the previous
+  post of the list and the term frequencies as they are. Both streams
+  have their byte offsets per term in docs.offsets.npy and
+  tfs.offsets.npy.
+- length.npy, line.npy, the post ids and optionally the texts of the
+  posts, by post number.
+
+A varint takes one byte per seven bits of the value, gaps between posts
+of frequent terms and term frequencies mostly fit in one byte. Posting
+lists are decoded with array operations.
+
+Queries return the k posts of highest BM25 score with the MaxScore
+algorithm, term at a time: the terms are scored from the highest bound
+of their postings down, and once the bounds of the terms left cannot
+lift a new post above the k-th score found so far, only the posts that
+can still make it are looked up in the remaining lists. Terms may be
+weighted, such as by their TextRank scores.
+
+'''
+
+import os
+import json
+import shutil
+import argparse
+import logging
+from array import array
+from collections.abc import Mapping
+import numpy as np
+from app.corpus import StringColumn
+from app.ingest import tokenize_text
+from app.vocabulary import Vocabulary
+from app.instrument import get_recorder
+
+
+def encode_varints(values):
+    '''Returns the varint encoding of non negative integers as uint8,
+    seven bits per byte from the lowest ones, with the high bit set on
+    every byte but the last of a value.
+
+    Parameters
+    ----------
+    values : array
+        Non negative integers.
+    '''
+
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+
+    starts = np.cumsum(sizes) - sizes
+    encoded = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for j in range(int(sizes.max(initial=0))):
+        kept = sizes > j
+        byte = (values[kept] >> np.uint64(7 * j)) & np.uint64(0x7f)
+        more = (sizes[kept] > j + 1).astype(np.uint64) << np.uint64(7)
+        encoded[starts[kept] + j] = byte | more
+
+    return encoded
+
+
+def decode_varints(encoded):
+    '''Returns the integers of a varint encoded uint8 array.
+
+    Parameters
+    ----------
+    encoded : array
+        Bytes written by encode_varints.
+    '''
+
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if not len(encoded):
+        return np.zeros(0, dtype=np.uint64)
+
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    parts = (encoded & 0x7f).astype(np.uint64) << \
+        (7 * shifts).astype(np.uint64)
+
+    return np.add.reduceat(parts, starts)
+
+
+class IndexBuilder:
+    '''
+    Collects the terms of posts and writes an InvertedIndex.
+
+    Postings are kept in memory as int32 arrays until save, about twelve
+    bytes per distinct term of every post.
+
+    Attributes
+    ----------
+    vocabulary : Vocabulary
+        Terms seen so far.
+    texts : bool
+        Keep the texts of the posts in the index.
+
+    Methods
+    -------
+    add(tokens, line, post_id=None, text=None)
+        Adds the terms of a post.
+    save(path, k1=1.2, b=0.75, meta=None)
+        Writes the index and returns it loaded.
+    '''
+
+    def __init__(self, texts=True):
+        '''
+        Parameters
+        ----------
+        texts : bool, optional
+            Keep the texts of the posts in the index.
+        '''
+
+        self.vocabulary = Vocabulary()
+        self.texts = texts
+        self._terms = array('i')
+        self._docs = array('i')
+        self._tfs = array('i')
+        self._lengths = array('i')
+        self._lines = array('q')
+        self._ids = []
+        self._texts = []
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, tokens, line, post_id=None, text=None):
+        '''Adds the terms of a post, numbered in order of addition.
+
+        Parameters
+        ----------
+        tokens : list
+            Terms of the post.
+        line : int
+            Line of the post in the dump.
+        post_id : str, optional
+            Id of the post.
+        text : str, optional
+            Text of the post, kept when texts is set.
+        '''
+
+        doc = len(self._lengths)
+        ids, tfs = np.unique(np.asarray(self.vocabulary.intern(tokens),
+                                        dtype=np.int32),
+                             return_counts=True)
+        self._terms.extend(ids.tolist())
+        self._tfs.extend(tfs.tolist())
+        self._docs.extend([doc] * len(ids))
+        self._lengths.append(len(tokens))
+        self._lines.append(line)
+        self._ids.append(json.dumps(post_id))
+        if self.texts:
+            self._texts.append(text or '')
+
+    def save(self, path, k1=1.2, b=0.75, meta=None):
+        '''Writes the index into a directory and returns it loaded.
+
+        The files are written in a temporary directory renamed at the
+        end, so an interrupted save leaves no index.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the index.
+        k1 : float, optional
+            BM25 term frequency saturation.
+        b : float, optional
+            BM25 document length normalization.
+        meta : dict, optional
+            Extra json serializable information kept with the index.
+        '''
+
+        logging.debug('Saving the index of %s posts into %s.', len(self),
+                      path)
+        work_path = path + '.tmp'
+        if os.path.exists(work_path):
+            shutil.rmtree(work_path)
+        os.makedirs(work_path)
+
+        def column(name):
+            return os.path.join(work_path, name)
+
+        # Terms in sorted order, postings grouped by term in post order.
+        words = self.vocabulary.words.tolist()
+        order = sorted(range(len(words)),
+                       key=lambda i: words[i].encode('utf-8'))
+        rank = np.empty(len(words), dtype=np.int64)
+        rank[order] = np.arange(len(words))
+        terms = rank[np.frombuffer(self._terms, dtype=np.int32)]
+        docs = np.frombuffer(self._docs, dtype=np.int32).astype(np.int64)
+        tfs = np.frombuffer(self._tfs, dtype=np.int32).astype(np.int64)
+        by_term = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[by_term], docs[by_term], tfs[by_term]
+        bounds = np.searchsorted(terms, np.arange(len(words) + 1))
+        df = np.diff(bounds)
+
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        norms = bm25_norms(lengths, average, k1, b)
+        idf = bm25_idf(df, len(lengths))
+        scores = np.repeat(idf, df) * bm25_tf(tfs, norms[docs], k1)
+        bound = np.zeros(len(words))
+        nonempty = df > 0
+        bound[nonempty] = np.maximum.reduceat(scores, bounds[:-1][nonempty])
+
+        gaps = np.diff(docs, prepend=0)
+        gaps[bounds[:-1][nonempty]] = docs[bounds[:-1][nonempty]]
+        for name, values in (('docs', gaps), ('tfs', tfs)):
+            # Byte offsets of the lists follow from the value sizes.
+            encoded = encode_varints(values)
+            ends = np.flatnonzero(encoded < 0x80) + 1
+            offsets = np.concatenate(([0], ends))[bounds]
+            np.save(column(f'postings.{name}.npy'), encoded)
+            np.save(column(f'{name}.offsets.npy'), offsets.astype(np.int64))
+
+        StringColumn.save(column('terms'), (words[i] for i in order))
+        np.save(column('df.npy'), df.astype(np.int64))
+        np.save(column('bound.npy'), bound)
+        np.save(column('length.npy'), lengths)
+        np.save(column('line.npy'), np.frombuffer(self._lines, np.int64))
+        StringColumn.save(column('ids'), self._ids)
+        if self.texts:
+            StringColumn.save(column('texts'), self._texts)
+
+        info = dict(meta or {})
+        info.update(k1=k1, b=b, documents=len(lengths),
+                    average_length=average, texts=self.texts)
+        with open(column(InvertedIndex.META_FILE), 'w') as meta_file:
+            json.dump(info, meta_file, indent=2)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(work_path, path)
+
+        return InvertedIndex.load(path)
+
+
+def bm25_norms(lengths, average, k1=1.2, b=0.75):
+    '''Returns the length normalization k1 * (1 - b + b * dl / avgdl) of
+    every post.
+
+    Parameters
+    ----------
+    lengths : array
+        Number of terms of every post.
+    average : float
+        Average number of terms per post.
+    k1 : float, optional
+        Term frequency saturation.
+    b : float, optional
+        Document length normalization.
+    '''
+
+    lengths = np.asarray(lengths, dtype=np.float64)
+    return k1 * (1 - b + b * lengths / (average or 1.0))
+
+
+def bm25_idf(df, documents):
+    '''Returns the BM25 inverse document frequency of terms, which stays
+    positive for terms found in most of the posts.
+
+    Parameters
+    ----------
+    df : array
+        Number of posts of every term.
+    documents : int
+        Number of posts.
+    '''
+
+    df = np.asarray(df, dtype=np.float64)
+    return np.log1p((documents - df + 0.5) / (df + 0.5))
+
+
+def bm25_tf(tfs, norms, k1=1.2):
+    '''Returns the BM25 term frequency factor of postings.
+
+    Parameters
+    ----------
+    tfs : array
+        Term frequencies.
+    norms : array
+        Length normalization of the posts of the postings.
+    k1 : float, optional
+        Term frequency saturation.
+    '''
+
+    tfs = np.asarray(tfs, dtype=np.float64)
+    return tfs * (k1 + 1) / (tfs + norms)
+
+
+class InvertedIndex:
+    '''
+    Memory-mapped BM25 index of the posts of a topic.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the index.
+    meta : dict
+        BM25 parameters, number of posts, average length and the source
+        of the posts.
+    terms : StringColumn
+        Sorted terms.
+    df : array
+        Number of posts of every term.
+    bound : array
+        Highest BM25 score of the postings of every term.
+    lines : array
+        Line of the dump of every post.
+
+    Methods
+    -------
+    load(path)
+        Memory-maps an index.
+    find(term)
+        Returns the number of a term.
+    postings(term)
+        Returns the posts and frequencies of a term.
+    search(query, k=10)
+        Returns the k posts of highest BM25 score.
+    hits(query, k=10)
+        Returns the k best posts with their lines, ids and texts.
+    '''
+
+    META_FILE = 'meta.json'
+    # Relative slack on the score bounds against rounding differences.
+    SLACK = 1e-9
+
+    def __init__(self, path, meta):
+        '''
+        Parameters
+        ----------
+        path : str
+            Directory of the index.
+        meta : dict
+            Contents of the meta file.
+        '''
+
+        self.path = path
+        self.meta = meta
+
+        def column(name):
+            # Plain views of the mapped files, indexing a memmap is slow.
+            return np.asarray(np.load(os.path.join(path, name),
+                                      mmap_mode='r'))
+
+        def strings(name):
+            return StringColumn.load(os.path.join(path, name))
+
+        self.terms = strings('terms')
+        self.df = column('df.npy')
+        self.bound = column('bound.npy')
+        self.lines = column('line.npy')
+        self.lengths = column('length.npy')
+        self.ids = strings('ids')
+        self.texts = strings('texts') if meta['texts'] else None
+        self._docs = column('postings.docs.npy')
+        self._tfs = column('postings.tfs.npy')
+        self._doc_offsets = column('docs.offsets.npy')
+        self._tf_offsets = column('tfs.offsets.npy')
+        self.k1, self.b = meta['k1'], meta['b']
+        self.idf = bm25_idf(self.df, meta['documents'])
+        self.norms = bm25_norms(self.lengths, meta['average_length'],
+                                self.k1, self.b)
+
+    def __len__(self):
+        return self.meta['documents']
+
+    @classmethod
+    def load(cls, path):
+        '''Memory-maps an index written by IndexBuilder.save.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the index.
+        '''
+
+        with open(os.path.join(path, cls.META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+
+        return cls(path, meta)
+
+    @classmethod
+    def exists(cls, path):
+        '''Returns whether an index has been saved in a directory.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the index.
+        '''
+
+        return os.path.isfile(os.path.join(path, cls.META_FILE))
+
+    def find(self, term):
+        '''Returns the number of a term, None when it is not indexed.
+
+        Parameters
+        ----------
+        term : str
+            Term looked for.
+        '''
+
+        key = term.encode('utf-8')
+        offsets, data = self.terms.offsets, self.terms.data
+        low, high = 0, len(self.terms)
+        while low < high:
+            middle = (low + high) // 2
+            if data[offsets[middle]:offsets[middle + 1]].tobytes() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.terms) and self.terms[low] == term:
+            return low
+
+        return None
+
+    def postings(self, term):
+        '''Returns the posts of a term and its frequency in each of them
+        as two int64 arrays, empty for unknown terms.
+
+        Parameters
+        ----------
+        term : str or int
+            Term or its number.
+        '''
+
+        i = self.find(term) if isinstance(term, str) else term
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        docs = decode_varints(self._docs[self._doc_offsets[i]:
+                                         self._doc_offsets[i + 1]])
+        tfs = decode_varints(self._tfs[self._tf_offsets[i]:
+                                       self._tf_offsets[i + 1]])
+
+        return np.cumsum(docs).astype(np.int64), tfs.astype(np.int64)
+
+    def _query_terms(self, query):
+        # Returns the weight of every known term of a query.
+        if isinstance(query, str):
+            query = tokenize_text(query)
+        if not isinstance(query, Mapping):
+            weights = {}
+            for term in query:
+                weights[term] = weights.get(term, 0.0) + 1.0
+            query = weights
+
+        terms = {}
+        for term, weight in query.items():
+            i = self.find(term)
+            if i is not None and weight > 0:
+                terms[i] = terms.get(i, 0.0) + float(weight)
+
+        return terms
+
+    def search(self, query, k=10):
+        '''Returns the k posts of highest BM25 score for a query as a
+        list of (score, post) pairs, best first.
+
+        The score of a post is the sum over the query terms in it of the
+        weight of the term times its BM25 score. Posts are found with
+        max_score, which gives the same scores as scoring every post.
+
+        Parameters
+        ----------
+        query : str, list or dict
+            Text, list of terms, or terms mapped to weights such as the
+            keywords of TextRank.get_keywords.
+        k : int, optional
+            Number of posts returned.
+        '''
+
+        recorder = get_recorder()
+        with recorder.timer('search'):
+            lists = [(weight * float(self.bound[i]) * (1 + self.SLACK),
+                      i, weight * float(self.idf[i]))
+                     for i, weight in self._query_terms(query).items()]
+            results, scored = max_score(lists, k, self.postings, self.norms,
+                                        self.k1)
+        recorder.count('queries')
+        recorder.count('postings_scored', scored)
+
+        return results
+
+    def hits(self, query, k=10):
+        '''Returns the k best posts for a query as dicts with their score,
+        line, id and text when kept.
+
+        Parameters
+        ----------
+        query : str, list or dict
+            Text, list of terms, or terms mapped to weights.
+        k : int, optional
+            Number of posts returned.
+        '''
+
+        hits = []
+        for score, doc in self.search(query, k):
+            hit = {'score': score, 'line': int(self.lines[doc]),
+                   'id': json.loads(self.ids[doc])}
+            if self.texts is not None:
+                hit['text'] = self.texts[doc]
+            hits.append(hit)
+
+        return hits
+
+
+def kth_largest(values, k):
+    '''Returns the k-th largest of an array of scores, 0 when it holds
+    fewer than k of them.
+
+    Parameters
+    ----------
+    values : array
+        Scores.
+    k : int
+        Rank of the score returned.
+    '''
+
+    if len(values) < k:
+        return 0.0
+
+    return float(np.partition(values, len(values) - k)[len(values) - k])
+
+
+def max_score(lists, k, postings, norms, k1=1.2):
+    '''Returns the k best (score, post) pairs of a weighted BM25 query
+    with the term at a time MaxScore algorithm, and the number of
+    postings scored.
+
+    The lists are scored from the highest bound down into an array of
+    post scores, and the k-th best score so far is a threshold. Once the
+    bounds of the lists left add up to no more than the threshold, no
+    post missing from the scored lists can enter the results, and only
+    the candidates that can still beat the threshold are looked up in the
+    lists left with binary searches. Candidates are dropped as the
+    threshold rises and the bounds left shrink.
+
+    Parameters
+    ----------
+    lists : list
+        (bound, term, scale) of every query term, where bound is the
+        highest weighted score of its postings and scale its weight
+        times its idf.
+    k : int
+        Number of posts returned.
+    postings : callable
+        Returns the sorted posts of a term and their term frequencies.
+    norms : array
+        BM25 length normalization of every post.
+    k1 : float, optional
+        BM25 term frequency saturation.
+    '''
+
+    lists = sorted(lists, key=lambda item: -item[0])
+    left = sum(item[0] for item in lists)
+    scores = np.zeros(len(norms))
+    threshold = 0.0
+    candidates = None
+    scored = 0
+
+    for bound, term, scale in lists:
+        left = max(left - bound, 0.0)
+        docs, tfs = postings(term)
+        if candidates is None:
+            scores[docs] += scale * bm25_tf(tfs, norms[docs], k1)
+            scored += len(docs)
+            # The k-th best score among these posts bounds the threshold.
+            threshold = max(threshold, kth_largest(scores[docs], k))
+            if left <= threshold:
+                candidates = np.flatnonzero(scores + left >= threshold)
+        else:
+            found = np.searchsorted(docs, candidates)
+            found[found == len(docs)] = 0
+            hit = docs[found] == candidates if len(docs) else \
+                np.zeros(len(candidates), dtype=bool)
+            matched = candidates[hit]
+            scores[matched] += scale * bm25_tf(tfs[found[hit]],
+                                               norms[matched], k1)
+            scored += len(matched)
+            threshold = max(threshold, kth_largest(scores[candidates], k))
+            candidates = candidates[scores[candidates] + left >= threshold]
+
+    if candidates is None:
+        candidates = np.flatnonzero(scores)
+    candidates = candidates[scores[candidates] > 0]
+    best = candidates[np.lexsort((candidates, -scores[candidates]))[:k]]
+
+    return list(zip(scores[best].tolist(), best.tolist())), scored
+
+
+def read_keywords(file_path):
+    '''Returns the words and weights of a file written by dict2file.
+
+    Parameters
+    ----------
+    file_path : str
+        Ranked words file, a word and its weight per line.
+    '''
+
+    keywords = {}
+    with open(file_path) as keywords_file:
+        for line in keywords_file:
+            parts = line.split()
+            if len(parts) == 2:
+                keywords[parts[0]] = float(parts[1])
+
+    return keywords
+
+
+# Builds an index or queries one, as given in the command line.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Builds and queries BM25 indexes of Reddit posts.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='index the posts of a topic')
+    build.add_argument('input', help='bz2 compressed dump or corpus store')
+    build.add_argument('index', help='directory of the index')
+    build.add_argument('--topic', default='self.depression',
+                       help='domain of the posts')
+    build.add_argument('--nlines', type=int, default=0,
+                       help='number of lines to read, 0 for all')
+    build.add_argument('--start', type=int, default=0,
+                       help='first line to read')
+    build.add_argument('--no-texts', action='store_true',
+                       help='do not keep the texts of the posts')
+
+    query = commands.add_parser('query', help='retrieve the best posts')
+    query.add_argument('index', help='directory of the index')
+    query.add_argument('terms', nargs='*', help='query terms')
+    query.add_argument('--keywords',
+                       help='ranked words file, its words are the query '
+                            'weighted by their rank')
+    query.add_argument('-k', type=int, default=10,
+                       help='number of posts returned')
+    parser.add_argument('--log-level', default='DEBUG')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=args.log_level)
+
+    if args.command == 'build':
+        from app.textrank import Words
+        Words(args.input, args.topic).index_documents(
+            args.index, args.nlines or None, args.start,
+            texts=not args.no_texts)
+    else:
+        index = InvertedIndex.load(args.index)
+        terms = read_keywords(args.keywords) if args.keywords else \
+            args.terms
+        print(json.dumps(index.hits(terms, args.k), indent=2))
+
+
+if __name__ == '__main__':
+    main()
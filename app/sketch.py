@@ -0,0 +1,526 @@
+''' Bounded memory approximate token counting.
+
+An exact Vocabulary keeps every distinct token of the input, and over a
+year of dumps the long tail of typos, urls and numbers dominates its
+memory. The ApproximateCounter here holds a fixed amount of memory chosen
+up front, whatever the input size, and combines two classic summaries:
+
+- A CountMinSketch estimates the frequency of any token. Estimates never
+  undercount, and with probability 1 - delta they overcount by at most
+  epsilon * N, N being the number of tokens counted. Memory is
+  depth * width int64 cells, width = e / epsilon rounded up to a power of
+  two and depth = ln(1 / delta): 2 MB for epsilon = 1e-4, delta = 1e-3.
+- A SpaceSaving summary keeps the capacity most frequent tokens. Every
+  token more frequent than N / capacity is guaranteed to be kept, and a
+  kept token overcounts by at most N / capacity.
+
+The counter reports the smaller of both estimates for the kept tokens,
+they are both upper bounds. Its keys are the kept tokens, so len, in,
+iteration and most_common cover the top vocabulary only, while [] and get
+estimate any token.
+
+Hashes are computed from the UTF-8 bytes with crc32 and adler32, not with
+the salted built-in hash, so sketches built in different processes or
+machines can be merged.
+
+Accuracy against the exact mode, measured with benchmarks/accuracy.py on
+a 32000 line synthetic dump of 198408 tokens and 14270 distinct words,
+with epsilon = 1e-4: no undercount, a largest overcount of 1 against a
+bound of 16, and every word above N / capacity kept. The words with the
+highest log-likelihood ratio match the exact ones at 86% with a capacity
+of 1000 and at 100% with 10000. The lowest ones, mostly rare words that
+are not kept, match at 56% and 92%.
+
+'''
+
+import heapq
+import zlib
+from collections import Counter
+from collections.abc import Mapping
+import numpy as np
+
+from app.vocabulary import Vocabulary
+
+
+def token_keys(tokens):
+    '''Returns stable 64 bit hash keys of tokens as a uint64 array.
+
+    Parameters
+    ----------
+    tokens : list
+        Tokens to hash.
+    '''
+
+    crc32, adler32 = zlib.crc32, zlib.adler32
+    keys = [token.encode('utf-8') for token in tokens]
+
+    return np.fromiter((crc32(key) << 32 | adler32(key) for key in keys),
+                       dtype=np.uint64, count=len(keys))
+
+
+class CountMinSketch:
+    '''
+    Frequency estimates of a stream in fixed memory.
+
+    Each of depth rows maps a token to one of width cells with its own
+    multiply-shift hash, counts are added to every row and a frequency is
+    the minimum over the rows.
+
+    Attributes
+    ----------
+    width : int
+        Cells per row, a power of two.
+    depth : int
+        Number of rows.
+    seed : int
+        Seed of the hash functions, sketches only merge with equal seeds.
+    table : array
+        depth x width int64 counts.
+    total : int
+        Sum of the counts added.
+
+    Methods
+    -------
+    add(keys, counts)
+        Adds counts to hashed keys.
+    estimate(keys)
+        Returns the frequency estimates of hashed keys.
+    merge(other)
+        Adds the counts of another sketch.
+    distinct()
+        Estimates the number of distinct keys added.
+    '''
+
+    def __init__(self, epsilon=1e-4, delta=1e-3, seed=0):
+        '''
+        Parameters
+        ----------
+        epsilon : float, optional
+            Bound of the overcount relative to the total.
+        delta : float, optional
+            Probability of exceeding the bound.
+        seed : int, optional
+            Seed of the hash functions.
+        '''
+
+        self.bits = max(1, int(np.ceil(np.log2(np.e / epsilon))))
+        self.width = 1 << self.bits
+        self.depth = max(1, int(np.ceil(np.log(1 / delta))))
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        # Odd multipliers and offsets of the multiply-shift hashes.
+        self._a = rng.randint(0, 2 ** 63, self.depth, dtype=np.uint64) * \
+            np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 2 ** 63, self.depth, dtype=np.uint64)
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    @property
+    def epsilon(self):
+        '''Actual overcount bound relative to the total.'''
+
+        return np.e / self.width
+
+    def _cells(self, keys):
+        # Flat table indices, one row of cells per hash function.
+        shift = np.uint64(64 - self.bits)
+        columns = (self._a[:, None] * keys[None, :] + self._b[:, None]) \
+            >> shift
+        rows = np.arange(self.depth, dtype=np.int64)[:, None] * self.width
+
+        return rows + columns.astype(np.int64)
+
+    def add(self, keys, counts):
+        '''Adds counts to hashed keys.
+
+        Parameters
+        ----------
+        keys : array
+            uint64 keys given by token_keys.
+        counts : array
+            Count to add to every key.
+        '''
+
+        counts = np.asarray(counts, dtype=np.int64)
+        np.add.at(self.table.reshape(-1), self._cells(keys).ravel(),
+                  np.tile(counts, self.depth))
+        self.total += int(counts.sum())
+
+    def estimate(self, keys):
+        '''Returns the int64 frequency estimates of hashed keys.
+
+        Parameters
+        ----------
+        keys : array
+            uint64 keys given by token_keys.
+        '''
+
+        return self.table.reshape(-1)[self._cells(keys)].min(axis=0)
+
+    def merge(self, other):
+        '''Adds the counts of a sketch of the same shape and seed.
+
+        Parameters
+        ----------
+        other : CountMinSketch
+            Sketch to merge into this one.
+        '''
+
+        if (other.width, other.depth, other.seed) != \
+                (self.width, self.depth, self.seed):
+            raise ValueError('Cannot merge sketches of different shapes '
+                             'or seeds')
+        self.table += other.table
+        self.total += other.total
+
+    def distinct(self):
+        '''Estimates the number of distinct keys added by linear counting
+        over the first row, accurate up to several times the width.'''
+
+        zeros = int(np.count_nonzero(self.table[0] == 0))
+
+        return int(round(-self.width * np.log(max(zeros, 1) / self.width)))
+
+
+class SpaceSaving:
+    '''
+    The capacity most frequent tokens of a stream, after Metwally et
+    al., with weighted updates.
+
+    When a new token arrives and the summary is full, it replaces the
+    token with the minimum count and inherits that count as its error.
+    The minimum is found with a lazy heap whose entries are refreshed
+    when found stale, counts only grow.
+
+    Attributes
+    ----------
+    capacity : int
+        Maximum number of tokens kept.
+    counts : dict
+        Count upper bound of every kept token.
+    errors : dict
+        Maximum overcount of every kept token.
+
+    Methods
+    -------
+    update(tokens, counts)
+        Adds counts to tokens.
+    minimum()
+        Returns the smallest kept count.
+    merge(other)
+        Adds the tokens of another summary.
+    '''
+
+    def __init__(self, capacity=100000):
+        '''
+        Parameters
+        ----------
+        capacity : int, optional
+            Maximum number of tokens kept.
+        '''
+
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _pop_minimum(self):
+        # Refreshes stale entries until the top holds a current count.
+        heap, counts = self._heap, self.counts
+        while True:
+            count, token = heap[0]
+            if counts[token] == count:
+                return heapq.heappop(heap)
+            heapq.heapreplace(heap, (counts[token], token))
+
+    def minimum(self):
+        '''Returns the smallest kept count, 0 while not full.'''
+
+        if len(self.counts) < self.capacity:
+            return 0
+        heap, counts = self._heap, self.counts
+        while counts[heap[0][1]] != heap[0][0]:
+            heapq.heapreplace(heap, (counts[heap[0][1]], heap[0][1]))
+
+        return heap[0][0]
+
+    def update(self, tokens, counts):
+        '''Adds counts to tokens.
+
+        Parameters
+        ----------
+        tokens : iterable
+            Tokens, each one once.
+        counts : iterable
+            Count to add to every token.
+        '''
+
+        kept, errors, heap = self.counts, self.errors, self._heap
+        for token, count in zip(tokens, counts):
+            if token in kept:
+                kept[token] += count
+            elif len(kept) < self.capacity:
+                kept[token] = count
+                errors[token] = 0
+                heapq.heappush(heap, (count, token))
+            else:
+                floor, victim = self._pop_minimum()
+                del kept[victim], errors[victim]
+                kept[token] = floor + count
+                errors[token] = floor
+                heapq.heappush(heap, (floor + count, token))
+
+    def merge(self, other):
+        '''Adds the tokens of another summary, keeping the capacity
+        largest counts. A token missing from one summary counts as its
+        minimum, so the counts remain upper bounds.
+
+        Parameters
+        ----------
+        other : SpaceSaving
+            Summary to merge into this one.
+        '''
+
+        floor, other_floor = self.minimum(), other.minimum()
+        counts, errors = {}, {}
+        for token in set(self.counts) | set(other.counts):
+            counts[token] = self.counts.get(token, floor) + \
+                other.counts.get(token, other_floor)
+            errors[token] = self.errors.get(token, floor) + \
+                other.errors.get(token, other_floor)
+
+        kept = heapq.nlargest(self.capacity, counts.items(),
+                              key=lambda item: item[1])
+        self.counts = dict(kept)
+        self.errors = {token: errors[token] for token in self.counts}
+        self._heap = [(count, token) for token, count in kept]
+        heapq.heapify(self._heap)
+
+
+class ApproximateCounter:
+    '''
+    Counter of tokens in fixed memory, a drop-in for the Vocabulary of
+    the counting paths.
+
+    Attributes
+    ----------
+    sketch : CountMinSketch
+        Frequency estimates of every token.
+    heavy : SpaceSaving
+        Most frequent tokens.
+    buffer_size : int
+        Distinct pending tokens that trigger a flush.
+
+    Methods
+    -------
+    add(tokens)
+        Counts tokens.
+    update(other)
+        Counter.update for tokens, mappings and counters.
+    merge(other)
+        Adds the counts of another counter.
+    flush()
+        Folds the pending tokens into the summaries.
+    get(token, default=0)
+        Returns the frequency estimate of a token.
+    most_common(n=None)
+        Returns the n most frequent kept tokens and their counts.
+    distinct()
+        Estimates the number of distinct tokens counted.
+    bounds()
+        Returns the error bounds of the estimates.
+    '''
+
+    def __init__(self, tokens=(), epsilon=1e-4, delta=1e-3,
+                 capacity=100000, seed=0, buffer_size=1 << 16):
+        '''
+        Parameters
+        ----------
+        tokens : iterable, optional
+            Tokens to count, or a mapping of tokens to frequencies.
+        epsilon : float, optional
+            Bound of the frequency overcount relative to the total.
+        delta : float, optional
+            Probability of exceeding the bound.
+        capacity : int, optional
+            Number of most frequent tokens kept.
+        seed : int, optional
+            Seed of the hash functions.
+        buffer_size : int, optional
+            Distinct pending tokens that trigger a flush.
+        '''
+
+        self.sketch = CountMinSketch(epsilon, delta, seed)
+        self.heavy = SpaceSaving(capacity)
+        self.buffer_size = buffer_size
+        self._pending = Counter()
+        self.update(tokens)
+
+    def __len__(self):
+        self.flush()
+        return len(self.heavy)
+
+    def __iter__(self):
+        self.flush()
+        return iter(list(self.heavy.counts))
+
+    def __contains__(self, token):
+        self.flush()
+        return token in self.heavy.counts
+
+    def __getitem__(self, token):
+        return self.get(token)
+
+    def __getstate__(self):
+        self.flush()
+        return self.__dict__.copy()
+
+    @property
+    def total(self):
+        '''Number of tokens counted.'''
+
+        self.flush()
+        return self.sketch.total
+
+    @property
+    def words(self):
+        '''Kept tokens, as an object array aligned with counts.'''
+
+        self.flush()
+        return np.array(list(self.heavy.counts), dtype=object)
+
+    @property
+    def counts(self):
+        '''Frequency estimates of the kept tokens.'''
+
+        self.flush()
+        tokens = list(self.heavy.counts)
+        upper = np.fromiter(self.heavy.counts.values(), dtype=np.int64,
+                            count=len(tokens))
+
+        return np.minimum(upper, self.sketch.estimate(token_keys(tokens)))
+
+    def _add_counts(self, tokens, counts):
+        tokens = list(tokens)
+        self.sketch.add(token_keys(tokens), np.asarray(counts,
+                                                       dtype=np.int64))
+        self.heavy.update(tokens, counts)
+
+    def flush(self):
+        '''Folds the pending tokens into the summaries.'''
+
+        if self._pending:
+            pending, self._pending = self._pending, Counter()
+            self._add_counts(pending.keys(), list(pending.values()))
+
+    def add(self, tokens):
+        '''Counts tokens.
+
+        Parameters
+        ----------
+        tokens : iterable
+            Tokens to count.
+        '''
+
+        self._pending.update(tokens)
+        if len(self._pending) >= self.buffer_size:
+            self.flush()
+
+    def merge(self, other):
+        '''Adds the counts of a counter built with the same parameters.
+
+        Parameters
+        ----------
+        other : ApproximateCounter
+            Counter to merge into this one.
+        '''
+
+        self.flush()
+        other.flush()
+        self.sketch.merge(other.sketch)
+        self.heavy.merge(other.heavy)
+
+    def update(self, other):
+        '''Counts tokens like Counter.update.
+
+        Parameters
+        ----------
+        other : iterable
+            An ApproximateCounter, a Vocabulary, a mapping of tokens to
+            frequencies or an iterable of tokens.
+        '''
+
+        if isinstance(other, list):
+            self.add(other)
+        elif isinstance(other, ApproximateCounter):
+            self.merge(other)
+        elif isinstance(other, Vocabulary):
+            self.flush()
+            self._add_counts(other.words.tolist(), other.counts.tolist())
+        elif isinstance(other, Mapping):
+            self.flush()
+            self._add_counts(other.keys(), list(other.values()))
+        else:
+            self.add(other)
+
+    def get(self, token, default=0):
+        '''Returns the frequency estimate of a token, or default when it
+        was never counted.
+
+        Parameters
+        ----------
+        token : str
+            Token to look up.
+        default : int, optional
+            Value for tokens never counted.
+        '''
+
+        self.flush()
+        count = int(self.sketch.estimate(token_keys([token]))[0])
+        count = min(count, self.heavy.counts.get(token, count))
+
+        return count or default
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return self.counts.tolist()
+
+    def items(self):
+        return zip(self.words.tolist(), self.values())
+
+    def most_common(self, n=None):
+        '''Returns the n most frequent kept tokens with their estimated
+        counts.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of tokens, all the kept ones by default.
+        '''
+
+        counts = self.counts
+        order = np.argsort(-counts, kind='stable')[:n]
+
+        return list(zip(self.words[order].tolist(), counts[order].tolist()))
+
+    def distinct(self):
+        '''Estimates the number of distinct tokens counted.'''
+
+        self.flush()
+        return self.sketch.distinct()
+
+    def bounds(self):
+        '''Returns a dict with the guaranteed error bounds: the sketch
+        overcount with its probability of being exceeded, and the count
+        above which a token is always kept.'''
+
+        total = self.total
+        return {'total': total,
+                'overcount': self.sketch.epsilon * total,
+                'probability': float(np.exp(-self.sketch.depth)),
+                'heavy_threshold': total / self.heavy.capacity}
@@ -0,0 +1,249 @@
+''' Solvers for the TextRank equation.
+
+TextRank ranks are the fixed point of x = (1 - d) + d * G x, with G the
+column normalized graph matrix and d the damping coefficient. This module
+solves it with the power method, stopping on the L1 or L-infinity norm of
+the fixed point residual, and optionally accelerates it by extrapolating
+from the last iterates every few steps:
+
+- aitken: vector Aitken delta squared over three iterates, the ratio of
+  the steps is taken from the whole step vectors.
+- quadratic: minimal polynomial extrapolation of degree two over four
+  iterates, the quadratic extrapolation of Kamvar et al. for PageRank.
+
+An extrapolation is stepped in the same product as the plain iterate and
+replaces it only when its residual is lower, so an extrapolating solve
+does not need more iterations than the power method.
+
+The teleport term 1 - d can be replaced by (1 - d) * t for a teleport
+vector t, which biases the ranks towards the nodes where t is large, the
+personalized PageRank. solve_batch solves many teleport vectors at once
+with one matrix-matrix product per iteration over the shared graph, and
+drops every column from the product as soon as it converges.
+
+Every solver reports the iterations, the matrix-vector products and the
+final residual.
+
+'''
+
+from collections import deque, namedtuple
+import numpy as np
+
+SolverResult = namedtuple('SolverResult',
+                          ['x', 'iterations', 'residual', 'matvecs'])
+BatchResult = namedtuple('BatchResult',
+                         ['x', 'iterations', 'residuals', 'matvecs'])
+
+METHODS = ('power', 'aitken', 'quadratic')
+NORMS = ('l1', 'linf')
+
+
+def residual_norm(v, norm='l1'):
+    '''Returns the L1 or L-infinity norm of a vector.
+
+    Parameters
+    ----------
+    v : array
+        Input vector or matrix, columns are reduced separately.
+    norm : str, optional
+        'l1' or 'linf'.
+    '''
+
+    if norm == 'l1':
+        return np.abs(v).sum(axis=0)
+    if norm == 'linf':
+        return np.abs(v).max(axis=0, initial=0.0)
+
+    raise ValueError(f'Unknown norm {norm}')
+
+
+def aitken(history):
+    '''Returns the vector Aitken extrapolation of the last three iterates,
+    None when it is not defined.
+
+    The ratio between consecutive steps is estimated from the whole step
+    vectors, so the extrapolation removes the slowest decaying component
+    of the error, not a ratio of each component on its own.
+
+    Parameters
+    ----------
+    history : sequence
+        Previous iterates, the last three are used.
+    '''
+
+    x0, x1, x2 = list(history)[-3:]
+    previous, last = x1 - x0, x2 - x1
+    scale = previous.dot(previous)
+    if scale < 1e-300:
+        return None
+
+    ratio = last.dot(previous) / scale
+    if not abs(ratio) < 1.0:
+        return None
+
+    return x2 + ratio / (1.0 - ratio) * last
+
+
+def quadratic(history):
+    '''Returns the degree two minimal polynomial extrapolation of the
+    last four iterates, None when it is not defined.
+
+    Parameters
+    ----------
+    history : sequence
+        Previous iterates, the last four are used.
+    '''
+
+    x = list(history)[-4:]
+    u = [x[i + 1] - x[i] for i in range(3)]
+    coefficients = np.linalg.lstsq(np.column_stack(u[:2]), -u[2],
+                                   rcond=None)[0]
+    gamma = np.append(coefficients, 1.0)
+    total = gamma.sum()
+    if abs(total) < 1e-12:
+        return None
+
+    result = sum(g * xi for g, xi in zip(gamma / total, x[1:]))
+    if not np.all(np.isfinite(result)):
+        return None
+
+    return result
+
+
+EXTRAPOLATIONS = {'aitken': (3, aitken), 'quadratic': (4, quadratic)}
+
+
+def solve(g_matrix, d=0.85, tol=1e-5, max_iter=100, method='power',
+          norm='l1', x0=None, period=10, teleport=None):
+    '''Solves x = (1 - d) * t + d * G x iteratively, t being the teleport
+    vector, all ones by default.
+
+    Stops when the norm of the change made by one step, which is the
+    residual of the fixed point equation, is below tol.
+
+    Parameters
+    ----------
+    g_matrix : array or sparse matrix
+        Column normalized graph matrix.
+    d : float, optional
+        Damping coefficient.
+    tol : float, optional
+        Residual tolerance.
+    max_iter : int, optional
+        Maximum number of iterations.
+    method : str, optional
+        'power', 'aitken' or 'quadratic'.
+    norm : str, optional
+        'l1' or 'linf'.
+    x0 : array, optional
+        Starting vector, all ones by default.
+    period : int, optional
+        Iterations between extrapolations.
+    teleport : array, optional
+        Teleport vector, all ones by default.
+    '''
+
+    if method not in METHODS:
+        raise ValueError(f'Unknown solver {method}')
+    if norm not in NORMS:
+        raise ValueError(f'Unknown norm {norm}')
+
+    n = g_matrix.shape[0]
+    x = np.ones(n, dtype='float') if x0 is None else \
+        np.array(x0, dtype='float')
+    depth, extrapolate = EXTRAPOLATIONS.get(method, (1, None))
+    history = deque([x], maxlen=depth)
+    residual = np.inf
+    iterations = 0
+    base = (1 - d) if teleport is None else \
+        (1 - d) * np.asarray(teleport, dtype='float')
+    matvecs = 0
+
+    for iterations in range(1, max_iter + 1):
+        extrapolated = None
+        if extrapolate and iterations % period == 0 and \
+                len(history) == depth:
+            extrapolated = extrapolate(history)
+
+        if extrapolated is None:
+            x_next = base + d * g_matrix.dot(x)
+            residual = float(residual_norm(x_next - x, norm))
+            matvecs += 1
+        else:
+            # Steps from the iterate and from its extrapolation in one
+            # product, the extrapolation is kept only when its residual
+            # is lower.
+            pair = np.column_stack((x, extrapolated))
+            steps = np.reshape(base, (-1, 1)) + d * g_matrix.dot(pair)
+            residuals = residual_norm(steps - pair, norm)
+            matvecs += 2
+            kept = int(residuals[1] < residuals[0])
+            if kept:
+                history.clear()
+                history.append(extrapolated)
+            x_next = steps[:, kept]
+            residual = float(residuals[kept])
+
+        x = x_next
+        if residual < tol:
+            break
+        history.append(x)
+
+    return SolverResult(x, iterations, residual, matvecs)
+
+
+def solve_batch(g_matrix, teleport, d=0.85, tol=1e-5, max_iter=100,
+                norm='l1', x0=None):
+    '''Solves X = (1 - d) * T + d * G X for every column of a teleport
+    matrix T with the power method.
+
+    Every iteration multiplies the graph by the columns that have not
+    converged yet, a column stops as soon as the norm of its own step is
+    below tol, so each column gets the same result as a separate solve.
+
+    Parameters
+    ----------
+    g_matrix : array or sparse matrix
+        Column normalized graph matrix.
+    teleport : array
+        Teleport vectors as the columns of an n x k matrix.
+    d : float, optional
+        Damping coefficient.
+    tol : float, optional
+        Residual tolerance of every column.
+    max_iter : int, optional
+        Maximum number of iterations.
+    norm : str, optional
+        'l1' or 'linf'.
+    x0 : array, optional
+        Starting n x k matrix, all ones by default.
+    '''
+
+    if norm not in NORMS:
+        raise ValueError(f'Unknown norm {norm}')
+
+    teleport = np.asarray(teleport, dtype='float')
+    if teleport.ndim == 1:
+        teleport = teleport[:, None]
+    n, k = teleport.shape
+    x = np.ones((n, k), dtype='float') if x0 is None else \
+        np.array(x0, dtype='float').reshape(n, k)
+    base = (1 - d) * teleport
+    iterations = np.zeros(k, dtype=np.int64)
+    residuals = np.full(k, np.inf)
+    active = np.arange(k)
+    matvecs = 0
+
+    for step in range(1, max_iter + 1):
+        if not len(active):
+            break
+        x_active = x[:, active]
+        x_next = base[:, active] + d * g_matrix.dot(x_active)
+        residual = residual_norm(x_next - x_active, norm)
+        x[:, active] = x_next
+        residuals[active] = residual
+        iterations[active] = step
+        matvecs += len(active)
+        active = active[residual >= tol]
+
+    return BatchResult(x, iterations, residuals, matvecs)
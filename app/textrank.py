@@ -9,24 +9,29 @@ Processing.
 
 # import pdb
 import os
+import json
+import argparse
 import logging
 import itertools
-import json
-import bz2
-import nltk
 import operator
 import zipfile
 import numpy as np
 import re
 import contractions
 from string import punctuation
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords, words
 from collections import OrderedDict, Counter
-
-# Logging configuration.
-logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.DEBUG)
-logging.debug('==== Words processing with TextRank over Reddit datasets ====')
+from collections.abc import Mapping
+from app.ingest import (parallel_count, pipelined_count, count_chunk,
+                        open_lines, line_range, word_tokenizer,
+                        tokenize_text, DomainFilter)
+from app.vectorstore import EmbeddingStore
+from app.lexicon import Lexicon
+from app.vocabulary import Vocabulary
+from app.sketch import ApproximateCounter
+from app.corpus import CorpusStore
+from app.search import IndexBuilder, InvertedIndex
+from app import solvers
+from app.instrument import get_recorder, recording
 
 
 def print_dict(my_dict):
@@ -48,13 +53,126 @@ def print_dict(my_dict):
 def symmetrize(a):
     '''Utility method to symmetrice a given square matrix.
 
+    Works for both dense numpy arrays and scipy sparse matrices, the
+    sparse input is never densified.
+
+    Parameters
+    ----------
+    a : array or sparse matrix
+        Numpy or scipy input matrix.
+    '''
+
+    import scipy.sparse as sp
+    if sp.issparse(a):
+        return (a + a.T - sp.diags(a.diagonal())).tocsr()
+
+    return a + a.T - np.diag(a.diagonal())
+
+
+def normalize_columns(a):
+    '''Utility method to divide every column of a matrix by its sum.
+
+    Columns adding up to zero (words without any edge) are left as zeros.
+    Sparse matrices are scaled through a diagonal matrix product, so only
+    the stored values are touched.
+
+    Parameters
+    ----------
+    a : array or sparse matrix
+        Numpy or scipy input matrix.
+    '''
+
+    norm = np.asarray(a.sum(axis=0), dtype='float').ravel()
+    inverse = np.zeros_like(norm)
+    np.divide(1.0, norm, out=inverse, where=norm != 0)
+
+    import scipy.sparse as sp
+    if sp.issparse(a):
+        return a.dot(sp.diags(inverse)).tocsr()
+
+    return a * inverse
+
+
+def unit_rows(a):
+    '''Utility method to scale every row of a matrix to unit length.
+
+    Rows of zeros, such as words missing from the vector model, are
+    left as zeros.
+
     Parameters
     ----------
     a : array
         Numpy input matrix.
     '''
 
-    return a + a.T - np.diag(a.diagonal())
+    a = np.asarray(a, dtype='float32')
+    norms = np.linalg.norm(a, axis=1, keepdims=True)
+    return np.divide(a, norms, out=np.zeros_like(a), where=norms != 0)
+
+
+def knn_graph(embeddings, k=10, block_size=256):
+    '''Returns a sparse symmetric graph linking every row of a matrix of
+    embeddings with its k most similar rows by cosine similarity.
+
+    Similarities are computed one block of rows at a time with a matrix
+    product, and only the top k of each row are kept, so the full N x N
+    similarity matrix never exists. Pairs with no positive similarity are
+    not linked.
+
+    Parameters
+    ----------
+    embeddings : array
+        One vector per node.
+    k : int, optional
+        Number of neighbours kept per node.
+    block_size : int, optional
+        Number of rows multiplied at a time.
+    '''
+
+    import scipy.sparse as sp
+    x = unit_rows(embeddings)
+    n = len(x)
+    k = min(k, n - 1)
+    if k <= 0:
+        return sp.csr_matrix((n, n), dtype='float')
+
+    rows, cols, data = [], [], []
+    for start in range(0, n, block_size):
+        sims = x[start:start + block_size].dot(x.T)
+        block = np.arange(start, start + len(sims))
+        # No self loops.
+        sims[np.arange(len(sims)), block] = -np.inf
+
+        neighbours = np.argpartition(sims, n - k, axis=1)[:, n - k:]
+        values = np.take_along_axis(sims, neighbours, axis=1)
+        keep = values > 0
+
+        rows.append(np.repeat(block, k)[keep.ravel()])
+        cols.append(neighbours[keep])
+        data.append(values[keep])
+
+    g = sp.coo_matrix((np.concatenate(data).astype('float'),
+                       (np.concatenate(rows), np.concatenate(cols))),
+                      shape=(n, n)).tocsr()
+
+    return g.maximum(g.T)
+
+
+def sentence_tokenizer():
+    '''Utility method returning the punkt tokenizer behind sent_tokenize.
+
+    Parameters
+    ----------
+    None.
+    '''
+
+    try:
+        # Newer nltk versions cache the tokenizer behind this helper.
+        from nltk.tokenize import _get_punkt_tokenizer
+        return _get_punkt_tokenizer('english')
+    except ImportError:
+        import nltk
+        return nltk.data.load('tokenizers/punkt/english.pickle')
 
 
 def download_stop_words():
@@ -66,6 +184,8 @@ def download_stop_words():
     None.
     '''
 
+    import nltk
+    from nltk.corpus import stopwords
     nltk.download('stopwords')
     return stopwords.words('english')
 
@@ -130,8 +250,8 @@ class Words:
 
     Attributes
     ----------
-    words_collection : Counter
-        A dict subclass for counting words.
+    words_collection : Vocabulary or ApproximateCounter
+        Interned words and their frequencies.
     text_id : str
         Json object key name.
     domain_id : str
@@ -139,18 +259,22 @@ class Words:
     topic : str
         Json object key name.
     file_path : str
-        Directory location of the source file.
+        Directory location of the source file, or of a CorpusStore.
 
     Methods
     -------
-    get_text_only(nlines=50000)
+    iter_documents(nlines=None, start=0, max_posts=None, max_bytes=None)
+        Yields the posts of the topic one at a time.
+    get_text_only(nlines=50000, start=0)
         Returns a string containing the total amount of text.
-    get_words()
-        Returns a diccionary of the words and frequencies.
+    get_words(nlines, workers=1, chunk_size=10000, start=0, pipeline=False)
+        Returns a Vocabulary of the words and frequencies.
+    index_documents(index_path, nlines=None, start=0, texts=True)
+        Counts the words and builds the BM25 index of the posts.
 
     '''
 
-    def __init__(self, file_path, topic):
+    def __init__(self, file_path, topic, counter=None):
         '''
         Parameters
         ----------
@@ -158,62 +282,185 @@ class Words:
             Path to the dataset compressed file.
         topic : str
             Reddit topic of the forum thread
+        counter : ApproximateCounter, optional
+            Bounded memory counter used instead of an exact Vocabulary.
         '''
 
         # Class member attributes.
         logging.debug('Initializing %s.', self.__class__.__name__)
-        self.words_collection = Counter()
+        self.words_collection = Vocabulary() if counter is None else \
+            counter
         self.text_id = 'selftext'
         self.domain_id = 'domain'
         self.topic = topic
         self.file_path = file_path
 
-    def get_text_only(self, nlines=50000):
-        '''Returns a string containing the total amount of text.
+    def iter_documents(self, nlines=None, start=0, max_posts=None,
+                       max_bytes=None, fields=('id',)):
+        '''Yields the posts of the topic as (id, text, metadata) tuples.
+
+        Posts are read lazily, only one of them is in memory at a time.
+        The metadata dict holds the line number, the domain and any other
+        field requested. Posts without an id get their line number. The
+        posts come from the CorpusStore of the dump when it has one that
+        holds the fields requested.
 
-        By default it parses 50000 lines of texts.
         Parameters
         ----------
         nlines : int, optional
-            Number of lines to parse.
+            Number of lines to parse, all of them by default.
+        start : int, optional
+            First line to parse.
+        max_posts : int, optional
+            Stop after this many posts.
+        max_bytes : int, optional
+            Stop before the UTF-8 size of the texts yielded exceeds this.
+        fields : tuple, optional
+            Json object key names read into the metadata.
         '''
 
-        # Empty string object as a container for the text.
-        text_total = ''
+        recorder = get_recorder()
+        nposts = nbytes = 0
+
+        for number, text, dataset in self._iter_posts(nlines, start,
+                                                      fields):
+            recorder.count('lines_matched')
+
+            if max_bytes is not None:
+                nbytes += len(text.encode('utf-8'))
+                if nbytes > max_bytes:
+                    return
+
+            metadata = {field: dataset.get(field) for field in fields}
+            metadata.update(line=number, domain=self.topic)
+            yield metadata.pop('id', None) or number, text, metadata
+
+            nposts += 1
+            if max_posts is not None and nposts >= max_posts:
+                return
+
+    def _iter_posts(self, nlines, start, fields):
+        # Yields (line, text, fields) of the posts, from a store if any.
+        recorder = get_recorder()
+        store = CorpusStore.find(self.file_path, self.domain_id,
+                                 self.text_id)
+        if store is not None and set(fields) <= set(store.fields):
+            yield from recorder.timed(store.documents(
+                self.topic, *line_range(start, nlines), fields), 'corpus')
+            return
+
+        posts = DomainFilter(self.topic, self.domain_id, self.text_id,
+                             fields)
+        parse = recorder.wrap(posts.parse, 'json')
+        lines = open_lines(self.file_path, *line_range(start, nlines),
+                           binary=True)
+        for number, line in enumerate(
+                recorder.timed(lines, 'bz2', 'lines_read'), start):
+            dataset = parse(line)
+            if dataset is not None:
+                yield number, dataset[self.text_id], dataset
+
+    def get_text_only(self, nlines=50000, start=0):
+        '''Returns a string containing the total amount of text.
 
-        with bz2.open(self.file_path, 'rt') as reddit_file:
-            for line in itertools.islice(reddit_file, 0, nlines):
-                dataset = json.loads(line)
-                if (dataset[self.domain_id] == self.topic):
-                    text = dataset[self.text_id]
-                    text_total += text
+        By default it parses 50000 lines of texts. The posts are glued
+        without separator, prefer iter_documents for large inputs.
+        Parameters
+        ----------
+        nlines : int, optional
+            Number of lines to parse.
+        start : int, optional
+            First line to parse, cheap to skip when the dump is indexed.
+        '''
 
-        return text_total
+        return ''.join(text for _, text, _ in
+                       self.iter_documents(nlines, start, fields=()))
 
-    def get_words(self, nlines):
+    def get_words(self, nlines, workers=1, chunk_size=10000, start=0,
+                  pipeline=False):
         '''Returns a dictionary where they keys are the words
         in the text and the values are their frequencies.
 
         It updates the words_collection datamember with they key,
         value pairs obtained in the iterations over the text lines.
+        With more than one worker the lines are tokenized and counted
+        in a process pool, giving the same counts as the serial path.
+        When the dump has a CorpusStore the posts of the topic are read
+        from it instead and the other options are ignored.
 
         Parameters
         ----------
         nlines: int, optional
             Number of lines to parse.
+        workers: int, optional
+            Number of worker processes, 1 runs in the current process.
+        chunk_size: int, optional
+            Number of lines handed to a worker at a time.
+        start: int, optional
+            First line to parse, used to resume an interrupted scan.
+        pipeline: bool, optional
+            Overlap decompression, tokenizing and counting as stages of
+            a pipeline, tokenizing in a thread or in the worker
+            processes.
+        '''
+
+        store = CorpusStore.find(self.file_path, self.domain_id,
+                                 self.text_id)
+        if store is not None:
+            return store.count(self.topic, *line_range(start, nlines),
+                               self.words_collection)
+        if pipeline:
+            return pipelined_count(self.file_path, self.topic, nlines,
+                                   workers, chunk_size,
+                                   processes=workers > 1,
+                                   domain_id=self.domain_id,
+                                   text_id=self.text_id, start=start,
+                                   counter=self.words_collection)
+        if workers > 1:
+            return parallel_count(self.file_path, self.topic, nlines,
+                                  workers, chunk_size, self.domain_id,
+                                  self.text_id, start,
+                                  self.words_collection)
+
+        lines = open_lines(self.file_path, *line_range(start, nlines),
+                           binary=True)
+        count_chunk(get_recorder().timed(lines, 'bz2', 'lines_read'),
+                    self.topic, self.domain_id, self.text_id,
+                    self.words_collection)
+
+        return self.words_collection
+
+    def index_documents(self, index_path, nlines=None, start=0,
+                        texts=True):
+        '''Counts the words of the posts like get_words and builds their
+        BM25 inverted index in the same pass, returning the index.
+
+        Parameters
+        ----------
+        index_path : str
+            Directory of the index.
+        nlines : int, optional
+            Number of lines to parse, all of them by default.
+        start : int, optional
+            First line to parse.
+        texts : bool, optional
+            Keep the texts of the posts in the index.
         '''
 
-        with bz2.open(self.file_path, 'rt') as reddit_file:
-            for line in itertools.islice(reddit_file, 0, nlines):
-                dataset = json.loads(line)
-                if (dataset[self.domain_id] == self.topic):
-                    text = dataset[self.text_id]
-                    tokens = word_tokenize(text)
-                    tokens = [word for word in tokens if word.isalpha()]
-                    tokens = [word.lower() for word in tokens]
-                    self.words_collection.update(tokens)
+        recorder = get_recorder()
+        tokenize = recorder.wrap(tokenize_text, 'nltk')
+        builder = IndexBuilder(texts)
+
+        for post_id, text, metadata in self.iter_documents(nlines, start):
+            words = tokenize(text)
+            self.words_collection.update(words)
+            builder.add(words, metadata['line'], post_id, text)
+            recorder.count('tokens', len(words))
 
-            return self.words_collection
+        with recorder.timer('index'):
+            return builder.save(index_path, meta={
+                'source': os.path.abspath(self.file_path),
+                'topic': self.topic, 'start': start, 'nlines': nlines})
 
 
 class VectorRepr:
@@ -225,9 +472,14 @@ class VectorRepr:
     algorithm. We will use this class to find the vector for each
     word in our data according with the vector model used by TextRank.
 
+    The vectors are read from a binary EmbeddingStore, memory-mapped the
+    first time glove_vectors is used. The store is converted from the
+    extracted text model when it does not exist yet.
+
     Attributes
     ----------
-    None.
+    glove_vectors : EmbeddingStore
+        Word vector model, loaded on first access.
 
     Methods
     -------
@@ -235,6 +487,8 @@ class VectorRepr:
         Extracts the contents of the GloVe zip file.
     load_glove_vectors()
         Loads the glove vector model (GloVe) into memory.
+    convert_glove(dtype='float32')
+        Converts the extracted text model into the binary store.
     '''
 
     # Static class members.
@@ -243,17 +497,31 @@ class VectorRepr:
     GLOVE_DIR = '../resources/glove/'
     GLOVE_ZIP = GLOVE_DIR + 'glove.6B.zip'
     glove_vectors_file = GLOVE_DIR + 'glove.6B.50d.txt'
+    glove_store_prefix = GLOVE_DIR + 'glove.6B.50d'
 
-    def __init__(self):
+    def __init__(self, store_prefix=None):
         '''
         Parameters
         ----------
-        None.
+        store_prefix : str, optional
+            Path prefix of the binary store, glove_store_prefix by default.
         '''
 
         logging.debug('Initializing %s.', self.__class__.__name__)
-        # Load the glove vectors at initialization time.
-        self.glove_vectors = VectorRepr.load_glove_vectors()
+        self.store_prefix = store_prefix or self.glove_store_prefix
+        self._glove_vectors = None
+
+    @property
+    def glove_vectors(self):
+        # Memory-map the binary store at first use.
+        if self._glove_vectors is None:
+            if os.path.exists(self.store_prefix +
+                              EmbeddingStore.VECTORS_SUFFIX):
+                self._glove_vectors = EmbeddingStore.load(self.store_prefix)
+            else:
+                self._glove_vectors = self.convert_glove()
+
+        return self._glove_vectors
 
     def load_zip(self):
         logging.debug('Loading Glove vector model.')
@@ -261,6 +529,22 @@ class VectorRepr:
         zip_ref.extractall(self.GLOVE_DIR)
         zip_ref.close()
 
+    def convert_glove(self, dtype='float32'):
+        '''Converts the extracted text model into the binary store,
+        extracting the zip file first when needed.
+
+        Parameters
+        ----------
+        dtype : str, optional
+            Storage type of the vectors, float32 or float16.
+        '''
+
+        if not os.path.exists(self.glove_vectors_file):
+            self.load_zip()
+
+        return EmbeddingStore.convert(self.glove_vectors_file,
+                                      self.store_prefix, dtype)
+
     @staticmethod
     def load_glove_vectors():
         '''Loads the contents of the glove pre-trained model into memory.
@@ -286,6 +570,137 @@ class VectorRepr:
         return model
 
 
+class TokenPairCounter:
+    '''Accumulates co-occurring word id pairs as packed int64 keys.
+
+    Each directed pair (i, j) is stored as ``i << 32 | j``. New keys are
+    buffered in numpy chunks and folded into a sorted array of unique
+    keys and counts with ``np.unique`` once the buffer is full, so the
+    cost of adding a pair is constant and duplicates never pile up.
+
+    Attributes
+    ----------
+    keys : array
+        Sorted unique packed pair keys.
+    counts : array
+        Number of co-occurrences of every key.
+    buffer_size : int
+        Number of pending keys that triggers a compaction.
+
+    Methods
+    -------
+    add_sentence(ids, window_size)
+        Adds the window pairs of a sentence of word ids.
+    add_counts(keys, counts)
+        Adds the counts of packed pair keys.
+    compact()
+        Merges the pending keys into the unique arrays.
+    edges()
+        Returns the rows, columns and counts of the pairs.
+    '''
+
+    ID_BITS = 32
+    ID_MASK = (1 << ID_BITS) - 1
+
+    def __init__(self, buffer_size=1 << 20):
+        '''
+        Parameters
+        ----------
+        buffer_size : int, optional
+            Number of pending keys that triggers a compaction.
+        '''
+
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.buffer_size = buffer_size
+        self._pending = []
+        self._pending_size = 0
+
+    def __len__(self):
+        self.compact()
+        return len(self.keys)
+
+    def add_keys(self, keys):
+        '''Buffers an array of packed pair keys.
+
+        Parameters
+        ----------
+        keys : array
+            Packed int64 pair keys.
+        '''
+
+        if not len(keys):
+            return
+
+        self._pending.append(keys)
+        self._pending_size += len(keys)
+
+        if self._pending_size >= self.buffer_size:
+            self.compact()
+
+    def add_sentence(self, ids, window_size):
+        '''Adds every pair of words closer than window_size positions.
+
+        Matches the pairs walked by the original TextRank loop: each word
+        is paired with the window_size - 1 words that follow it.
+
+        Parameters
+        ----------
+        ids : list
+            Word ids of the sentence, in order.
+        window_size : int
+            Word window size.
+        '''
+
+        ids = np.asarray(ids, dtype=np.int64)
+
+        for offset in range(1, min(window_size, len(ids))):
+            self.add_keys((ids[:-offset] << self.ID_BITS) | ids[offset:])
+
+    def add_counts(self, keys, counts):
+        '''Adds the counts of packed pair keys, as held by another
+        counter.
+
+        Parameters
+        ----------
+        keys : array
+            Packed int64 pair keys, repetitions are summed.
+        counts : array
+            Number of co-occurrences of every key.
+        '''
+
+        self.compact()
+        self._fold(np.concatenate([self.keys, keys]),
+                   np.concatenate([self.counts, counts]))
+
+    def _fold(self, keys, counts):
+        # Sums the counts of equal keys into the sorted unique arrays.
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=counts,
+                                  minlength=len(self.keys)).astype(np.int64)
+
+    def compact(self):
+        '''Merges the pending keys into the sorted unique arrays.'''
+
+        if not self._pending:
+            return
+
+        self._fold(np.concatenate([self.keys] + self._pending),
+                   np.concatenate([self.counts, np.ones(self._pending_size,
+                                                        dtype=np.int64)]))
+        self._pending = []
+        self._pending_size = 0
+
+    def edges(self):
+        '''Returns the rows, columns and counts arrays of the pairs.'''
+
+        self.compact()
+        rows = self.keys >> self.ID_BITS
+        cols = self.keys & self.ID_MASK
+
+        return rows, cols, self.counts
+
+
 class TextRank:
     '''A class for the popular algorithm implementation based on PageRank.
 
@@ -296,36 +711,101 @@ class TextRank:
     d : float
         damping coefficient, usually is .85.
     min_diff : float
-        convergence threshold.
-    sentences : list
-        a list with the sentences of the text dataset of study.
+        convergence threshold on the residual norm.
+    sentences : iterable
+        the sentences of the text dataset of study, a list or a one pass
+        iterator such as TextCleaner.iter_sentences.
     steps : int
-        number of iteration steps.
+        maximum number of iteration steps.
+    solver : str
+        'power', 'aitken' or 'quadratic', see app.solvers.
+    norm : str
+        residual norm, 'l1' or 'linf'.
     window_size : int
         word window size.
     node_weight : None
         save keywords and it's weight
+    sparse : bool
+        build the graph as a scipy CSR matrix instead of a dense array.
+    weighted : bool
+        use co-occurrence counts as edge weights instead of 0/1 edges.
+    keep : iterable
+        words allowed in the graph, such as the most frequent words kept
+        by an ApproximateCounter, every word when None. Other words are
+        dropped from the sentences, which bounds the graph size.
+    vocab : Vocabulary
+        word ids and frequencies, filled on the first pass over the
+        sentences.
+    pairs : TokenPairCounter
+        co-occurring word id pairs, filled along with vocab.
+    pr : array
+        rank vector of the last iterate call, in node order.
+    iterations : int
+        number of iterations run by the last iterate call.
+    residual : float
+        residual norm reached by the last iterate call.
+    seed_names : list
+        names of the seed sets of the last iterate_personalized call.
+    personalized_pr : array
+        ranks of the last iterate_personalized call, one column per
+        seed set in node order.
+    personalized_iterations : array
+        iterations run for every seed set by iterate_personalized.
+    personalized_residuals : array
+        residual norm reached by every seed set.
 
     Methods
     -------
+    add_sentences(sentences)
+        Adds the words and pairs of sentences to the graph.
+    update(sentences)
+        Adds sentences and re-ranks starting from the previous ranks.
+    merge(other)
+        Adds the words and pairs of another graph.
+    save(path)
+        Saves the graph and the ranks.
+    load(path)
+        Restores a TextRank saved with save.
     get_vocabulary()
-        Returns an ordered dictionary of words.
+        Returns a dictionary of the words and their ids.
     get_token_pairs():
         Returns all the generated word token pairs.
+    get_pair_counter():
+        Returns the word id pairs counted into a TokenPairCounter.
     get_matrix():
         Returns the matrix representation of the words.
+    get_similarity_matrix(vectors, k=10, nodes='words'):
+        Returns a kNN graph of the word or sentence embeddings.
+    get_labels(nodes='words'):
+        Returns the names of the graph nodes.
     get_keywords():
         Print top number keywords.
     iterate():
         Performs the iterative steps.
+    teleport_matrix(seeds, labels=None):
+        Returns the teleport vectors of seed sets of words.
+    iterate_personalized(g_matrix, seeds, labels=None):
+        Ranks the graph once per seed set, all of them together.
+    get_personalized_keywords(number=50):
+        Returns the top words of every seed set.
     '''
 
-    def __init__(self, sentences):
+    # Sentences interned per vocabulary lookup.
+    BATCH_SIZE = 1024
+
+    def __init__(self, sentences, sparse=True, weighted=False):
         '''
         Parameteres
         -----------
-        sentences: list
-            A list of strings containing all the sentences.
+        sentences: iterable
+            The tokenized sentences, a list or a one pass iterator. The
+            sentence node modes need a list.
+        sparse: bool, optional
+            Use the sparse graph backend, memory then grows with the
+            number of edges instead of the vocabulary size squared. The
+            dense backend is only advisable for small inputs.
+        weighted: bool, optional
+            Weight the edges by how many times the pair co-occurs.
         '''
 
         logging.debug('Initializing %s.', self.__class__.__name__)
@@ -333,49 +813,231 @@ class TextRank:
         self.min_diff = 1e-5
         self.window_size = 4
         self.sentences = sentences
-        self.steps = 10
+        self.steps = 100
+        self.solver = 'power'
+        self.norm = 'l1'
         self.node_weight = None
+        self.sparse = sparse
+        self.weighted = weighted
+        self.keep = None
+        self.vocab = None
+        self.pairs = None
+        self.pr = None
+        self.iterations = 0
+        self.residual = None
+        self.seed_names = []
+        self.personalized_pr = None
+        self.personalized_iterations = None
+        self.personalized_residuals = None
+        self._personalized_labels = []
+
+    def add_sentences(self, sentences):
+        '''Streams sentences into the vocabulary and the pair counter.
+
+        Words get consecutive ids in order of first appearance and the
+        sentences are not kept, so memory grows with the graph only.
+        Sentences are interned in batches of BATCH_SIZE, one vocabulary
+        lookup per batch. Returns the set of ids of the words seen.
+
+        Parameters
+        ----------
+        sentences: iterable
+            Tokenized sentences.
+        '''
+
+        if self.vocab is None:
+            self.vocab = Vocabulary()
+            self.pairs = TokenPairCounter()
+
+        recorder = get_recorder()
+        sentences = iter(sentences)
+        keep = None if self.keep is None else frozenset(self.keep)
+        touched = set()
+        while True:
+            batch = list(itertools.islice(sentences, self.BATCH_SIZE))
+            if not batch:
+                break
+            if keep is not None:
+                batch = [[word for word in sentence if word in keep]
+                         for sentence in batch]
+            with recorder.timer('numpy'):
+                ids = self.vocab.add([word for sentence in batch
+                                      for word in sentence])
+                touched.update(ids)
+                start = 0
+                for sentence in batch:
+                    self.pairs.add_sentence(
+                        ids[start:start + len(sentence)], self.window_size)
+                    start += len(sentence)
+            recorder.count('tokens', len(ids))
+
+        return touched
+
+    def update(self, sentences):
+        '''Adds new sentences to the graph and re-ranks it warm started
+        from the previous rank vector.
+
+        The vocabulary and pair counter grow in place and the previous
+        ranks are reused as the starting point, new words start at 1
+        like a cold start. Returns a dict with the work done: iterations,
+        nodes_touched (words in the new sentences), new_nodes, nodes and
+        edges.
+
+        Parameters
+        ----------
+        sentences: iterable
+            Tokenized sentences to add.
+        '''
+
+        self._scan()
+        before = len(self.vocab)
+        touched = self.add_sentences(sentences)
+
+        initial = np.ones(len(self.vocab), dtype='float')
+        if self.pr is not None:
+            initial[:len(self.pr)] = self.pr
+
+        self.iterate(self.get_matrix(), initial=initial)
+
+        stats = {'iterations': self.iterations,
+                 'nodes_touched': len(touched),
+                 'new_nodes': len(self.vocab) - before,
+                 'nodes': len(self.vocab),
+                 'edges': len(self.pairs)}
+        logging.debug('TextRank update: %s', stats)
+
+        return stats
+
+    def save(self, path):
+        '''Saves the vocabulary, the pair counts and the ranks to an npz
+        file, so the graph survives between runs.
+
+        Parameters
+        ----------
+        path: str
+            Output file.
+        '''
+
+        self._scan()
+        self.pairs.compact()
+        pr = np.empty(0) if self.pr is None else self.pr
+        np.savez(path, words=np.array(list(self.vocab), dtype=str),
+                 frequencies=self.vocab.counts, keys=self.pairs.keys,
+                 counts=self.pairs.counts, pr=pr,
+                 window_size=np.array([self.window_size]))
+
+    @classmethod
+    def load(cls, path, sparse=True, weighted=False):
+        '''Restores a TextRank written by save, ready for update.
+
+        Parameters
+        ----------
+        path: str
+            Input file.
+        sparse: bool, optional
+            Use the sparse graph backend.
+        weighted: bool, optional
+            Weight the edges by how many times the pair co-occurs.
+        '''
+
+        text_rank = cls([], sparse, weighted)
+        with np.load(path) as stored:
+            text_rank.window_size = int(stored['window_size'][0])
+            text_rank.vocab = Vocabulary()
+            ids = text_rank.vocab.intern(stored['words'].tolist())
+            if 'frequencies' in stored.files:
+                text_rank.vocab.add_counts(ids, stored['frequencies'])
+            text_rank.pairs = TokenPairCounter()
+            text_rank.pairs.keys = stored['keys']
+            text_rank.pairs.counts = stored['counts']
+            if len(stored['pr']):
+                text_rank.pr = stored['pr']
+
+        return text_rank
+
+    def merge(self, other):
+        '''Adds the words and pairs of another TextRank to this graph.
+
+        Words new to this graph get ids in the order of the other one, so
+        merging graphs built from consecutive inputs gives the ids of a
+        single graph built from all of them. The ranks are not updated,
+        the previous ones remain the warm start of the next iterate.
+
+        Parameters
+        ----------
+        other: TextRank
+            Graph built with the same window size.
+        '''
+
+        self._scan()
+        other._scan()
+        if other.window_size != self.window_size:
+            raise ValueError(f'Cannot merge a window size of '
+                             f'{other.window_size} into {self.window_size}')
+
+        remap = np.array(self.vocab.intern(other.vocab.words.tolist()),
+                         dtype=np.int64)
+        self.vocab.add_counts(remap, other.vocab.counts)
+        rows, cols, counts = other.pairs.edges()
+        self.pairs.add_counts(
+            (remap[rows] << TokenPairCounter.ID_BITS) | remap[cols], counts)
+
+    def _scan(self):
+        # Single pass over the input sentences, done on first use.
+        if self.vocab is None:
+            self.add_sentences(self.sentences)
 
     def get_vocabulary(self):
-        '''Returns a dictionary containing all the words in the text.
+        '''Returns a dictionary mapping all the words in the text to
+        their ids, in order of first appearance.
+
+        The words and their frequencies are kept in the vocab Vocabulary,
+        this copy keeps the word to id mapping of earlier versions.
 
         Parameteres
         -----------
         None.
         '''
-        vocab = OrderedDict()
-        i = 0
-        for sentence in self.sentences:
-            for word in sentence:
-                if word not in vocab:
-                    vocab[word] = i
-                    i += 1
 
-        return vocab
+        self._scan()
+        return OrderedDict(zip(self.vocab.words.tolist(),
+                               range(len(self.vocab))))
 
     def get_token_pairs(self):
         '''Returns a list with all the tokens pairs formed from the
         set of all sentences in the text.
 
         According to the model there is an undirected edge between any
-        two words pair. This is a quick implementation.
+        two words pair. The pairs are kept in first-seen order and
+        deduplicated with a hash lookup.
 
         Parameters
         ----------
         None.
         '''
 
-        token_pairs = list()
+        # Dict keys as an insertion ordered set.
+        token_pairs = dict()
         for sentence in self.sentences:
             for i, word in enumerate(sentence):
                 for j in range(i+1, i+self.window_size):
                     if j >= len(sentence):
                         break
-                    pair = (word, sentence[j])
-                    if pair not in token_pairs:
-                        token_pairs.append(pair)
+                    token_pairs[(word, sentence[j])] = None
+
+        return list(token_pairs)
+
+    def get_pair_counter(self):
+        '''Returns the TokenPairCounter with the pairs of word ids, in
+        the ids given by get_vocabulary.
+
+        Parameters
+        ----------
+        None.
+        '''
 
-        return token_pairs
+        self._scan()
+        return self.pairs
 
     def get_keywords(self, number=50):
         ''' Returns the words ordered by importance.
@@ -411,60 +1073,246 @@ class TextRank:
         '''Constructs the initial transition matrix required by the model.
 
         Refer to the TextRank paper for full details. It uses numpy module
-        for matrix operations. Returns the initial matrix.
+        for matrix operations, or a scipy CSR matrix when the sparse
+        backend is enabled. Returns the initial matrix.
 
         Parameters
         ----------
         None.
         '''
 
-        vocab = self.get_vocabulary()
-        token_pairs = self.get_token_pairs()
-        vocab_size = len(vocab)
+        self._scan()
+        vocab_size = len(self.vocab)
+        recorder = get_recorder()
+
+        with recorder.timer('numpy'):
+            rows, cols, counts = self.get_pair_counter().edges()
+
+            if self.weighted:
+                data = counts.astype('float')
+            else:
+                data = np.ones(len(counts), dtype='float')
+
+            if self.sparse:
+                import scipy.sparse as sp
+                g = sp.coo_matrix((data, (rows, cols)),
+                                  shape=(vocab_size, vocab_size)).tocsr()
+            else:
+                g = np.zeros((vocab_size, vocab_size), dtype='float')
+                g[rows, cols] = data
+
+            g = normalize_columns(symmetrize(g))
+
+        recorder.set('vocabulary', vocab_size)
+        recorder.set('edges', len(counts))
+
+        return g
+
+    def get_labels(self, nodes='words'):
+        '''Returns the names of the graph nodes in matrix order.
+
+        Parameters
+        ----------
+        nodes: str, optional
+            'words' for the vocabulary or 'sentences' for the sentences
+            joined into strings.
+        '''
+
+        if nodes == 'words':
+            self._scan()
+            return self.vocab.words.tolist()
+        if nodes == 'sentences':
+            return [' '.join(sentence) for sentence in self.sentences]
+
+        raise ValueError(f'Unknown node type {nodes}')
 
-        g = np.zeros((vocab_size, vocab_size), dtype='float')
+    def get_similarity_matrix(self, vectors, k=10, nodes='words',
+                              block_size=256):
+        '''Constructs a transition matrix from embedding similarities.
 
-        for word1, word2 in token_pairs:
-            i, j = vocab[word1], vocab[word2]
-            g[i][j] = 1
+        Word nodes use the vector of every vocabulary word. Sentence nodes
+        use the average of the unit vectors of their words. Each node is
+        linked with its k most similar nodes, see knn_graph, and the
+        result is ranked with iterate like the co-occurrence matrix.
 
-        g = symmetrize(g)
+        Parameters
+        ----------
+        vectors: EmbeddingStore
+            Word vector model, such as VectorRepr().glove_vectors.
+        k: int, optional
+            Number of neighbours kept per node.
+        nodes: str, optional
+            'words' or 'sentences'.
+        block_size: int, optional
+            Number of nodes whose similarities are computed at a time.
+        '''
 
-        norm = np.sum(g, axis=0)
-        g_norm = np.divide(g, norm, where=norm != 0)
+        self._scan()
+        vocab = self.vocab
+        word_vectors = unit_rows(vectors.matrix(vocab.words.tolist()))
+
+        if nodes == 'words':
+            embeddings = word_vectors
+        elif nodes == 'sentences':
+            # Sentence by word matrix holding 1/len(sentence) weights.
+            lengths = [len(sentence) for sentence in self.sentences]
+            rows = np.repeat(np.arange(len(lengths)), lengths)
+            cols = vocab.lookup(word for sentence in self.sentences
+                                for word in sentence)
+            weights = 1.0 / np.repeat(np.maximum(lengths, 1), lengths)
+            import scipy.sparse as sp
+            averages = sp.csr_matrix((weights, (rows, cols)),
+                                     shape=(len(lengths), len(vocab)))
+            embeddings = averages.dot(word_vectors)
+        else:
+            raise ValueError(f'Unknown node type {nodes}')
 
-        return g_norm
+        return normalize_columns(knn_graph(embeddings, k, block_size))
 
-    def iterate(self, g_matrix):
-        '''Iterates to solve the TextRank equation using the power method.
+    def iterate(self, g_matrix, labels=None, initial=None):
+        '''Iterates to solve the TextRank equation using the power method,
+        or an accelerated variant chosen by the solver attribute.
 
-        Updates the value of the node_weight class member.
+        Stops when the residual norm drops below min_diff or after steps
+        iterations. Updates the value of the node_weight class member
+        and records iterations and residual.
 
         Parameters
         ----------
-        g_matrix: array
+        g_matrix: array or sparse matrix
             Initial matrix given by get_matrix method.
+        labels: list, optional
+            Names of the nodes, the vocabulary by default.
+        initial: array, optional
+            Starting rank vector, all ones by default.
         '''
 
         logging.debug('Executing the iterate method.')
-        vocab = self.get_vocabulary()
-        pr = np.array([1] * len(vocab))
-        previous_pr = 0
+        if labels is None:
+            labels = self.get_labels()
+
+        recorder = get_recorder()
+        with recorder.timer('numpy'):
+            result = solvers.solve(g_matrix, self.d, self.min_diff,
+                                   self.steps, self.solver, self.norm,
+                                   initial)
+        pr = result.x
+        logging.debug('Solved in %s iterations, residual %s.',
+                      result.iterations, result.residual)
+        recorder.count('iterations', result.iterations)
+        recorder.set('residual', result.residual)
+
+        self.iterations = result.iterations
+        self.residual = result.residual
+        self.pr = pr
+
+        # Get weight for each node, labels are in node id order.
+        self.node_weight = dict(zip(labels, pr.tolist()))
+
+    def teleport_matrix(self, seeds, labels=None):
+        '''Returns an n x k matrix with the teleport vector of every seed
+        set as a column.
+
+        A column holds the weights of the seed nodes of its set and zero
+        elsewhere, scaled to sum to the number of nodes, so a set holding
+        every node evenly gives the uniform teleport of iterate. Seeds
+        that are not nodes of the graph are ignored, and a set without
+        any node gets the uniform teleport.
 
-        for epoch in range(self.steps):
-            pr = (1-self.d) + self.d*np.dot(g_matrix, pr)
-            if abs(previous_pr - sum(pr)) < self.min_diff:
-                break
+        Parameters
+        ----------
+        seeds: mapping
+            Name of every seed set to an iterable of node labels, or to
+            a mapping of node labels to non negative weights.
+        labels: list, optional
+            Names of the nodes, the vocabulary by default.
+        '''
+
+        if labels is None:
+            labels = self.get_labels()
+        index = {label: i for i, label in enumerate(labels)}
+        n = len(labels)
+        teleport = np.zeros((n, len(seeds)), dtype='float')
+
+        for j, (name, weights) in enumerate(seeds.items()):
+            if not isinstance(weights, Mapping):
+                weights = dict.fromkeys(weights, 1.0)
+            for label, weight in weights.items():
+                i = index.get(label)
+                if i is not None:
+                    teleport[i, j] += weight
+            total = teleport[:, j].sum()
+            if total > 0:
+                teleport[:, j] *= n / total
             else:
-                previous_pr = sum(pr)
+                logging.warning('No seed of %s is in the graph, its '
+                                'teleport is uniform.', name)
+                teleport[:, j] = 1.0
+
+        return teleport
+
+    def iterate_personalized(self, g_matrix, seeds, labels=None):
+        '''Solves the TextRank equation with the teleport vector of every
+        seed set, all of them in the same iterations.
+
+        Each iteration multiplies the graph by the ranks of the sets that
+        have not converged yet, so dozens of sets cost about as much as
+        a single iterate. Sets whose ranks change less than min_diff
+        stop early. The ranks are kept in personalized_pr and the
+        iterations and residuals of every set are recorded.
+
+        Parameters
+        ----------
+        g_matrix: array or sparse matrix
+            Initial matrix given by get_matrix method.
+        seeds: mapping
+            Name of every seed set to its labels or weighted labels, see
+            teleport_matrix.
+        labels: list, optional
+            Names of the nodes, the vocabulary by default.
+        '''
 
-        # Get weight for each node
-        node_weight = dict()
+        logging.debug('Executing the iterate_personalized method with %s '
+                      'seed sets.', len(seeds))
+        if labels is None:
+            labels = self.get_labels()
+
+        recorder = get_recorder()
+        with recorder.timer('numpy'):
+            teleport = self.teleport_matrix(seeds, labels)
+            result = solvers.solve_batch(g_matrix, teleport, self.d,
+                                         self.min_diff, self.steps,
+                                         self.norm)
+        logging.debug('Solved in at most %s iterations, %s products.',
+                      result.iterations.max(initial=0), result.matvecs)
+        recorder.count('iterations', int(result.iterations.max(initial=0)))
+        recorder.count('matvecs', result.matvecs)
+
+        self.seed_names = list(seeds)
+        self.personalized_pr = result.x
+        self.personalized_iterations = result.iterations
+        self.personalized_residuals = result.residuals
+        self._personalized_labels = labels
+
+    def get_personalized_keywords(self, number=50):
+        '''Returns an ordered dict with the number top ranked words of
+        every seed set of the last iterate_personalized call, each one
+        as an ordered dict of words to weights.
+
+        Parameters
+        ----------
+        number: int, optional
+            Number of words per seed set.
+        '''
 
-        for word, index in vocab.items():
-            node_weight[word] = pr[index]
+        labels = np.array(self._personalized_labels, dtype=object)
+        keywords = OrderedDict()
+        for name, ranks in zip(self.seed_names, self.personalized_pr.T):
+            top = np.argsort(-ranks, kind='stable')[:number]
+            keywords[name] = OrderedDict(
+                zip(labels[top].tolist(), ranks[top].tolist()))
 
-        self.node_weight = node_weight
+        return keywords
 
 
 class TextCleaner:
@@ -472,37 +1320,77 @@ class TextCleaner:
 
     Attributes
     ----------
-    text_data: str
-        Input text to be cleaned.
+    text_data: str or iterable
+        Input text to be cleaned, or documents as yielded by
+        Words.iter_documents.
+    lexicon: Lexicon
+        Known words used by the dictionary stage.
 
     Methods
     -------
     clean(word):
         Removes characters from a given string.
+    iter_sentences(stages=DEFAULT_STAGES):
+        Yields the cleaned sentences of the text one at a time.
+    sentence_cleaner(stages=DEFAULT_STAGES):
+        Returns the cleaning step applied to a single text.
+    get_lexicon():
+        Returns the NLTK words lexicon, loaded once.
+    process_text_sentences():
+        Returns the list of cleaned sentences of the text.
     '''
 
     # Static class members.
     CLEAN_PATTERN = r'[^a-zA-z\s]'
-    stop_words = stopwords.words('english')
-    STOP_WORDS = set(stop_words + list(punctuation))
+    CLEAN_RE = re.compile(CLEAN_PATTERN)
+    # NLTK stopwords, loaded on first use by load_stop_words.
+    stop_words = None
+    STOP_WORDS = None
+    STOP_SET = None
     MIN_WORD_PROP, MAX_WORD_PROP = 0.1, 0.9
+    # Optional steps of the cleaning pipeline.
+    STAGES = ('contractions', 'lower', 'clean', 'stopwords', 'dictionary')
+    DEFAULT_STAGES = STAGES[:4]
+    # Shared NLTK words lexicon, see get_lexicon.
+    nltk_lexicon = None
 
-    def __init__(self, text_data):
+    def __init__(self, text_data, lexicon=None):
         '''
         Parameters
         ----------
-        text_data: str
-            Input text to be processed.
+        text_data: str or iterable
+            Input text to be processed, or an iterable of documents given
+            as strings or (id, text, metadata) tuples. Documents are split
+            into sentences one by one, never glued together.
+        lexicon: Lexicon, optional
+            Known words for the dictionary stage, the NLTK words corpus
+            by default. Domain lexicons can be merged with Lexicon.union.
         '''
 
         logging.debug('Initializing %s', self.__class__.__name__)
         self.text_data = text_data
+        self.lexicon = lexicon
+
+    def iter_texts(self):
+        '''Yields the input texts, a single one for a string input.
+
+        Parameters
+        ----------
+        None.
+        '''
+
+        if isinstance(self.text_data, str):
+            yield self.text_data
+            return
+
+        for document in self.text_data:
+            yield document if isinstance(document, str) else document[1]
 
     # Methods for text cleaning purposes.
     # Cleans the given world using regular expressions.
     @staticmethod
     def clean(word):
-        return re.sub(TextCleaner.CLEAN_PATTERN, '', word)
+        return TextCleaner.CLEAN_RE.sub('', word)
 
     # CLeans a whole sentence.
     @staticmethod
@@ -521,11 +1409,34 @@ class TextCleaner:
     def lower(sentence):
         return [word.lower() for word in sentence]
 
+    # Loads the NLTK words corpus once, cached on disk across runs.
+    @staticmethod
+    def get_lexicon():
+        if TextCleaner.nltk_lexicon is None:
+            TextCleaner.nltk_lexicon = Lexicon.from_nltk()
+        return TextCleaner.nltk_lexicon
+
+    # Loads the NLTK stopwords once, returns them as a frozenset.
+    @staticmethod
+    def load_stop_words():
+        if TextCleaner.STOP_SET is None:
+            from nltk.corpus import stopwords
+            stop_words = stopwords.words('english')
+            TextCleaner.stop_words = stop_words
+            TextCleaner.STOP_WORDS = set(stop_words + list(punctuation))
+            TextCleaner.STOP_SET = frozenset(stop_words)
+        return TextCleaner.STOP_SET
+
     # Another static cleaning method for deleting non-existant words within
     # a sentence.
     @staticmethod
     def word_in_dictionary(sentence):
-        return [word for word in sentence if word in words.words()]
+        return TextCleaner.get_lexicon().filter_sentence(sentence)
+
+    # Same as word_in_dictionary for a batch of sentences.
+    @staticmethod
+    def words_in_dictionary(sentences):
+        return TextCleaner.get_lexicon().filter_sentences(sentences)
 
     def remove_stopwords_sent(sentences):
         return [TextCleaner.remove_stopwords(sentence)
@@ -535,7 +1446,7 @@ class TextCleaner:
     @staticmethod
     def remove_stopwords(sentence):
         words = [word for word in sentence if word not
-                 in TextCleaner.stop_words]
+                 in TextCleaner.load_stop_words()]
         result = [word for word in words if len(word) > 1]
 
         return result
@@ -543,7 +1454,7 @@ class TextCleaner:
     # Tokenizes the sentences into words.
     @staticmethod
     def tokenize_words(sentences):
-        return [word_tokenize(sentence) for sentence in sentences]
+        return [word_tokenizer()(sentence) for sentence in sentences]
 
     @staticmethod
     def fix_contractions(sentences):
@@ -560,6 +1471,7 @@ class TextCleaner:
             Input set of sentences to clean.
         '''
 
+        TextCleaner.load_stop_words()
         words = [word for sentence in word_sentences
                  for word in sentence
                  if word not in TextCleaner.STOP_WORDS]
@@ -579,70 +1491,215 @@ class TextCleaner:
 
         return word_frequencies
 
-    def process_text_sentences(self):
-        '''Uses the static methods to clean the text dataset.
-
-        Operates and updates the value of the class member text_data.
+    @staticmethod
+    def split_sentences(text):
+        '''Yields the sentences of a text as sent_tokenize splits them,
+        without building the whole list first.
 
         Parameters
         ----------
-        None.
+        text: str
+            Input text.
         '''
 
-        logging.debug('Processing sentences.')
-        # Breakpoint.
-        # pdb.set_trace()
-        # Uses sent_tokenize method from nltk
-        sentences = sent_tokenize(self.text_data)
-        # Applies the previously defined static methods.
-        clean1 = TextCleaner.fix_contractions(sentences)
-        clean2 = TextCleaner.lower(clean1)
-        clean3 = TextCleaner.tokenize_words(clean2)
-        clean4 = TextCleaner.clean_sentences(clean3)
-        clean5 = TextCleaner.remove_stopwords_sent(clean4)
+        for start, end in sentence_tokenizer().span_tokenize(text):
+            yield text[start:end]
 
-        return clean5
+    def sentence_cleaner(self, stages=DEFAULT_STAGES):
+        '''Returns a function that yields the cleaned sentences of a
+        single text, the step iter_sentences applies to every text.
 
+        Useful to clean texts as they arrive from another source, such
+        as the posts of many domains read in one pass.
 
-# Main method definition.
-def main():
+        Parameters
+        ----------
+        stages: tuple, optional
+            Names of the enabled stages, a subset of STAGES.
+        '''
 
-    # Set up the directory variables.
-    # TODO build a UI for allowing the use specify this
-    # atm hardcored values.
-    current_dir = os.getcwd()
-    project_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-    source_dir = project_dir + '/resources/'
-    output_dir = project_dir + '/output/'
-    source_file_name = 'RS_2017-10.bz2'
-    output_file_name = 'ranked_words.txt'
-    source_file_path = source_dir + source_file_name
-    output_file_path = output_dir + output_file_name
+        unknown = set(stages) - set(TextCleaner.STAGES)
+        if unknown:
+            raise ValueError(f'Unknown cleaning stages {sorted(unknown)}')
+
+        fix = 'contractions' in stages
+        lower = 'lower' in stages
+        clean = 'clean' in stages
+        stop = 'stopwords' in stages
+        clean_re = TextCleaner.CLEAN_RE
+        stop_set = TextCleaner.load_stop_words() if stop else None
+        known = None
+        if 'dictionary' in stages:
+            known = self.lexicon or TextCleaner.get_lexicon()
+
+        recorder = get_recorder()
+        tokenize = recorder.wrap(word_tokenizer(), 'nltk')
+
+        def clean_text(text):
+            for sentence in recorder.timed(TextCleaner.split_sentences(text),
+                                           'nltk', 'sentences'):
+                if fix:
+                    sentence = contractions.fix(sentence)
+                if lower:
+                    sentence = sentence.lower()
+                words = tokenize(sentence)
+                if clean:
+                    words = [word for word in (clean_re.sub('', word)
+                                               for word in words)
+                             if word and word != '``']
+                if stop:
+                    words = [word for word in words
+                             if word not in stop_set and len(word) > 1]
+                if known is not None:
+                    words = known.filter_sentence(words)
+                yield words
+
+        return clean_text
+
+    def iter_sentences(self, stages=DEFAULT_STAGES):
+        '''Yields the cleaned sentences of the text one at a time.
+
+        Every sentence goes through all the enabled stages before the
+        next one is split, so memory is bounded by a single sentence.
+        With the default stages the output is the same as the static
+        methods chained by process_text_sentences. The dictionary stage
+        keeps only the words of the lexicon.
 
-    # Set up the topic of the target user posts.
-    reddit_topic = 'self.depression'
+        Parameters
+        ----------
+        stages: tuple, optional
+            Names of the enabled stages, a subset of STAGES.
+        '''
 
-    # Instance the words object with the source data file.
-    words = Words(source_file_path, reddit_topic)
+        clean_text = self.sentence_cleaner(stages)
+        for text in self.iter_texts():
+            yield from clean_text(text)
 
-    # Get a string object containing all the texts.
-    my_text = words.get_text_only()
+    def process_text_sentences(self):
+        '''Uses the static methods to clean the text dataset.
 
-    # Clean the texts using the text_cleaner object.
-    text_cleaner = TextCleaner(my_text)
-    sentences = text_cleaner.process_text_sentences()
+        Operates and updates the value of the class member text_data.
 
-    # Instantiate the text_rank object with the sentences.
-    text_rank = TextRank(sentences)
-    my_matrix = text_rank.get_matrix()
+        Parameters
+        ----------
+        None.
+        '''
 
-    # Performing the iteration steps.
-    text_rank.iterate(my_matrix)
+        logging.debug('Processing sentences.')
 
-    # Get end results and show in the console.
-    wordrank = text_rank.get_keywords()
-    dict2file(output_file_path, wordrank)
+        return list(self.iter_sentences())
+
+
+# Main method definition.
+def main(argv=None):
+
+    # Default paths of the project layout, relative to the working
+    # directory like the original hardcoded values.
+    project_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+    parser = argparse.ArgumentParser(
+        description='Ranks the words of the posts of a Reddit domain '
+                    'with TextRank.')
+    parser.add_argument('--input',
+                        default=project_dir + '/resources/RS_2017-10.bz2',
+                        help='bz2 compressed Reddit dump')
+    parser.add_argument('--topic', default='self.depression',
+                        help='domain of the posts')
+    parser.add_argument('--nlines', type=int, default=50000,
+                        help='number of lines to read, 0 for all')
+    parser.add_argument('--start', type=int, default=0,
+                        help='first line to read')
+    parser.add_argument('--keywords', type=int, default=50,
+                        help='number of keywords written')
+    parser.add_argument('--max-words', type=int,
+                        help='rank only this many most frequent words, '
+                             'counted in fixed memory by a first pass')
+    parser.add_argument('--output',
+                        default=project_dir + '/output/ranked_words.txt',
+                        help='ranked words file')
+    parser.add_argument('--report',
+                        help='json run report, next to the output by '
+                             'default')
+    parser.add_argument('--index',
+                        help='BM25 index of the posts, built when missing, '
+                             'the best posts of the keywords are written')
+    parser.add_argument('--posts', type=int, default=10,
+                        help='number of posts written for the keywords')
+    parser.add_argument('--seeds',
+                        help='json file mapping names to seed word lists, '
+                             'ranks the words once per seed set')
+    parser.add_argument('--log-level', default='DEBUG')
+    args = parser.parse_args(argv)
+
+    # Logging configuration.
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=args.log_level)
+    logging.debug('==== Words processing with TextRank over Reddit '
+                  'datasets ====')
+    report_file_path = args.report or os.path.join(
+        os.path.dirname(args.output), 'textrank_report.json')
+
+    with recording('textrank') as recorder:
+
+        # Instance the words object with the source data file.
+        words = Words(args.input, args.topic)
+
+        # Stream the posts of the requested lines.
+        documents = words.iter_documents(args.nlines or None, args.start)
+
+        # Clean the texts using the text_cleaner object.
+        text_cleaner = TextCleaner(documents)
+        sentences = text_cleaner.iter_sentences()
+
+        # Instantiate the text_rank object with the sentences. Reading,
+        # cleaning and pair counting all happen while the graph is built.
+        text_rank = TextRank(sentences)
+        if args.max_words:
+            with recorder.stage('vocabulary'):
+                frequent = Words(args.input, args.topic, ApproximateCounter(
+                    capacity=args.max_words))
+                text_rank.keep = frequent.get_words(args.nlines or None,
+                                                    start=args.start)
+        with recorder.stage('graph'):
+            my_matrix = text_rank.get_matrix()
+
+        # Performing the iteration steps.
+        with recorder.stage('iterate'):
+            text_rank.iterate(my_matrix)
+
+        # Rank the words around every seed set in one batch.
+        if args.seeds:
+            with open(args.seeds) as seeds_file:
+                seeds = json.load(seeds_file, object_pairs_hook=OrderedDict)
+            with recorder.stage('personalized'):
+                text_rank.iterate_personalized(my_matrix, seeds)
+
+        # Get end results and show in the console.
+        with recorder.stage('output'):
+            wordrank = text_rank.get_keywords(args.keywords)
+            dict2file(args.output, wordrank)
+            stem = os.path.splitext(args.output)[0]
+            if args.seeds:
+                with open(stem + '.personalized.json', 'w') as output:
+                    json.dump(text_rank.get_personalized_keywords(
+                        args.keywords), output, indent=2)
+
+        # Retrieve the posts that best match the keywords.
+        if args.index:
+            with recorder.stage('search'):
+                if InvertedIndex.exists(args.index):
+                    index = InvertedIndex.load(args.index)
+                else:
+                    index = Words(args.input, args.topic).index_documents(
+                        args.index, args.nlines or None, args.start)
+                with open(stem + '.posts.json', 'w') as output:
+                    json.dump(index.hits(wordrank, args.posts), output,
+                              indent=2)
+
+    # Run report for the dashboards.
+    recorder.log()
+    recorder.write(report_file_path)
 
 
 # Main mathod call.
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+''' Single pass aggregation of many topics of a Reddit dump.
+
+Words and DataGenerator read the posts of one domain, so analysing many
+domains decompresses and parses the whole dump once per domain. The
+TopicAggregator reads the dump once and keeps, for every domain of a set
+or for every domain found, the token counts DataGenerator gives and the
+cleaned sentences TextCleaner gives. The counts feed a
+RootLogLikelihoodRatio and the sentences a TextRank per topic, without
+reading the dump again.
+
+Memory is capped per domain: the texts of a domain stop being taken once
+their size reaches max_bytes, and the sentences of a domain are spilled
+to a temporary file whenever their buffer grows over buffer_bytes. Posts
+without text, such as link posts, never open a domain, and the number of
+domains is capped by max_topics, the domains with fewer than min_posts
+posts are dropped at the end of the pass.
+
+'''
+
+import os
+import re
+import hashlib
+import shutil
+import argparse
+import logging
+import tempfile
+from collections import OrderedDict
+from app.ingest import (tokenize_text, open_lines, line_range,
+                        MultiDomainFilter)
+from app.vocabulary import Vocabulary
+from app.instrument import get_recorder, recording
+
+
+class TopicStream:
+    '''
+    Re-iterable sequence of the cleaned sentences of one topic, held in
+    memory up to a size and spilled to a file beyond it.
+
+    Sentences are stored one per line with their words joined by spaces,
+    tokens never hold whitespace after word tokenization.
+
+    Attributes
+    ----------
+    path : str
+        Spill file.
+    buffer_bytes : int
+        Approximate size of the buffer that triggers a spill.
+    nsentences : int
+        Number of sentences appended.
+
+    Methods
+    -------
+    append(sentence)
+        Adds a sentence.
+    spill()
+        Writes the buffered sentences to the spill file.
+    discard()
+        Drops the sentences and removes the spill file.
+    '''
+
+    def __init__(self, path, buffer_bytes=1 << 24):
+        '''
+        Parameters
+        ----------
+        path : str
+            Spill file, only created when needed.
+        buffer_bytes : int, optional
+            Approximate size of the buffer that triggers a spill.
+        '''
+
+        self.path = path
+        self.buffer_bytes = buffer_bytes
+        self.nsentences = 0
+        self._buffer = []
+        self._size = 0
+        self._spilled = False
+
+    def __len__(self):
+        return self.nsentences
+
+    def __iter__(self):
+        if self._spilled:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    yield line.split(' ') if line else []
+        for sentence in self._buffer:
+            yield list(sentence)
+
+    def append(self, sentence):
+        '''Adds a sentence, spilling the buffer when it is full.
+
+        Parameters
+        ----------
+        sentence : list
+            Words of the sentence.
+        '''
+
+        self._buffer.append(sentence)
+        self.nsentences += 1
+        # Rough size of the list and its short strings.
+        self._size += 64 + sum(56 + len(word) for word in sentence)
+        if self._size >= self.buffer_bytes:
+            self.spill()
+
+    def spill(self):
+        '''Appends the buffered sentences to the spill file.'''
+
+        if not self._buffer:
+            return
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(' '.join(sentence) + '\n'
+                         for sentence in self._buffer)
+        self._spilled = True
+        self._buffer = []
+        self._size = 0
+
+    def discard(self):
+        '''Drops every sentence and removes the spill file.'''
+
+        if self._spilled and os.path.exists(self.path):
+            os.remove(self.path)
+        self._spilled = False
+        self._buffer = []
+        self._size = 0
+        self.nsentences = 0
+
+
+class TopicAggregator:
+    '''
+    Reads the posts of many domains of a dump in one pass into per
+    domain token counts and sentence streams.
+
+    Attributes
+    ----------
+    file_path : str
+        Path to the dataset compressed file.
+    topics : frozenset
+        Domains to aggregate, None aggregates every domain.
+    max_bytes : int
+        Cap of the UTF-8 size of the texts taken per domain.
+    max_topics : int
+        Cap of the number of domains aggregated.
+    min_posts : int
+        Domains with fewer posts are dropped after a run.
+    counts : OrderedDict
+        Vocabulary of the tokens of every domain, as DataGenerator
+        counts them.
+    streams : OrderedDict
+        TopicStream of the cleaned sentences of every domain, as
+        TextCleaner.iter_sentences yields them.
+    stats : OrderedDict
+        Posts and bytes taken for every domain and whether it is full.
+
+    Methods
+    -------
+    run(nlines=None, start=0)
+        Reads the dump and aggregates the posts.
+    topic_names()
+        Returns the domains found, in order of first appearance.
+    sentences(topic)
+        Returns the sentence stream of a domain.
+    close()
+        Removes the spill files.
+    '''
+
+    def __init__(self, file_path, topics=None, domain_id='domain',
+                 text_id='selftext', max_bytes=None, buffer_bytes=1 << 24,
+                 directory=None, count=True, clean=True, stages=None,
+                 lexicon=None, max_topics=None, min_posts=1):
+        '''
+        Parameters
+        ----------
+        file_path : str
+            Path to the dataset compressed file.
+        topics : iterable, optional
+            Domains to aggregate, every domain by default.
+        domain_id : str, optional
+            Json object key name of the domain.
+        text_id : str, optional
+            Json object key name of the text.
+        max_bytes : int, optional
+            Per domain cap of the UTF-8 size of the texts, a domain takes
+            no more posts once the next one would exceed it.
+        buffer_bytes : int, optional
+            Approximate memory of the sentences kept per domain before
+            they are spilled to disk.
+        directory : str, optional
+            Directory of the spill files, a temporary one by default.
+        count : bool, optional
+            Count the tokens of every domain.
+        clean : bool, optional
+            Keep the cleaned sentences of every domain.
+        stages : tuple, optional
+            Cleaning stages, TextCleaner.DEFAULT_STAGES by default.
+        lexicon : Lexicon, optional
+            Known words of the dictionary stage.
+        max_topics : int, optional
+            Cap of the number of domains, posts of new domains are
+            skipped once it is reached. No cap by default.
+        min_posts : int, optional
+            Domains with fewer posts are dropped after a run.
+        '''
+
+        self.file_path = file_path
+        self.topics = None if topics is None else frozenset(topics)
+        self.domain_id = domain_id
+        self.text_id = text_id
+        self.max_bytes = max_bytes
+        self.buffer_bytes = buffer_bytes
+        self.count = count
+        self.clean = clean
+        self.stages = stages
+        self.lexicon = lexicon
+        self.max_topics = max_topics
+        self.min_posts = min_posts
+        self.counts = OrderedDict()
+        self.streams = OrderedDict()
+        self.stats = OrderedDict()
+        self._directory = directory
+        self._temporary = None
+        self._spills = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _spill_path(self):
+        # Spill files are numbered, domains are not safe file names.
+        if self._directory is None:
+            self._temporary = self._directory = tempfile.mkdtemp(
+                prefix='topics-')
+        self._spills += 1
+        return os.path.join(self._directory, 'topic-%d.txt' % self._spills)
+
+    def _add_topic(self, topic):
+        self.stats[topic] = {'posts': 0, 'bytes': 0, 'full': False}
+        if self.count:
+            self.counts[topic] = Vocabulary()
+        if self.clean:
+            self.streams[topic] = TopicStream(self._spill_path(),
+                                              self.buffer_bytes)
+
+    def _drop_topic(self, topic):
+        del self.stats[topic]
+        self.counts.pop(topic, None)
+        stream = self.streams.pop(topic, None)
+        if stream is not None:
+            stream.discard()
+
+    def run(self, nlines=None, start=0):
+        '''Reads the lines of the dump once and aggregates the posts of
+        the topics. Returns the aggregator.
+
+        Parameters
+        ----------
+        nlines : int, optional
+            Number of lines to parse, all of them by default.
+        start : int, optional
+            First line to parse.
+        '''
+
+        from app.textrank import TextCleaner
+
+        recorder = get_recorder()
+        posts = MultiDomainFilter(self.topics, self.domain_id, self.text_id)
+        parse = recorder.wrap(posts.parse, 'json')
+        tokenize = recorder.wrap(tokenize_text, 'nltk')
+        clean_text = TextCleaner((), self.lexicon).sentence_cleaner(
+            self.stages or TextCleaner.DEFAULT_STAGES)
+        lines = open_lines(self.file_path, *line_range(start, nlines),
+                           binary=True)
+        # With a known set of topics the pass ends when all are full.
+        open_topics = None if self.topics is None else set(self.topics)
+        tokens = 0
+
+        for line in recorder.timed(lines, 'bz2', 'lines_read'):
+            post = parse(line)
+            if post is None:
+                continue
+            text = post[self.text_id]
+            # Link posts have no text, they do not open a domain.
+            if not isinstance(text, str) or not text.strip():
+                continue
+            topic = post[self.domain_id]
+            if topic not in self.stats:
+                if self.max_topics is not None and \
+                        len(self.stats) >= self.max_topics:
+                    recorder.count('posts_skipped')
+                    continue
+                self._add_topic(topic)
+            stats = self.stats[topic]
+            if stats['full']:
+                continue
+            recorder.count('lines_matched')
+
+            size = len(text.encode('utf-8'))
+            if self.max_bytes is not None and \
+                    stats['bytes'] + size > self.max_bytes:
+                stats['full'] = True
+                if open_topics is not None:
+                    open_topics.discard(topic)
+                    if not open_topics:
+                        break
+                continue
+            stats['bytes'] += size
+            stats['posts'] += 1
+
+            if self.count:
+                words = tokenize(text)
+                self.counts[topic].update(words)
+                tokens += len(words)
+            if self.clean:
+                stream = self.streams[topic]
+                for sentence in clean_text(text):
+                    stream.append(sentence)
+
+        recorder.count('tokens', tokens)
+        for topic in [topic for topic, stats in self.stats.items()
+                      if stats['posts'] < self.min_posts]:
+            self._drop_topic(topic)
+        recorder.set('topics', len(self.stats))
+
+        return self
+
+    def topic_names(self):
+        '''Returns the domains found, in order of first appearance.'''
+
+        return list(self.stats)
+
+    def sentences(self, topic):
+        '''Returns the re-iterable cleaned sentences of a domain, empty
+        when the domain had no posts.
+
+        Parameters
+        ----------
+        topic : str
+            Domain of the posts.
+        '''
+
+        return self.streams.get(topic, ())
+
+    def close(self):
+        '''Removes the spill files of a temporary directory.'''
+
+        if self._temporary is not None:
+            shutil.rmtree(self._temporary, ignore_errors=True)
+            self._temporary = self._directory = None
+        self.streams = OrderedDict()
+
+
+def topic_file_name(topic):
+    '''Returns a file name stem safe on every platform for a domain.
+
+    Domains that have to be changed to be safe get a short hash of the
+    domain appended, so two of them never share a stem.
+
+    Parameters
+    ----------
+    topic : str
+        Domain of the posts.
+    '''
+
+    stem = re.sub(r'[^\w.-]+', '_', topic).strip('._') or 'topic'
+    if stem == topic:
+        return stem
+
+    digest = hashlib.sha1(topic.encode('utf-8')).hexdigest()[:8]
+    return f'{stem}-{digest}'
+
+
+def rank_topic(stem, text_rank, counts=None, common_dataset=None,
+               keywords=50, number=50):
+    '''Writes the TextRank keywords of a topic to stem.textrank.txt and,
+    given the reference counts, its log-likelihood ratio extremes to
+    stem.llr.txt.
+
+    Parameters
+    ----------
+    stem : str
+        Path prefix of the result files.
+    text_rank : TextRank
+        Graph of the topic, ranked here.
+    counts : Vocabulary, optional
+        Token counts of the topic.
+    common_dataset : FrequencyTable, optional
+        Reference counts, no ratio is computed without them.
+    keywords : int, optional
+        Number of TextRank keywords written.
+    number : int, optional
+        Words taken from each end of the scores.
+    '''
+
+    from app.textrank import dict2file
+    from app.rootloglikelihood import RootLogLikelihoodRatio
+
+    recorder = get_recorder()
+    with recorder.stage('textrank'):
+        text_rank.iterate(text_rank.get_matrix())
+        dict2file(stem + '.textrank.txt', text_rank.get_keywords(keywords))
+
+    if counts is not None and common_dataset is not None:
+        with recorder.stage('llr'):
+            rll = RootLogLikelihoodRatio(counts, common_dataset)
+            rll.applyllr()
+            rll.savetofile(rll.extremes(number), stem + '.llr.txt')
+
+
+def main(argv=None):
+
+    from app.textrank import TextRank
+    from app.rootloglikelihood import CommonWord
+
+    parser = argparse.ArgumentParser(
+        description='Ranks the words of many Reddit domains with TextRank '
+                    'and the root log-likelihood ratio, reading the dump '
+                    'once.')
+    parser.add_argument('--input', default='../../resources/RS_2017-10.bz2',
+                        help='bz2 compressed Reddit dump')
+    parser.add_argument('--topics', nargs='+',
+                        help='domains of the posts, every domain when '
+                             'missing')
+    parser.add_argument('--nlines', type=int, default=0,
+                        help='number of lines to read, 0 for all')
+    parser.add_argument('--start', type=int, default=0,
+                        help='first line to read')
+    parser.add_argument('--max-bytes', type=int,
+                        help='cap of the text size taken per domain')
+    parser.add_argument('--min-posts', type=int, default=1,
+                        help='domains with fewer posts are not ranked')
+    parser.add_argument('--max-topics', type=int,
+                        help='cap of the number of domains aggregated')
+    parser.add_argument('--keywords', type=int, default=50,
+                        help='number of TextRank keywords written')
+    parser.add_argument('--number', type=int, default=50,
+                        help='words taken from each end of the scores')
+    parser.add_argument('--common-store',
+                        help='path prefix of a reference FrequencyTable, '
+                             'filled from the url when missing')
+    parser.add_argument('--no-llr', action='store_true',
+                        help='skip the log-likelihood ratio')
+    parser.add_argument('--output-dir', default='.',
+                        help='directory of the result files')
+    parser.add_argument('--report', help='json run report, in the output '
+                                         'directory by default')
+    parser.add_argument('--log-level', default='DEBUG')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=args.log_level)
+    os.makedirs(args.output_dir, exist_ok=True)
+    report_file_path = args.report or os.path.join(args.output_dir,
+                                                   'topics_report.json')
+
+    with recording('topics') as recorder, TopicAggregator(
+            args.input, args.topics, max_bytes=args.max_bytes,
+            count=not args.no_llr, max_topics=args.max_topics,
+            min_posts=args.min_posts) as aggregator:
+        with recorder.stage('aggregate'):
+            aggregator.run(args.nlines or None, args.start)
+
+        common_dataset = None
+        if not args.no_llr:
+            with recorder.stage('common_counts'):
+                common_dataset = CommonWord(args.common_store).getwords()
+
+        ranked = 0
+        for topic in aggregator.topic_names():
+            # Posts whose text cleans to nothing have no sentence.
+            if not len(aggregator.sentences(topic)):
+                continue
+            logging.info('Ranking %s.', topic)
+            stem = os.path.join(args.output_dir, topic_file_name(topic))
+
+            rank_topic(stem, TextRank(aggregator.sentences(topic)),
+                       aggregator.counts.get(topic), common_dataset,
+                       args.keywords, args.number)
+            ranked += 1
+
+        recorder.set('ranked_topics', ranked)
+        recorder.set('stats', aggregator.stats)
+
+    # Run report for the dashboards.
+    recorder.log()
+    recorder.write(report_file_path)
+
+
+# Entry point.
+if __name__ == '__main__':
+    main()
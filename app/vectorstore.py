@@ -0,0 +1,206 @@
+''' Binary store of pre-trained word vectors.
+
+The GloVe models ship as text files with a word followed by its vector
+components on every line. This module converts such a file once into a
+contiguous float32 (or float16) matrix saved with numpy, plus the sorted
+vocabulary it is aligned with. Both files are memory-mapped on load, so
+start-up is immediate and worker processes share one copy of the pages.
+
+'''
+
+import argparse
+import logging
+import numpy as np
+from app.vocabulary import lookup_sorted
+
+
+class EmbeddingStore:
+    '''
+    Read only word vector model backed by memory-mapped numpy files.
+
+    Row i of the matrix is the vector of words[i], the vocabulary is
+    sorted so a word is found with a binary search. It behaves like the
+    dict returned by VectorRepr.load_glove_vectors for len, in, [] and
+    get.
+
+    Attributes
+    ----------
+    words : array
+        Sorted vocabulary as fixed width UTF-8 byte strings.
+    vectors : array
+        Matrix with one vector per word.
+
+    Methods
+    -------
+    convert(source_path, prefix, dtype='float32')
+        Converts a GloVe text file into a binary store.
+    load(prefix)
+        Memory-maps a binary store.
+    get(word, default=None)
+        Returns the vector of a word.
+    lookup(words)
+        Returns the rows of many words and which of them were found.
+    matrix(words)
+        Returns the vectors of many words as a matrix.
+    '''
+
+    WORDS_SUFFIX = '.words.npy'
+    VECTORS_SUFFIX = '.vectors.npy'
+
+    def __init__(self, words, vectors):
+        '''
+        Parameters
+        ----------
+        words : array
+            Sorted vocabulary as fixed width UTF-8 byte strings.
+        vectors : array
+            Matrix with one vector per word.
+        '''
+
+        self.words = words
+        self.vectors = vectors
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    @classmethod
+    def convert(cls, source_path, prefix, dtype='float32'):
+        '''Converts a text file of words and vectors into a binary store.
+
+        Repeated words keep their first vector.
+
+        Parameters
+        ----------
+        source_path : str
+            Path to the text model, as extracted by VectorRepr.load_zip.
+        prefix : str
+            Path prefix of the two numpy files written.
+        dtype : str, optional
+            Storage type of the vectors, float32 or float16.
+        '''
+
+        logging.debug('Converting %s into %s.', source_path, prefix)
+
+        words, rows, seen = [], [], set()
+        with open(source_path, 'r', encoding='utf8') as source:
+            for line in source:
+                parts = line.split()
+                if parts[0] in seen:
+                    continue
+                seen.add(parts[0])
+                words.append(parts[0].encode('utf-8'))
+                rows.append(np.array(parts[1:], dtype=dtype))
+
+        words = np.array(words, dtype=bytes)
+        order = np.argsort(words, kind='stable')
+        vectors = np.empty((len(rows), len(rows[0]) if rows else 0),
+                           dtype=dtype)
+        for target, source in enumerate(order):
+            vectors[target] = rows[source]
+
+        np.save(prefix + cls.WORDS_SUFFIX, words[order])
+        np.save(prefix + cls.VECTORS_SUFFIX, vectors)
+
+        return cls.load(prefix)
+
+    @classmethod
+    def load(cls, prefix):
+        '''Memory-maps a binary store written by convert.
+
+        Parameters
+        ----------
+        prefix : str
+            Path prefix of the two numpy files.
+        '''
+
+        return cls(np.load(prefix + cls.WORDS_SUFFIX, mmap_mode='r'),
+                   np.load(prefix + cls.VECTORS_SUFFIX, mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return self._position(word) is not None
+
+    def __getitem__(self, word):
+        position = self._position(word)
+        if position is None:
+            raise KeyError(word)
+        return self.vectors[position]
+
+    def _position(self, word):
+        key = word.encode('utf-8')
+        if len(key) > self.words.dtype.itemsize:
+            return None
+        position = int(np.searchsorted(self.words, key))
+        if position < len(self.words) and self.words[position] == key:
+            return position
+        return None
+
+    def get(self, word, default=None):
+        '''Returns the vector of a word, or default when missing.
+
+        Parameters
+        ----------
+        word : str
+            Word to look up.
+        default : array, optional
+            Value for missing words.
+        '''
+
+        position = self._position(word)
+        return default if position is None else self.vectors[position]
+
+    def lookup(self, words):
+        '''Returns the row of every word and a mask of the words found.
+
+        Rows of missing words are meaningless and must be masked out.
+
+        Parameters
+        ----------
+        words : iterable
+            Words to look up.
+        '''
+
+        keys = [word.encode('utf-8') for word in words]
+        return lookup_sorted(keys, self.words)
+
+    def matrix(self, words, dtype='float32'):
+        '''Returns a matrix with the vector of every word, zeros for the
+        words missing from the model.
+
+        Parameters
+        ----------
+        words : iterable
+            Words to look up.
+        dtype : str, optional
+            Type of the returned matrix.
+        '''
+
+        rows, found = self.lookup(words)
+        result = np.zeros((len(rows), self.dim), dtype=dtype)
+        result[found] = self.vectors[rows[found]]
+
+        return result
+
+
+# Converts the GloVe text file given in the command line.
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description='Converts a GloVe text model into a binary store.')
+    parser.add_argument('source', help='GloVe text file')
+    parser.add_argument('prefix', help='path prefix of the store')
+    parser.add_argument('--dtype', default='float32',
+                        choices=('float32', 'float16'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=logging.DEBUG)
+    store = EmbeddingStore.convert(args.source, args.prefix, args.dtype)
+    logging.debug('Stored %s vectors of size %s.', len(store), store.dim)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+''' Interning vocabulary with array backed counts.
+
+Every distinct token gets a dense int32 id in order of first appearance
+and its frequency lives in a growable int64 numpy array indexed by id,
+instead of a Python int in a Counter. Tokens are not kept as Python
+strings either: new tokens wait in a small dict and are periodically
+frozen into a sorted array of fixed width UTF-8 strings, the layout of
+FrequencyTable and EmbeddingStore, where they are found with batched
+binary searches. Tokens too long for that array stay in a dict.
+
+Tokens counted with update, the hot path of the ingest, are tallied in
+a plain Counter first, whose update runs in C, and the tally is interned
+in one batch whenever it grows over freeze_size distinct tokens or the
+vocabulary is read. A dict keeps insertion order, so the ids are still
+given in order of first appearance. Occurrences counted with add are
+buffered as ids and folded into the counts with a single bincount, and
+merging two vocabularies remaps the ids of one into the other and adds
+the count arrays, so partial counts from worker processes combine with
+array operations.
+
+A Vocabulary can stand in for the Counter of words it replaces: len, in,
+iteration, [], get, items and most_common behave the same way.
+
+'''
+
+from collections import Counter
+from collections.abc import Mapping
+import numpy as np
+
+
+def lookup_sorted(keys, words):
+    '''Returns the positions of UTF-8 keys in a sorted array of fixed
+    width byte strings, and a mask of the keys found there.
+
+    Positions of missing keys are meaningless and must be masked out.
+    Keys wider than the array are never found, they would otherwise be
+    truncated into false matches.
+
+    Parameters
+    ----------
+    keys : list
+        UTF-8 encoded keys.
+    words : array
+        Sorted fixed width byte strings.
+    '''
+
+    if not len(keys) or not len(words):
+        return (np.zeros(len(keys), dtype=np.int64),
+                np.zeros(len(keys), dtype=bool))
+
+    width = words.dtype.itemsize
+    fits = np.fromiter((len(key) <= width for key in keys), dtype=bool,
+                       count=len(keys))
+    keys = np.array([key if ok else b'' for key, ok in zip(keys, fits)],
+                    dtype=words.dtype)
+    positions = np.minimum(np.searchsorted(words, keys), len(words) - 1)
+
+    return positions, fits & (words[positions] == keys)
+
+
+class Vocabulary:
+    '''
+    Token to id mapping with a frequency per id.
+
+    Ids are consecutive int32 values starting at zero, in order of first
+    appearance, so arrays indexed by id can be shared between stages.
+
+    Attributes
+    ----------
+    buffer_size : int
+        Number of pending occurrences that triggers a compaction.
+    freeze_size : int
+        Minimum number of new tokens that triggers a freeze, and number
+        of tallied tokens that triggers their interning.
+
+    Methods
+    -------
+    add(tokens)
+        Interns and counts tokens, returns their ids.
+    intern(tokens)
+        Returns the ids of tokens without counting them.
+    index(token)
+        Returns the id of a token.
+    lookup(tokens)
+        Returns the ids of tokens, -1 for unknown ones.
+    add_counts(ids, counts)
+        Adds frequencies to existing ids.
+    merge(other)
+        Adds the tokens and counts of another vocabulary.
+    update(other)
+        Counter.update for tokens, mappings and vocabularies.
+    compact()
+        Folds the pending occurrences into the count array.
+    most_common(n=None)
+        Returns the n most frequent tokens and their counts.
+    '''
+
+    # Longest UTF-8 token held in the sorted array.
+    MAX_WIDTH = 32
+
+    def __init__(self, tokens=(), buffer_size=1 << 20, freeze_size=1 << 16):
+        '''
+        Parameters
+        ----------
+        tokens : iterable, optional
+            Tokens to count, or a mapping of tokens to frequencies.
+        buffer_size : int, optional
+            Number of pending occurrences that triggers a compaction.
+        freeze_size : int, optional
+            Minimum number of new tokens that triggers a freeze, and
+            number of tallied tokens that triggers their interning.
+        '''
+
+        self.buffer_size = buffer_size
+        self.freeze_size = freeze_size
+        self._keys = np.empty(0, dtype='S1')
+        self._key_ids = np.empty(0, dtype=np.int32)
+        self._recent = {}
+        self._long = {}
+        self._size = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._pending_size = 0
+        self._tally = Counter()
+        self._words = None
+        self.update(tokens)
+
+    def __len__(self):
+        self._fold()
+        return self._size
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __contains__(self, token):
+        return self.index(token) is not None
+
+    def __getitem__(self, token):
+        # Missing tokens count zero, as in a Counter.
+        return self.get(token)
+
+    def __getstate__(self):
+        self.compact()
+        state = self.__dict__.copy()
+        state['_tally'] = Counter()
+        state['_counts'] = self.counts.copy()
+        state['_words'] = None
+
+        return state
+
+    @property
+    def counts(self):
+        '''Frequency of every id, as a view of the count array.'''
+
+        self.compact()
+        return self._counts[:self._size]
+
+    @property
+    def words(self):
+        '''Tokens in id order, as an object array built on demand.'''
+
+        self._fold()
+        if self._words is None or len(self._words) != self._size:
+            words = np.empty(self._size, dtype=object)
+            words[self._key_ids] = [key.decode('utf-8')
+                                    for key in self._keys.tolist()]
+            for table in (self._recent, self._long):
+                if table:
+                    words[list(table.values())] = list(table)
+            self._words = words
+
+        return self._words
+
+    def _grow(self, size):
+        # Doubles the capacity so appends cost amortized constant time.
+        if size > len(self._counts):
+            counts = np.zeros(max(size, 2 * len(self._counts)),
+                              dtype=np.int64)
+            counts[:len(self._counts)] = self._counts
+            self._counts = counts
+
+    def _search(self, keys):
+        # Ids of UTF-8 keys in the sorted array, -1 when missing.
+        result = np.full(len(keys), -1, dtype=np.int32)
+        positions, found = lookup_sorted(keys, self._keys)
+        result[found] = self._key_ids[positions[found]]
+
+        return result
+
+    def _freeze(self):
+        # Moves the recent tokens into the sorted array.
+        keys = np.array([token.encode('utf-8') for token in self._recent],
+                        dtype=bytes)
+        ids = np.fromiter(self._recent.values(), dtype=np.int32,
+                          count=len(keys))
+        order = np.argsort(keys)
+        keys, ids = keys[order], ids[order]
+        positions = np.searchsorted(self._keys, keys)
+
+        dtype = max(self._keys.dtype, keys.dtype, key=lambda t: t.itemsize)
+        self._keys = np.insert(self._keys.astype(dtype), positions, keys)
+        self._key_ids = np.insert(self._key_ids, positions, ids)
+        self._recent = {}
+
+    def _fold(self):
+        # Interns the tallied tokens and adds their counts.
+        if not self._tally:
+            return
+
+        tally, self._tally = self._tally, Counter()
+        ids = np.array(self._intern(list(tally)), dtype=np.int64)
+        self._grow(self._size)
+        # Tallied tokens are distinct, no repeated indices.
+        self._counts[ids] += np.fromiter(tally.values(), dtype=np.int64,
+                                         count=len(ids))
+
+    def intern(self, tokens):
+        '''Returns the ids of tokens as a list, giving new ids to unseen
+        tokens without counting them.
+
+        Prefer few calls with many tokens, unseen tokens are searched in
+        the frozen array with one vectorized search per call.
+
+        Parameters
+        ----------
+        tokens : iterable
+            Tokens to intern.
+        '''
+
+        self._fold()
+        return self._intern(tokens)
+
+    def _intern(self, tokens):
+        tokens = tokens if isinstance(tokens, list) else list(tokens)
+        recent = self._recent
+        ids = [recent.get(token, -1) for token in tokens]
+        missing = [k for k, i in enumerate(ids) if i < 0]
+        if not missing:
+            return ids
+
+        keys = [tokens[k].encode('utf-8') for k in missing]
+        for k, key, i in zip(missing, keys, self._search(keys).tolist()):
+            if i < 0:
+                table = self._long if len(key) > self.MAX_WIDTH else recent
+                i = table.get(tokens[k])
+                if i is None:
+                    i = table[tokens[k]] = self._size
+                    self._size += 1
+            ids[k] = i
+
+        if len(recent) >= max(self.freeze_size, len(self._keys) // 4):
+            self._freeze()
+
+        return ids
+
+    def add(self, tokens):
+        '''Interns and counts tokens, returns their ids as a list.
+
+        Parameters
+        ----------
+        tokens : iterable
+            Tokens to count.
+        '''
+
+        ids = self.intern(tokens)
+        self._pending.append(np.array(ids, dtype=np.int32))
+        self._pending_size += len(ids)
+        if self._pending_size >= self.buffer_size:
+            self.compact()
+
+        return ids
+
+    def index(self, token):
+        '''Returns the id of a token, None when missing.
+
+        Parameters
+        ----------
+        token : str
+            Token to look up.
+        '''
+
+        i = self.lookup([token])[0]
+        return None if i < 0 else int(i)
+
+    def lookup(self, tokens):
+        '''Returns an int32 array with the id of every token, -1 for the
+        tokens not in the vocabulary.
+
+        Parameters
+        ----------
+        tokens : iterable
+            Tokens to look up.
+        '''
+
+        self._fold()
+        tokens = tokens if isinstance(tokens, list) else list(tokens)
+        result = self._search([token.encode('utf-8') for token in tokens])
+        for table in (self._recent, self._long):
+            if table:
+                get = table.get
+                for k in np.flatnonzero(result < 0).tolist():
+                    result[k] = get(tokens[k], -1)
+
+        return result
+
+    def add_counts(self, ids, counts):
+        '''Adds frequencies to ids already in the vocabulary.
+
+        Parameters
+        ----------
+        ids : array
+            Token ids, repetitions are summed.
+        counts : array
+            Frequency to add to every id.
+        '''
+
+        self.compact()
+        np.add.at(self._counts, np.asarray(ids, dtype=np.int64),
+                  np.asarray(counts, dtype=np.int64))
+
+    def compact(self):
+        '''Folds the pending occurrences into the count array.'''
+
+        self._fold()
+        self._grow(self._size)
+        if not self._pending:
+            return
+
+        pending = np.concatenate(self._pending)
+        self._counts[:self._size] += np.bincount(pending,
+                                                 minlength=self._size)
+        self._pending = []
+        self._pending_size = 0
+
+    def merge(self, other):
+        '''Adds the tokens and counts of another vocabulary.
+
+        Tokens new to this vocabulary are appended in the order of the
+        other one, so merging partial counts in sequence gives the same
+        ids as counting the whole sequence at once.
+
+        Parameters
+        ----------
+        other : Vocabulary
+            Vocabulary to merge into this one.
+        '''
+
+        counts = other.counts
+        remap = np.array(self.intern(other.words.tolist()), dtype=np.int64)
+        self.compact()
+        # Ids of the other vocabulary are unique, no repeated indices.
+        self._counts[remap] += counts
+
+    def update(self, other):
+        '''Counts tokens like Counter.update.
+
+        Tokens of an iterable are tallied and interned later in a batch,
+        use add when their ids are needed right away.
+
+        Parameters
+        ----------
+        other : iterable
+            A Vocabulary, a mapping of tokens to frequencies or an
+            iterable of tokens.
+        '''
+
+        # Token lists come first, the abstract Mapping check is slow.
+        if isinstance(other, list) or not isinstance(
+                other, (Vocabulary, Mapping)):
+            tally = self._tally
+            tally.update(other)
+            if len(tally) >= self.freeze_size:
+                self._fold()
+        elif isinstance(other, Vocabulary):
+            self.merge(other)
+        else:
+            ids = self.intern(list(other.keys()))
+            self.add_counts(ids, np.fromiter(other.values(), dtype=np.int64,
+                                             count=len(ids)))
+
+    def get(self, token, default=0):
+        '''Returns the frequency of a token, or default when missing.
+
+        Parameters
+        ----------
+        token : str
+            Token to look up.
+        default : int, optional
+            Value for missing tokens.
+        '''
+
+        i = self.index(token)
+        return default if i is None else int(self.counts[i])
+
+    def keys(self):
+        return iter(self.words)
+
+    def values(self):
+        return self.counts.tolist()
+
+    def items(self):
+        return zip(self.words, self.values())
+
+    def most_common(self, n=None):
+        '''Returns the n most frequent tokens with their counts, ties in
+        order of first appearance like Counter.most_common.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of tokens, all of them by default.
+        '''
+
+        counts = self.counts
+        order = np.argsort(-counts, kind='stable')[:n]
+
+        return list(zip(self.words[order].tolist(), counts[order].tolist()))
@@ -0,0 +1,115 @@
+''' Accuracy of the approximate counting mode against the exact one.
+
+Counts the topic of a synthetic dump with an exact Vocabulary and with
+ApproximateCounters of every requested capacity, and reports for each of
+them the largest frequency overcount next to its guaranteed bound, the
+share of the words above N / capacity that are kept, the recall of the
+exact top words, the overlap of the log-likelihood ratio extremes and the
+memory of the summaries.
+
+Usage::
+
+    python -m benchmarks.accuracy --nlines 32000 --capacities 1000 10000
+
+'''
+
+import json
+import argparse
+import logging
+
+from benchmarks.synthetic import SyntheticCorpus
+from benchmarks.sweep import DEFAULT_DIRECTORY
+from benchmarks.stages import Workload
+from app.sketch import ApproximateCounter
+from app.textrank import Words
+from app.rootloglikelihood import RootLogLikelihoodRatio
+
+
+def extremes(counts, reference, k):
+    # Lowest and highest k scored words.
+    ratio = RootLogLikelihoodRatio(counts, reference)
+    ratio.applyllr()
+    words = list(ratio.extremes(k))
+
+    return set(words[:k]), set(words[-k:])
+
+
+def measure(workload, capacity, epsilon=1e-4, delta=1e-3, top=1000, k=50):
+    '''Returns the accuracy figures of an ApproximateCounter of the given
+    parameters on the topic of a workload.
+
+    Parameters
+    ----------
+    workload : Workload
+        Inputs of the topic, the exact counts are cached there.
+    capacity : int
+        Number of most frequent words kept.
+    epsilon : float, optional
+        Bound of the overcount relative to the total.
+    delta : float, optional
+        Probability of exceeding the bound.
+    top : int, optional
+        Number of exact top words whose recall is measured.
+    k : int, optional
+        Words taken from each end of the log-likelihood ratio scores.
+    '''
+
+    exact = workload.counts()
+    counter = Words(workload.corpus.dump_path, workload.corpus.topic,
+                    ApproximateCounter(epsilon=epsilon, delta=delta,
+                                       capacity=capacity)).get_words(None)
+    bounds = counter.bounds()
+
+    words = exact.words.tolist()
+    estimates = [counter[word] for word in words]
+    errors = [estimate - count for estimate, count in
+              zip(estimates, exact.counts.tolist())]
+    heavy = [word for word, count in exact.items()
+             if count > bounds['heavy_threshold']]
+    top_words = [word for word, _ in exact.most_common(top)]
+    reference = workload.reference()
+    low, high = extremes(exact, reference, k)
+    approximate_low, approximate_high = extremes(counter, reference, k)
+
+    return {'capacity': capacity, 'epsilon': counter.sketch.epsilon,
+            'delta': delta, 'total': bounds['total'],
+            'distinct': len(exact), 'distinct_estimate': counter.distinct(),
+            'undercounts': sum(error < 0 for error in errors),
+            'max_overcount': max(errors, default=0),
+            'overcount_bound': bounds['overcount'],
+            'over_bound': sum(error > bounds['overcount']
+                              for error in errors),
+            'heavy_kept': (sum(word in counter for word in heavy) /
+                           len(heavy)) if heavy else None,
+            'top_recall': len(set(top_words) & set(counter)) /
+            max(len(top_words), 1),
+            'llr_low_overlap': len(low & approximate_low) / k,
+            'llr_high_overlap': len(high & approximate_high) / k,
+            'sketch_bytes': counter.sketch.table.nbytes}
+
+
+# Prints the accuracy report of the options given in the command line.
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Compare approximate and exact word counts.')
+    parser.add_argument('--nlines', type=int, default=32000)
+    parser.add_argument('--capacities', type=int, nargs='+',
+                        default=[1000, 10000])
+    parser.add_argument('--epsilon', type=float, default=1e-4)
+    parser.add_argument('--delta', type=float, default=1e-3)
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY,
+                        help='cache of the generated inputs')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(message)s')
+    workload = Workload(SyntheticCorpus(args.directory, args.nlines,
+                                        args.seed))
+    results = [measure(workload, capacity, args.epsilon, args.delta)
+               for capacity in args.capacities]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+''' Stage level benchmarks of the TextRank and log-likelihood pipelines.
+
+Every stage is timed on its own, with its inputs prepared beforehand by a
+Workload over a SyntheticCorpus. A stage function does the untimed setup
+and returns the callable to time and the number of items it processes,
+so throughputs are comparable across input sizes.
+
+'''
+
+import os
+import time
+import logging
+import statistics
+from collections import OrderedDict
+
+from app.textrank import Words, TextCleaner, TextRank
+from app.rootloglikelihood import RootLogLikelihoodRatio
+from app.refcorpus import FrequencyTable
+from app.vectorstore import EmbeddingStore
+
+
+class Workload:
+    '''
+    Inputs of every stage for one synthetic corpus, computed on first use
+    and kept for the following stages.
+
+    Attributes
+    ----------
+    corpus : SyntheticCorpus
+        Generated input files.
+    workers : int
+        Worker processes of the ingest stage.
+
+    Methods
+    -------
+    documents()
+        Returns the posts of the topic.
+    sentences()
+        Returns the cleaned sentences of the posts.
+    text_rank()
+        Returns a TextRank with the pairs of the sentences counted.
+    matrix()
+        Returns the transition matrix of the TextRank graph.
+    counts()
+        Returns the word counts of the topic.
+    reference()
+        Returns the reference corpus as a FrequencyTable.
+    vectors()
+        Returns the GloVe model as an EmbeddingStore.
+    '''
+
+    def __init__(self, corpus, workers=1):
+        '''
+        Parameters
+        ----------
+        corpus : SyntheticCorpus
+            Generated input files.
+        workers : int, optional
+            Worker processes of the ingest stage.
+        '''
+
+        self.corpus = corpus.generate()
+        self.workers = workers
+        self._cache = {}
+
+    def _cached(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    def words(self):
+        return Words(self.corpus.dump_path, self.corpus.topic)
+
+    def documents(self):
+        return self._cached('documents', lambda: list(
+            self.words().iter_documents()))
+
+    def sentences(self):
+        return self._cached('sentences', lambda: list(
+            TextCleaner(self.documents()).iter_sentences()))
+
+    def text_rank(self):
+        def build():
+            text_rank = TextRank(self.sentences())
+            text_rank.get_pair_counter().compact()
+            return text_rank
+        return self._cached('text_rank', build)
+
+    def matrix(self):
+        return self._cached('matrix', lambda: self.text_rank().get_matrix())
+
+    def counts(self):
+        return self._cached('counts', lambda: self.words().get_words(None))
+
+    def reference(self):
+        prefix = os.path.splitext(self.corpus.counts_path)[0]
+        return self._cached('reference', lambda: (
+            FrequencyTable.load(prefix)
+            if os.path.exists(prefix + FrequencyTable.WORDS_SUFFIX)
+            else FrequencyTable.convert(self.corpus.counts_path, prefix)))
+
+    def vectors(self):
+        prefix = os.path.splitext(self.corpus.glove_path)[0]
+        return self._cached('vectors', lambda: (
+            EmbeddingStore.load(prefix)
+            if os.path.exists(prefix + EmbeddingStore.WORDS_SUFFIX)
+            else EmbeddingStore.convert(self.corpus.glove_path, prefix)))
+
+
+def bench_ingest(workload):
+    '''Filters the topic posts of the dump and counts their tokens.'''
+
+    words = workload.words
+
+    return (lambda: words().get_words(None, workload.workers),
+            workload.corpus.nlines)
+
+
+def bench_pipeline(workload):
+    '''Counts the topic tokens with reading, tokenizing and counting
+    overlapped in a pipeline.'''
+
+    words = workload.words
+
+    return (lambda: words().get_words(None, workload.workers,
+                                      pipeline=True),
+            workload.corpus.nlines)
+
+
+def bench_cleaning(workload):
+    '''Splits, tokenizes and cleans the posts into sentences.'''
+
+    documents = workload.documents()
+
+    return (lambda: list(TextCleaner(documents).iter_sentences()),
+            len(documents))
+
+
+def bench_pairs(workload):
+    '''Interns the sentences and counts their co-occurring pairs.'''
+
+    sentences = workload.sentences()
+
+    def run():
+        TextRank(sentences).get_pair_counter().compact()
+
+    return run, sum(len(sentence) for sentence in sentences)
+
+
+def bench_matrix(workload):
+    '''Builds the normalized transition matrix from the pairs.'''
+
+    text_rank = workload.text_rank()
+
+    return text_rank.get_matrix, len(text_rank.get_pair_counter())
+
+
+def bench_iterate(workload):
+    '''Solves the TextRank equation.'''
+
+    text_rank = workload.text_rank()
+    matrix = workload.matrix()
+
+    return (lambda: text_rank.iterate(matrix),
+            len(text_rank.get_vocabulary()))
+
+
+def bench_similarity(workload):
+    '''Builds the kNN graph of the word embeddings.'''
+
+    text_rank = workload.text_rank()
+    vectors = workload.vectors()
+
+    return (lambda: text_rank.get_similarity_matrix(vectors),
+            len(text_rank.get_vocabulary()))
+
+
+def bench_llr(workload):
+    '''Scores the topic words against the reference corpus.'''
+
+    counts = workload.counts()
+    reference = workload.reference()
+
+    def run():
+        ratio = RootLogLikelihoodRatio(counts, reference)
+        ratio.applyllr()
+        ratio.extremes(50)
+
+    return run, len(counts)
+
+
+STAGES = OrderedDict([
+    ('ingest', bench_ingest),
+    ('pipeline', bench_pipeline),
+    ('cleaning', bench_cleaning),
+    ('pairs', bench_pairs),
+    ('matrix', bench_matrix),
+    ('iterate', bench_iterate),
+    ('similarity', bench_similarity),
+    ('llr', bench_llr),
+])
+
+
+def run_stage(name, workload, repeat=3):
+    '''Times a stage and returns a dict with its best and median times,
+    the items processed and the items per second of the best run.
+
+    Parameters
+    ----------
+    name : str
+        Key of STAGES.
+    workload : Workload
+        Inputs of the stage.
+    repeat : int, optional
+        Number of timed runs.
+    '''
+
+    run, items = STAGES[name](workload)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    best = min(times)
+    result = {'stage': name, 'nlines': workload.corpus.nlines,
+              'items': items, 'seconds': best,
+              'median': statistics.median(times),
+              'rate': items / best if best else None}
+    logging.info('%s on %s lines: %.4f s, %s items.', name,
+                 workload.corpus.nlines, best, items)
+
+    return result
@@ -0,0 +1,191 @@
+''' Scaling sweep over synthetic dumps of growing size.
+
+Runs the stage benchmarks on dumps of every requested size and writes a
+json report with one entry per stage and size, plus the scaling exponent
+of every stage, the slope of log(seconds) over log(lines). When a
+baseline report is given, every time is compared with the baseline time
+of the same stage and size and the slower ones are flagged, the exit
+status is then 1 so the sweep can gate a change.
+
+Timings are only comparable on the same machine, so the baseline is not
+part of the repository: write one with --save-baseline before a change
+and compare against it after.
+
+Usage::
+
+    python -m benchmarks.sweep --sizes 2000 8000 32000 \\
+        --output results.json --baseline baseline.json
+
+'''
+
+import os
+import sys
+import json
+import platform
+import tempfile
+import argparse
+import logging
+import numpy as np
+
+from benchmarks.synthetic import SyntheticCorpus
+from benchmarks.stages import STAGES, Workload, run_stage
+
+DEFAULT_SIZES = (2000, 8000, 32000)
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(),
+                                 'informationretrieval-benchmarks')
+
+
+def sweep(sizes=DEFAULT_SIZES, stages=tuple(STAGES), directory=None,
+          repeat=3, workers=1, seed=0):
+    '''Runs the stages on a synthetic dump of every size and returns the
+    list of stage results.
+
+    Parameters
+    ----------
+    sizes : tuple, optional
+        Number of lines of every dump.
+    stages : tuple, optional
+        Names of the stages to run.
+    directory : str, optional
+        Directory caching the generated inputs.
+    repeat : int, optional
+        Timed runs per stage.
+    workers : int, optional
+        Worker processes of the ingest stage.
+    seed : int, optional
+        Random seed of the generated inputs.
+    '''
+
+    directory = directory or DEFAULT_DIRECTORY
+    results = []
+    for nlines in sizes:
+        workload = Workload(SyntheticCorpus(directory, nlines, seed),
+                            workers)
+        for name in stages:
+            results.append(run_stage(name, workload, repeat))
+
+    return results
+
+
+def scaling(results):
+    '''Returns the least squares slope of log(seconds) over log(lines)
+    of every stage run on more than one size.
+
+    Parameters
+    ----------
+    results : list
+        Stage results given by sweep.
+    '''
+
+    exponents = {}
+    for name in {result['stage'] for result in results}:
+        points = [(result['nlines'], result['seconds'])
+                  for result in results
+                  if result['stage'] == name and result['seconds'] > 0]
+        if len({nlines for nlines, _ in points}) > 1:
+            x, y = np.log(np.array(points, dtype='float')).T
+            exponents[name] = float(np.polyfit(x, y, 1)[0])
+
+    return exponents
+
+
+def compare(results, baseline, tolerance=0.25):
+    '''Returns the results slower than the baseline by more than the
+    tolerance, each with its baseline time and ratio.
+
+    Parameters
+    ----------
+    results : list
+        Stage results given by sweep.
+    baseline : dict
+        A report written by a previous sweep.
+    tolerance : float, optional
+        Allowed relative slowdown.
+    '''
+
+    reference = {(result['stage'], result['nlines']): result['seconds']
+                 for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = reference.get((result['stage'], result['nlines']))
+        if before and result['seconds'] > before * (1 + tolerance):
+            regressions.append(dict(result, baseline=before,
+                                    ratio=result['seconds'] / before))
+
+    return regressions
+
+
+def environment():
+    '''Returns a description of the machine and library versions.'''
+
+    import scipy
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+# Runs the sweep with the options given in the command line.
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Run the stage benchmarks over synthetic dumps.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=list(DEFAULT_SIZES))
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        default=list(STAGES))
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY,
+                        help='cache of the generated inputs')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='json report file')
+    parser.add_argument('--baseline', help='json report to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also write the report to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(message)s')
+    logging.getLogger().setLevel(logging.INFO)
+
+    results = sweep(args.sizes, args.stages, args.directory, args.repeat,
+                    args.workers, args.seed)
+    report = {'environment': environment(),
+              'options': {'sizes': args.sizes, 'repeat': args.repeat,
+                          'workers': args.workers, 'seed': args.seed},
+              'results': results,
+              'scaling': scaling(results)}
+
+    regressions = []
+    if args.baseline and not args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f),
+                                      args.tolerance)
+        else:
+            logging.warning('No baseline at %s.', args.baseline)
+    report['regressions'] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline and args.baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+
+    for regression in regressions:
+        logging.warning('%s on %s lines is %.2fx slower than the baseline.',
+                        regression['stage'], regression['nlines'],
+                        regression['ratio'])
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+''' Deterministic synthetic inputs for the benchmarks.
+
+Generates bz2 compressed json lines dumps shaped like the Reddit
+submission dumps, together with a GloVe style text model and a
+``word<TAB>count`` reference corpus over the same vocabulary. Everything
+is drawn from a seeded numpy RandomState, so the same parameters always
+give byte identical files.
+
+Posts are spread over a mix of domains, self posts carry a text whose
+length in words follows a log-normal distribution and whose words are
+drawn from a Zipf distribution over the vocabulary. The most frequent
+ranks hold English function words and contractions, so the cleaning
+stages have real work to do.
+
+'''
+
+import os
+import bz2
+import json
+import hashlib
+import argparse
+import logging
+import numpy as np
+
+# Domain mix of the generated posts, self posts are the ones with text.
+DOMAINS = (('self.depression', 0.1), ('self.AskReddit', 0.4),
+           ('i.imgur.com', 0.3), ('youtube.com', 0.2))
+
+# Highest ranked words of the vocabulary.
+COMMON_WORDS = ('i', 'the', 'to', 'and', 'a', 'my', 'of', 'it', 'is',
+                'that', 'in', 'me', "i'm", 'but', 'so', 'just', 'not',
+                "don't", 'have', 'this', 'for', 'was', 'with', 'be',
+                'like', "it's", 'feel', 'you', 'do', 'on', "can't", 'all')
+
+SYLLABLES = ('ka', 'lo', 'mi', 're', 'su', 'ta', 'ne', 'po', 'vi', 'da',
+             'ri', 'mo', 'le', 'fa', 'zu', 'bi', 'no', 'se', 'tu', 'ga',
+             'he', 'ju', 'wa', 'ce', 'xo', 'ly', 'pra', 'sto', 'ble', 'tri')
+
+
+def make_vocabulary(size, seed=0):
+    '''Returns size distinct words, COMMON_WORDS first and made up
+    alphabetic words after them.
+
+    Parameters
+    ----------
+    size : int
+        Number of words.
+    seed : int, optional
+        Random seed.
+    '''
+
+    rng = np.random.RandomState(seed)
+    words = list(COMMON_WORDS[:size])
+    seen = set(words)
+    syllables = np.array(SYLLABLES)
+
+    while len(words) < size:
+        lengths = rng.randint(1, 5, size=size)
+        for length in lengths:
+            word = ''.join(rng.choice(syllables, length))
+            if word not in seen:
+                seen.add(word)
+                words.append(word)
+                if len(words) == size:
+                    break
+
+    return words
+
+
+def zipf_probabilities(size, exponent):
+    '''Returns the probabilities of ranks 1..size under Zipf's law.
+
+    Parameters
+    ----------
+    size : int
+        Number of ranks.
+    exponent : float
+        Zipf exponent, around 1 for natural language.
+    '''
+
+    weights = np.arange(1, size + 1, dtype='float') ** -exponent
+    return weights / weights.sum()
+
+
+def make_text(rng, words, probabilities, nwords, sentence_words=12):
+    '''Returns a text of nwords words split into capitalized sentences.
+
+    Parameters
+    ----------
+    rng : RandomState
+        Random source.
+    words : array
+        Vocabulary.
+    probabilities : array
+        Probability of every word.
+    nwords : int
+        Number of words.
+    sentence_words : int, optional
+        Mean number of words per sentence.
+    '''
+
+    tokens = words[rng.choice(len(words), nwords, p=probabilities)]
+    sentences = []
+    start = 0
+    while start < nwords:
+        stop = start + 1 + rng.poisson(sentence_words - 1)
+        sentence = ' '.join(tokens[start:stop])
+        sentences.append(sentence[:1].upper() + sentence[1:] +
+                         rng.choice(('.', '.', '?', '!')))
+        start = stop
+
+    return ' '.join(sentences)
+
+
+def write_dump(path, nlines, domains=DOMAINS, vocabulary_size=20000,
+               zipf_exponent=1.1, mean_words=60, length_sigma=0.8,
+               seed=0):
+    '''Writes a synthetic Reddit dump of nlines json lines.
+
+    Parameters
+    ----------
+    path : str
+        Output bz2 file.
+    nlines : int
+        Number of posts.
+    domains : tuple, optional
+        Pairs of domain and share of the posts.
+    vocabulary_size : int, optional
+        Number of distinct words of the texts.
+    zipf_exponent : float, optional
+        Exponent of the word frequency distribution.
+    mean_words : float, optional
+        Mean number of words of a self post.
+    length_sigma : float, optional
+        Standard deviation of the log of the text lengths.
+    seed : int, optional
+        Random seed.
+    '''
+
+    logging.debug('Writing %s posts into %s.', nlines, path)
+
+    rng = np.random.RandomState(seed)
+    words = np.array(make_vocabulary(vocabulary_size, seed))
+    probabilities = zipf_probabilities(vocabulary_size, zipf_exponent)
+    names = [name for name, _ in domains]
+    shares = np.array([share for _, share in domains], dtype='float')
+    picks = rng.choice(len(names), nlines, p=shares / shares.sum())
+    # Log-normal lengths with the requested mean.
+    mu = np.log(mean_words) - length_sigma ** 2 / 2
+    lengths = np.maximum(1, rng.lognormal(mu, length_sigma, nlines))
+
+    with bz2.open(path, 'wt', encoding='utf-8') as dump:
+        for number, (pick, length) in enumerate(zip(picks, lengths)):
+            domain = names[pick]
+            is_self = domain.startswith('self.')
+            post = {
+                'id': np.base_repr(number + 36 ** 5, 36).lower(),
+                'title': make_text(rng, words, probabilities, 8, 8),
+                'score': int(rng.geometric(0.05)),
+                'domain': domain,
+                'selftext': make_text(rng, words, probabilities,
+                                      int(length)) if is_self else '',
+                'subreddit': domain[5:] if is_self else 'pics',
+                'created_utc': 1506816000 + number,
+            }
+            dump.write(json.dumps(post) + '\n')
+
+
+def write_glove(path, words, dim=50, seed=0):
+    '''Writes a GloVe style text model with a random vector per word.
+
+    Parameters
+    ----------
+    path : str
+        Output text file.
+    words : list
+        Words of the model.
+    dim : int, optional
+        Vector size.
+    seed : int, optional
+        Random seed.
+    '''
+
+    rng = np.random.RandomState(seed)
+    with open(path, 'w', encoding='utf8') as model:
+        for word in words:
+            vector = rng.normal(0, 0.5, dim)
+            model.write(word + ' ' + ' '.join('%.5f' % value
+                                              for value in vector) + '\n')
+
+
+def write_counts(path, words, zipf_exponent=1.0, total=10 ** 9, seed=0):
+    '''Writes a count_1w.txt style reference corpus, most frequent first.
+
+    The words are shuffled before the counts are assigned, except the
+    common words which keep their ranks, so the reference distribution
+    differs from the one of the dump.
+
+    Parameters
+    ----------
+    path : str
+        Output text file.
+    words : list
+        Words of the corpus.
+    zipf_exponent : float, optional
+        Exponent of the frequency distribution.
+    total : int, optional
+        Approximate sum of the counts.
+    seed : int, optional
+        Random seed.
+    '''
+
+    rng = np.random.RandomState(seed)
+    head = list(words[:len(COMMON_WORDS)])
+    tail = list(words[len(COMMON_WORDS):])
+    rng.shuffle(tail)
+    counts = np.maximum(1, zipf_probabilities(len(words), zipf_exponent) *
+                        total).astype(np.int64)
+
+    with open(path, 'w', encoding='utf8') as corpus:
+        for word, count in zip(head + tail, counts):
+            corpus.write(f'{word}\t{count}\n')
+
+
+class SyntheticCorpus:
+    '''
+    A generated dump, GloVe model and reference corpus sharing one
+    vocabulary, cached in a directory.
+
+    File names hold a digest of the parameters, so files written with
+    other parameters are never reused.
+
+    Attributes
+    ----------
+    directory : str
+        Directory holding the files.
+    nlines : int
+        Number of posts of the dump.
+    topic : str
+        Domain of the posts analysed by the benchmarks.
+    params : dict
+        Generation parameters.
+
+    Methods
+    -------
+    generate(force=False)
+        Writes the files that do not exist yet.
+    '''
+
+    def __init__(self, directory, nlines=10000, seed=0, domains=DOMAINS,
+                 vocabulary_size=20000, zipf_exponent=1.1, mean_words=60,
+                 length_sigma=0.8, dim=50):
+        '''
+        Parameters
+        ----------
+        directory : str
+            Directory holding the files.
+        nlines : int, optional
+            Number of posts of the dump.
+        seed : int, optional
+            Random seed.
+        domains : tuple, optional
+            Pairs of domain and share of the posts, the first one is the
+            topic of the benchmarks.
+        vocabulary_size : int, optional
+            Number of distinct words.
+        zipf_exponent : float, optional
+            Exponent of the word frequency distribution.
+        mean_words : float, optional
+            Mean number of words of a self post.
+        length_sigma : float, optional
+            Standard deviation of the log of the text lengths.
+        dim : int, optional
+            Vector size of the GloVe model.
+        '''
+
+        self.directory = directory
+        self.nlines = nlines
+        self.topic = domains[0][0]
+        self.params = dict(seed=seed, domains=tuple(domains),
+                           vocabulary_size=vocabulary_size,
+                           zipf_exponent=zipf_exponent,
+                           mean_words=mean_words,
+                           length_sigma=length_sigma, dim=dim)
+        digest = hashlib.md5(repr(sorted(self.params.items())).encode())
+        self._stem = os.path.join(directory, digest.hexdigest()[:10])
+
+    @property
+    def dump_path(self):
+        return f'{self._stem}.rs{self.nlines}.bz2'
+
+    @property
+    def glove_path(self):
+        return f'{self._stem}.glove.{self.params["dim"]}d.txt'
+
+    @property
+    def counts_path(self):
+        return f'{self._stem}.count_1w.txt'
+
+    def generate(self, force=False):
+        '''Writes the dump, the GloVe model and the reference corpus,
+        skipping the files already written. Returns the corpus.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Rewrite existing files.
+        '''
+
+        os.makedirs(self.directory, exist_ok=True)
+        params = self.params
+        words = None
+
+        if force or not os.path.exists(self.dump_path):
+            write_dump(self.dump_path, self.nlines, params['domains'],
+                       params['vocabulary_size'], params['zipf_exponent'],
+                       params['mean_words'], params['length_sigma'],
+                       params['seed'])
+        if force or not os.path.exists(self.glove_path):
+            words = make_vocabulary(params['vocabulary_size'],
+                                    params['seed'])
+            write_glove(self.glove_path, words, params['dim'],
+                        params['seed'])
+        if force or not os.path.exists(self.counts_path):
+            words = words or make_vocabulary(params['vocabulary_size'],
+                                             params['seed'])
+            write_counts(self.counts_path, words, seed=params['seed'])
+
+        return self
+
+
+# Writes a synthetic corpus into the directory given in the command line.
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic Reddit dump, GloVe model and '
+                    'reference corpus.')
+    parser.add_argument('directory')
+    parser.add_argument('--nlines', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--vocabulary-size', type=int, default=20000)
+    parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    parser.add_argument('--mean-words', type=float, default=60)
+    parser.add_argument('--length-sigma', type=float, default=0.8)
+    parser.add_argument('--dim', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(message)s',
+                        level=logging.DEBUG)
+    corpus = SyntheticCorpus(args.directory, args.nlines, args.seed,
+                             vocabulary_size=args.vocabulary_size,
+                             zipf_exponent=args.zipf_exponent,
+                             mean_words=args.mean_words,
+                             length_sigma=args.length_sigma,
+                             dim=args.dim).generate()
+    for path in (corpus.dump_path, corpus.glove_path, corpus.counts_path):
+        logging.debug('Wrote %s.', path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='App',
       version='1.0',
@@ -6,6 +6,18 @@ setup(name='App',
       author='Mario Moraño Orviz',
       author_email='moraorviz@gmail.com',
       packages=['app'],
+      install_requires=['contractions', 'nltk', 'numpy', 'scipy'],
+      entry_points={
+          'console_scripts': [
+              'ir-textrank = app.textrank:main',
+              'ir-llr = app.rootloglikelihood:main',
+              'ir-bz2index = app.bz2index:main',
+              'ir-refcorpus = app.refcorpus:main',
+              'ir-vectorstore = app.vectorstore:main',
+              'ir-topics = app.topics:main',
+              'ir-partials = app.partials:main',
+              'ir-corpus = app.corpus:main',
+              'ir-search = app.search:main',
+          ],
+      },
       )
-
-
@@ -0,0 +1,134 @@
+import os
+import bz2
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from benchmarks import synthetic
+from benchmarks.synthetic import (SyntheticCorpus, make_vocabulary,
+                                  write_dump)
+from benchmarks.stages import STAGES
+from benchmarks.sweep import compare, scaling, sweep
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class SyntheticTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_dump_is_deterministic(self):
+        write_dump(self.path('a.bz2'), 300, vocabulary_size=500, seed=3)
+        write_dump(self.path('b.bz2'), 300, vocabulary_size=500, seed=3)
+        write_dump(self.path('c.bz2'), 300, vocabulary_size=500, seed=4)
+        self.assertEqual(read(self.path('a.bz2')), read(self.path('b.bz2')))
+        self.assertNotEqual(read(self.path('a.bz2')),
+                            read(self.path('c.bz2')))
+
+    def test_dump_shape(self):
+        domains = (('self.depression', 0.5), ('youtube.com', 0.5))
+        write_dump(self.path('a.bz2'), 400, domains, vocabulary_size=100,
+                   mean_words=20)
+        with bz2.open(self.path('a.bz2'), 'rt') as f:
+            posts = [json.loads(line) for line in f]
+
+        self.assertEqual(len(posts), 400)
+        self.assertEqual(len({post['id'] for post in posts}), 400)
+        self.assertEqual({post['domain'] for post in posts},
+                         {name for name, _ in domains})
+        vocabulary = set(make_vocabulary(100))
+        for post in posts:
+            if post['domain'] == 'youtube.com':
+                self.assertEqual(post['selftext'], '')
+                continue
+            words = post['selftext'].lower().replace('.', ' ').replace(
+                '?', ' ').replace('!', ' ').split()
+            self.assertTrue(words)
+            self.assertTrue(set(words) <= vocabulary)
+
+    def test_vocabulary(self):
+        words = make_vocabulary(2000, seed=1)
+        self.assertEqual(len(set(words)), 2000)
+        self.assertEqual(words[:len(synthetic.COMMON_WORDS)],
+                         list(synthetic.COMMON_WORDS))
+        self.assertEqual(make_vocabulary(5), list(synthetic.COMMON_WORDS[:5]))
+
+    def test_corpus_files_are_cached(self):
+        corpus = SyntheticCorpus(self.directory, 100, vocabulary_size=300,
+                                 dim=4).generate()
+        paths = (corpus.dump_path, corpus.glove_path, corpus.counts_path)
+        contents = [read(path) for path in paths]
+
+        with mock.patch.object(synthetic, 'write_dump',
+                               side_effect=AssertionError):
+            SyntheticCorpus(self.directory, 100, vocabulary_size=300,
+                            dim=4).generate()
+        self.assertEqual([read(path) for path in paths], contents)
+
+        other = SyntheticCorpus(self.directory, 100, vocabulary_size=300,
+                                dim=4, seed=1)
+        self.assertNotEqual(other.dump_path, corpus.dump_path)
+        corpus.generate(force=True)
+        self.assertEqual([read(path) for path in paths], contents)
+
+        # The three files share one vocabulary.
+        with open(corpus.glove_path, encoding='utf8') as f:
+            glove = [line.split()[0] for line in f]
+        with open(corpus.counts_path, encoding='utf8') as f:
+            counts = [line.split()[0] for line in f]
+        self.assertEqual(sorted(glove), sorted(counts))
+        self.assertEqual(glove, make_vocabulary(300))
+
+
+class SweepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_every_stage_runs(self):
+        results = sweep((120, 240), directory=self.directory, repeat=1)
+        self.assertEqual([result['stage'] for result in results],
+                         list(STAGES) * 2)
+        for result in results:
+            self.assertGreater(result['items'], 0)
+            self.assertGreaterEqual(result['seconds'], 0)
+            self.assertLessEqual(result['seconds'], result['median'])
+        self.assertTrue(set(scaling(results)) <= set(STAGES))
+
+    def test_scaling_and_compare(self):
+        results = [{'stage': 'linear', 'nlines': n, 'seconds': n / 100}
+                   for n in (100, 1000, 10000)]
+        results += [{'stage': 'quadratic', 'nlines': n,
+                     'seconds': (n / 100) ** 2} for n in (100, 1000)]
+        results += [{'stage': 'single', 'nlines': 100, 'seconds': 1.0}]
+        exponents = scaling(results)
+        self.assertAlmostEqual(exponents['linear'], 1.0)
+        self.assertAlmostEqual(exponents['quadratic'], 2.0)
+        self.assertNotIn('single', exponents)
+
+        baseline = {'results': [dict(result, seconds=1.0)
+                                for result in results]}
+        slower = compare(results, baseline, tolerance=0.5)
+        self.assertEqual(sorted((r['stage'], r['nlines']) for r in slower),
+                         [('linear', 1000), ('linear', 10000),
+                          ('quadratic', 1000)])
+        self.assertEqual(slower[0]['baseline'], 1.0)
+        self.assertEqual(compare(results, {'results': []}), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import bz2
+import random
+import shutil
+import itertools
+import tempfile
+import unittest
+from app.bz2index import BZ2Index
+from app.ingest import open_lines
+
+
+def random_lines(rng, nlines):
+    # Lines of very different lengths, empty ones and multibyte ones.
+    letters = 'abcdefghijklmnopqrstuvwxyz ñé{}":,'
+    lines = []
+    for _ in range(nlines):
+        length = rng.choice((0, 5, 80, 400, 3000))
+        lines.append(''.join(rng.choice(letters) for _ in range(length)))
+    return lines
+
+
+class BZ2IndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rng = random.Random(0)
+        text = '\n'.join(random_lines(rng, 600) + ['end'])
+        text = text.encode('utf-8')
+
+        # One stream of many 100k blocks, ending without a newline.
+        cls.single = os.path.join(cls.directory, 'single.bz2')
+        with open(cls.single, 'wb') as f:
+            f.write(bz2.compress(text, 1))
+
+        # Streams cut in the middle of lines, ending with a newline.
+        cls.multi = os.path.join(cls.directory, 'multi.bz2')
+        cuts = sorted(rng.sample(range(1, len(text)), 4))
+        with open(cls.multi, 'wb') as f:
+            for a, b in zip([0] + cuts, cuts + [len(text)]):
+                f.write(bz2.compress(text[a:b], rng.choice((1, 9))))
+            f.write(bz2.compress(b'\n', 9))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def expected(self, path, start=0, stop=None, binary=False):
+        with bz2.open(path, 'rb' if binary else 'rt') as f:
+            return list(itertools.islice(f, start, stop))
+
+    def test_blocks(self):
+        index = BZ2Index.build(self.single)
+        self.assertGreater(len(index), 4)
+        self.assertEqual(index.nlines, len(self.expected(self.single)))
+        self.assertTrue(index.trailing_line)
+        with open(self.single, 'rb') as f:
+            data = b''.join(index.read_block(f, block)
+                            for block in range(len(index)))
+        self.assertEqual(data, b''.join(self.expected(self.single,
+                                                      binary=True)))
+
+    def test_line_ranges(self):
+        rng = random.Random(1)
+        for path in (self.single, self.multi):
+            index = BZ2Index.build(path)
+            lines = self.expected(path)
+            self.assertEqual(index.nlines, len(lines))
+            self.assertEqual(list(index.iter_lines()), lines)
+            ranges = [(0, 1), (0, None), (len(lines) - 1, None),
+                      (len(lines), None), (5, 5), (10, len(lines) + 10)]
+            ranges += [tuple(sorted(rng.sample(range(len(lines)), 2)))
+                       for _ in range(20)]
+            for start, stop in ranges:
+                self.assertEqual(list(index.iter_lines(start, stop)),
+                                 lines[start:stop], (path, start, stop))
+            start, stop = ranges[-1]
+            self.assertEqual(list(index.iter_lines(start, stop, True)),
+                             self.expected(path, start, stop, True))
+
+    def test_split_covers_file(self):
+        index = BZ2Index.build(self.multi)
+        for parts in (1, 3, 100):
+            ranges = index.split(parts)
+            self.assertLessEqual(len(ranges), parts)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], index.nlines)
+            for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(stop, start)
+            lines = [line for a, b in ranges
+                     for line in index.iter_lines(a, b)]
+            self.assertEqual(lines, self.expected(self.multi))
+
+    def test_open_lines_uses_index(self):
+        path = os.path.join(self.directory, 'copy.bz2')
+        shutil.copy(self.multi, path)
+        expected = self.expected(path, 30, 90, True)
+        self.assertEqual(list(open_lines(path, 30, 90, True)), expected)
+        BZ2Index.build(path)
+        self.assertTrue(BZ2Index.exists(path))
+        self.assertEqual(list(open_lines(path, 30, 90, True)), expected)
+
+    def test_stale_index_is_rebuilt(self):
+        path = os.path.join(self.directory, 'stale.bz2')
+        shutil.copy(self.single, path)
+        BZ2Index.build(path)
+        with open(path, 'wb') as f:
+            f.write(bz2.compress(b'one\ntwo\n'))
+        self.assertEqual(list(BZ2Index.open(path).iter_lines()),
+                         ['one\n', 'two\n'])
+
+    def test_not_bz2(self):
+        path = os.path.join(self.directory, 'plain.txt')
+        with open(path, 'wb') as f:
+            f.write(b'plain text\n')
+        with self.assertRaises(ValueError):
+            BZ2Index.build(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import bz2
+import json
+import shutil
+import tempfile
+import unittest
+from app.corpus import CorpusStore
+from app.textrank import Words
+from benchmarks.synthetic import write_dump
+
+
+class CorpusStoreTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.dump = os.path.join(cls.directory, 'RS_test.bz2')
+        write_dump(cls.dump, 300, vocabulary_size=400, mean_words=20)
+        with bz2.open(cls.dump, 'rt') as f:
+            cls.posts = [json.loads(line) for line in f]
+        # Small chunks so the regrouping takes many of them.
+        cls.store_path = os.path.join(cls.directory, 'store')
+        cls.store = CorpusStore.convert(cls.dump, cls.store_path,
+                                        chunk_size=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_no_temporary_files(self):
+        self.assertFalse(os.path.exists(self.store_path + '.tmp'))
+        for name in os.listdir(self.store_path):
+            self.assertFalse(name.endswith('.tmp'), name)
+
+    def test_documents_match_dump(self):
+        self.assertEqual(len(self.store), len(self.posts))
+        self.assertEqual(self.store.domains,
+                         sorted({post['domain'] for post in self.posts}))
+        for topic in self.store.domains:
+            expected = [(number, post['selftext'], {'id': post['id']})
+                        for number, post in enumerate(self.posts)
+                        if post['domain'] == topic]
+            self.assertEqual(list(self.store.documents(topic,
+                                                       fields=('id',))),
+                             expected)
+
+    def test_line_range(self):
+        topic = 'self.AskReddit'
+        expected = [number for number, post in enumerate(self.posts)
+                    if post['domain'] == topic and 50 <= number < 120]
+        lines = [number for number, _, _ in
+                 self.store.documents(topic, 50, 120)]
+        self.assertEqual(lines, expected)
+
+    def test_counts_match_dump(self):
+        for topic in ('self.depression', 'self.AskReddit', 'youtube.com'):
+            expected = Words(self.dump, topic).get_words(None)
+            counts = Words(self.store_path, topic).get_words(None)
+            self.assertEqual(list(counts.items()), list(expected.items()))
+
+    def test_counts_without_tokens(self):
+        store_path = os.path.join(self.directory, 'texts')
+        CorpusStore.convert(self.dump, store_path, tokens=False,
+                            fields=(), chunk_size=64)
+        topic = 'self.depression'
+        expected = Words(self.dump, topic).get_words(None)
+        counts = Words(store_path, topic).get_words(None)
+        self.assertEqual(list(counts.items()), list(expected.items()))
+
+    def test_find(self):
+        self.assertIsNone(CorpusStore.find(self.dump))
+        self.assertIsNotNone(CorpusStore.find(self.store_path))
+        self.assertIsNone(CorpusStore.find(self.store_path,
+                                           text_id='title'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import shutil
+import tempfile
+import importlib
+import subprocess
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ('bz2index', 'corpus', 'ingest', 'instrument', 'lexicon',
+           'partials', 'pipeline', 'refcorpus', 'rootloglikelihood',
+           'search', 'sketch', 'solvers', 'textrank', 'topics',
+           'vectorstore', 'vocabulary')
+
+# Imported by a fresh interpreter, prints what the import left behind.
+CHECK = '''
+import os, sys, logging
+import app.{module}
+print(sorted(name for name in ('nltk', 'scipy') if name in sys.modules))
+print(len(logging.getLogger().handlers), os.listdir('.'))
+'''
+
+
+def entry_points():
+    # Console scripts declared by setup.py, as (name, module) pairs.
+    with open(os.path.join(ROOT, 'setup.py')) as f:
+        lines = [line.strip().strip("',") for line in f if ':main' in line]
+    return [tuple(part.strip() for part in line.split('='))
+            for line in lines]
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_imports_have_no_side_effects(self):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        for module in MODULES:
+            output = subprocess.run(
+                [sys.executable, '-c', CHECK.format(module=module)],
+                cwd=self.directory, env=env, check=True,
+                capture_output=True, text=True)
+            self.assertEqual(output.stdout.splitlines(), ['[]', '0 []'],
+                             module)
+            self.assertEqual(output.stderr, '', module)
+
+    def test_entry_points(self):
+        scripts = entry_points()
+        self.assertGreaterEqual(len(scripts), 9)
+        for name, target in scripts:
+            self.assertTrue(name.startswith('ir-'), name)
+            module_name, function = target.split(':')
+            main = getattr(importlib.import_module(module_name), function)
+            with redirect_stdout(StringIO()) as usage:
+                with self.assertRaises(SystemExit) as raised:
+                    main(['--help'])
+            self.assertEqual(raised.exception.code, 0, name)
+            self.assertIn('usage:', usage.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
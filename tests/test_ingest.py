@@ -0,0 +1,135 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from app.bz2index import BZ2Index
+from app.ingest import (DomainFilter, MultiDomainFilter, TreeReducer,
+                        parallel_count)
+from app.rootloglikelihood import DataGenerator
+from app.textrank import Words
+from app.vocabulary import Vocabulary
+from benchmarks.synthetic import write_dump
+
+
+def crosspost(domain, nested):
+    # Raw line of a post whose crosspost parent comes before its domain.
+    return json.dumps({'crosspost_parent_list': [{'domain': nested,
+                                                  'selftext': 'parent'}],
+                       'domain': domain, 'selftext': 'I feel alone',
+                       'id': 'abc'}).encode('utf-8')
+
+
+class MultiDomainFilterTest(unittest.TestCase):
+
+    def test_crosspost_keeps_top_level_domain(self):
+        line = crosspost('self.depression', 'self.AskReddit')
+        expected = json.loads(line)
+        for posts in (MultiDomainFilter(['self.depression']),
+                      MultiDomainFilter(), DomainFilter('self.depression')):
+            post = posts.parse(line)
+            self.assertIsNotNone(post)
+            self.assertEqual(post['domain'], expected['domain'])
+            self.assertEqual(post['selftext'], expected['selftext'])
+
+    def test_crosspost_nested_domain_is_not_matched(self):
+        line = crosspost('self.AskReddit', 'self.depression')
+        self.assertIsNone(MultiDomainFilter(['self.depression']).parse(line))
+        self.assertIsNone(DomainFilter('self.depression').parse(line))
+
+    def test_single_domain(self):
+        line = json.dumps({'domain': 'self.depression',
+                           'selftext': 'text'}).encode('utf-8')
+        posts = MultiDomainFilter(['self.depression'])
+        self.assertEqual(posts.domain(line), 'self.depression')
+        self.assertEqual(posts.parse(line)['selftext'], 'text')
+
+
+class DomainFilterTest(unittest.TestCase):
+
+    def check(self, post, fields=()):
+        line = json.dumps(post).encode('utf-8')
+        read = DomainFilter('self.depression', fields=fields).parse(line)
+        self.assertIsNotNone(read)
+        for field in ('domain', 'selftext') + fields:
+            self.assertEqual(read[field], post[field])
+
+    def test_field_name_as_value(self):
+        self.check({'domain': 'self.depression', 'selftext': 'hi',
+                    'title': 'id', 'id': 'abc'}, fields=('id',))
+        line = json.dumps({'domain': 'self.depression', 'selftext': 'hi',
+                           'title': 'id'}).encode('utf-8')
+        post = DomainFilter('self.depression', fields=('id',)).parse(line)
+        self.assertEqual(post, json.loads(line))
+
+    def test_field_name_in_selftext(self):
+        self.check({'domain': 'self.depression',
+                    'selftext': 'my "id": 1, "domain": "self.AskReddit"',
+                    'id': 'abc'}, fields=('id',))
+        self.check({'selftext': 'domain', 'domain': 'self.depression',
+                    'id': 'abc'}, fields=('id',))
+
+
+class ParallelCountTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.dump = os.path.join(cls.directory, 'RS_test.bz2')
+        write_dump(cls.dump, 400, vocabulary_size=500, mean_words=20)
+        # Several streams, so the index gives several block ranges.
+        cls.indexed = os.path.join(cls.directory, 'RS_indexed.bz2')
+        with open(cls.indexed, 'wb') as f:
+            for seed in range(3):
+                path = os.path.join(cls.directory, f'part{seed}.bz2')
+                write_dump(path, 150, vocabulary_size=500, mean_words=20,
+                           seed=seed)
+                with open(path, 'rb') as part:
+                    f.write(part.read())
+        BZ2Index.build(cls.indexed)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def check(self, counts, expected):
+        self.assertEqual(list(counts.items()), list(expected.items()))
+
+    def test_words_match_serial(self):
+        for dump in (self.dump, self.indexed):
+            for topic in ('self.depression', 'youtube.com'):
+                for nlines, start in ((None, 0), (170, 0), (200, 33)):
+                    expected = Words(dump, topic).get_words(nlines,
+                                                            start=start)
+                    counts = Words(dump, topic).get_words(
+                        nlines, workers=2, chunk_size=37, start=start)
+                    self.check(counts, expected)
+
+    def test_data_generator_matches_serial(self):
+        expected = DataGenerator(self.dump).getwords(300)
+        counts = DataGenerator(self.dump).getwords(300, workers=3,
+                                                   chunk_size=50)
+        self.check(counts, expected)
+
+    def test_counter_is_updated(self):
+        counter = Vocabulary(['previous', 'words'])
+        counts = parallel_count(self.dump, 'self.depression', workers=2,
+                                chunk_size=64, counter=counter)
+        self.assertIs(counts, counter)
+        expected = Vocabulary(['previous', 'words'])
+        expected.update(Words(self.dump, 'self.depression').get_words(None))
+        self.check(counts, expected)
+
+    def test_tree_reducer_keeps_order(self):
+        documents = [['c', 'a'], ['b'], ['a', 'd'], [], ['e', 'b'], ['f']]
+        reducer = TreeReducer()
+        serial = Vocabulary()
+        for document in documents:
+            reducer.push(Vocabulary(document))
+            serial.update(document)
+        self.check(reducer.result(), serial)
+        self.assertEqual(len(TreeReducer().result()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
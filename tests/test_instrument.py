@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from app.instrument import (NullRecorder, Recorder, get_recorder,
+                            recording)
+from app.textrank import Words
+from benchmarks.synthetic import write_dump
+
+
+class RecorderTest(unittest.TestCase):
+
+    def test_null_recorder_passes_through(self):
+        recorder = get_recorder()
+        self.assertIsInstance(recorder, NullRecorder)
+        self.assertNotIsInstance(recorder, Recorder)
+        items = [1, 2, 3]
+        self.assertIs(recorder.timed(items, 'numpy', 'items'), items)
+        self.assertIs(recorder.wrap(len, 'numpy'), len)
+        with recorder.stage('stage'), recorder.timer('numpy'):
+            recorder.count('items')
+            recorder.set('value', 1)
+
+    def test_recording_blocks_nest(self):
+        with recording('outer') as outer:
+            self.assertIs(get_recorder(), outer)
+            with recording('inner') as inner:
+                self.assertIs(get_recorder(), inner)
+                get_recorder().count('items', 2)
+            self.assertIs(get_recorder(), outer)
+            self.assertEqual(inner.counters, {'items': 2})
+            self.assertEqual(outer.counters, {})
+        self.assertIsInstance(get_recorder(), NullRecorder)
+
+        with self.assertRaises(KeyError):
+            with recording('failed'):
+                raise KeyError('stage')
+        self.assertNotIsInstance(get_recorder(), Recorder)
+
+    def test_timers_and_counters(self):
+        recorder = Recorder('run')
+        with recorder.stage('read'):
+            with recorder.timer('bz2'):
+                pass
+        with recorder.stage('read'):
+            pass
+        recorder.count('lines')
+        recorder.count('lines', 4)
+        recorder.set('vocabulary', 7)
+        recorder.set('vocabulary', 8)
+        self.assertEqual(list(recorder.stages), ['read'])
+        self.assertGreaterEqual(recorder.stages['read'],
+                                recorder.timers['bz2'])
+        self.assertEqual(recorder.counters, {'lines': 5})
+        self.assertEqual(recorder.values, {'vocabulary': 8})
+
+    def test_timed_counts_pulled_items(self):
+        recorder = Recorder('run')
+        self.assertEqual(list(recorder.timed(range(5), 'bz2', 'lines')),
+                         list(range(5)))
+        # A consumer stopping early still reports the items it pulled.
+        items = recorder.timed(range(100), 'bz2', 'lines')
+        for item in items:
+            if item == 9:
+                break
+        items.close()
+        # Nothing is recorded before the first item is pulled.
+        recorder.timed(range(3), 'json')
+        self.assertEqual(recorder.counters, {'lines': 15})
+        self.assertEqual(list(recorder.timers), ['bz2'])
+
+    def test_wrap(self):
+        recorder = Recorder('run')
+        parse = recorder.wrap(int, 'json')
+        self.assertEqual(parse('12'), 12)
+        with self.assertRaises(ValueError):
+            parse('x')
+        self.assertEqual(list(recorder.timers), ['json'])
+        self.assertGreater(recorder.timers['json'], 0)
+
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pipeline_report(self):
+        dump = os.path.join(self.directory, 'RS_test.bz2')
+        write_dump(dump, 150, vocabulary_size=200, mean_words=10)
+        with recording('words') as recorder:
+            with recorder.stage('count'):
+                counts = Words(dump, 'self.depression').get_words(100)
+        path = os.path.join(self.directory, 'report.json')
+        recorder.write(path)
+        with open(path) as f:
+            report = json.load(f)
+
+        self.assertEqual(report['name'], 'words')
+        self.assertEqual(report['counters']['lines_read'], 100)
+        self.assertEqual(list(report['stages']), ['count'])
+        self.assertTrue({'bz2', 'json'} <= set(report['timers']))
+        self.assertGreaterEqual(report['wall_seconds'],
+                                report['stages']['count'])
+        if report['peak_rss_bytes'] is not None:
+            self.assertGreater(report['peak_rss_bytes'], 1 << 20)
+        self.assertGreater(len(counts), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from app.lexicon import Lexicon, MappedLexicon, save_words
+from app.textrank import TextCleaner
+
+
+class LexiconTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.words = ['alone', 'feel', 'night', 'ñandú', 'a', 'ab',
+                      'x' * 30]
+        self.sentences = [['i', 'feel', 'alone', 'tonight'], [],
+                          ['ñandú', 'x' * 31, 'ab', 'a', 'abc'],
+                          ['night', 'night', 'zzz']]
+        self.expected = [[word for word in sentence if word in self.words]
+                         for sentence in self.sentences]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, lexicon):
+        self.assertEqual(len(lexicon), len(self.words))
+        for word in self.words:
+            self.assertIn(word, lexicon)
+        for word in ('', 'abc', 'x' * 31, 'zzz'):
+            self.assertNotIn(word, lexicon)
+        self.assertEqual(lexicon.filter_sentences(self.sentences),
+                         self.expected)
+        self.assertEqual([lexicon.filter_sentence(sentence)
+                          for sentence in self.sentences], self.expected)
+        self.assertEqual(lexicon.filter_sentences([]), [])
+
+    def test_save_and_load(self):
+        path = os.path.join(self.directory, 'nested', 'words.npy')
+        Lexicon(self.words + ['feel']).save(path)
+        self.check(Lexicon.load(path))
+        self.check(Lexicon.from_file(path))
+        self.check(MappedLexicon(path))
+
+    def test_word_list(self):
+        path = os.path.join(self.directory, 'words.txt')
+        with open(path, 'w', encoding='utf8') as f:
+            f.write('# domain words\n\n' + '\n'.join(
+                ' %s ' % word for word in self.words) + '\n')
+        self.check(Lexicon.from_file(path))
+
+    def test_union(self):
+        lexicon = Lexicon(self.words[:3]).union(Lexicon(self.words[3:5]),
+                                                self.words[5:])
+        self.check(lexicon)
+        self.assertEqual(len(Lexicon().union()), 0)
+
+    def test_mapped_lexicon_batches(self):
+        path = os.path.join(self.directory, 'words.npy')
+        save_words(self.words, path)
+        lexicon = MappedLexicon(path)
+        self.assertEqual(lexicon.lookup(['feel', 'x', 'a']).tolist(),
+                         [True, False, True])
+        self.assertEqual(lexicon.filter_sentences(iter(self.sentences)),
+                         self.expected)
+
+    def test_nltk_cache(self):
+        from nltk.corpus import words
+        path = os.path.join(self.directory, 'nltk_words.npy')
+        lexicon = Lexicon.from_nltk(path)
+        self.assertEqual(lexicon.words, frozenset(words.words()))
+        self.assertTrue(os.path.exists(path))
+        # Later runs read the cache, not the corpus.
+        with mock.patch('nltk.corpus.words.words',
+                        side_effect=AssertionError):
+            self.assertEqual(Lexicon.from_nltk(path).words, lexicon.words)
+
+    def test_dictionary_stage(self):
+        text = 'I feel alone tonight. Night after night, a zzz.'
+        cleaner = TextCleaner(text, Lexicon(self.words))
+        stages = ('lower', 'clean', 'dictionary')
+        sentences = list(TextCleaner(text).iter_sentences(stages[:2]))
+        self.assertEqual(list(cleaner.iter_sentences(stages)),
+                         Lexicon(self.words).filter_sentences(sentences))
+        self.assertEqual(list(cleaner.iter_sentences(stages)),
+                         [['feel', 'alone'], ['night', 'night', 'a']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from app.partials import (PartialResult, build_partial, build_partials,
+                          merge_partials, partial_path, dump_month)
+from benchmarks.synthetic import write_dump
+
+
+def edges(graph):
+    # Pair counts of a graph keyed by the words of the pair.
+    words = graph.vocab.words.tolist()
+    rows, cols, counts = graph.pairs.edges()
+    return {(words[i], words[j]): n for i, j, n in
+            zip(rows.tolist(), cols.tolist(), counts.tolist())}
+
+
+class PartialsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'partials')
+        os.makedirs(self.output)
+        self.dumps = []
+        for seed, month in enumerate(('2017-01', '2017-02')):
+            path = os.path.join(self.directory, f'RS_{month}.bz2')
+            write_dump(path, 150, vocabulary_size=300, mean_words=15,
+                       seed=seed)
+            self.dumps.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertPartialEqual(self, first, second):
+        self.assertEqual(first.topics(), second.topics())
+        for topic in first.topics():
+            self.assertEqual(list(first.counts[topic].items()),
+                             list(second.counts[topic].items()))
+            self.assertEqual(list(first.graphs[topic].vocab.items()),
+                             list(second.graphs[topic].vocab.items()))
+            self.assertEqual(edges(first.graphs[topic]),
+                             edges(second.graphs[topic]))
+
+    def test_merge_matches_single_pass(self):
+        both = os.path.join(self.directory, 'both.bz2')
+        with open(both, 'wb') as f:
+            for dump in self.dumps:
+                with open(dump, 'rb') as part:
+                    f.write(part.read())
+
+        paths = build_partials(self.dumps, self.output)
+        merged = merge_partials(paths)
+        self.assertEqual(merged.sources,
+                         [os.path.basename(dump) for dump in self.dumps])
+        self.assertPartialEqual(merged, PartialResult.build(both))
+
+    def test_saved_partial_round_trip(self):
+        path = build_partial(self.dumps[0], self.output)
+        self.assertEqual(dump_month(path), '2017-01')
+        self.assertPartialEqual(PartialResult.load(path),
+                                PartialResult.build(self.dumps[0]))
+
+    def test_merge_rejects_shared_source(self):
+        path = build_partial(self.dumps[0], self.output)
+        with self.assertRaises(ValueError):
+            merge_partials([path, path])
+
+    def test_reuse_and_rebuild(self):
+        path = build_partial(self.dumps[0], self.output, nlines=100)
+        with mock.patch.object(PartialResult, 'build',
+                               side_effect=AssertionError):
+            self.assertEqual(build_partial(self.dumps[0], self.output,
+                                           nlines=100), path)
+
+        for options in ({'nlines': 50}, {'window_size': 2},
+                        {'topics': ['self.depression']},
+                        {'nlines': 100, 'force': True}):
+            before = PartialResult.build
+            with mock.patch.object(PartialResult, 'build',
+                                   side_effect=before) as build:
+                build_partial(self.dumps[0], self.output, **options)
+                build.assert_called_once()
+
+        rebuilt = PartialResult.load(path)
+        self.assertEqual(rebuilt.parameters,
+                         PartialResult.build_parameters(None, 100, None, 4))
+
+    def test_same_name_in_other_directory(self):
+        other = os.path.join(self.directory, 'mirror')
+        os.makedirs(other)
+        copy = os.path.join(other, os.path.basename(self.dumps[0]))
+        write_dump(copy, 40, vocabulary_size=300, seed=7)
+
+        paths = build_partials([self.dumps[0], copy], self.output)
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertNotEqual(partial_path(self.dumps[0], self.output),
+                            partial_path(copy, self.output))
+        self.assertEqual(PartialResult.load(paths[1]).topics(),
+                         PartialResult.build(copy).topics())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import time
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from functools import partial
+from app.ingest import pipelined_count
+from app.instrument import recording
+from app.pipeline import Pipeline
+from app.rootloglikelihood import DataGenerator
+from app.textrank import Words
+from benchmarks.synthetic import write_dump
+
+
+def slow_square(item):
+    # Uneven work so the results finish out of order.
+    time.sleep(random.random() * 0.002)
+    return item * item
+
+
+def fail_on_seven(item):
+    if item == 7:
+        raise KeyError(item)
+    return item
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_results_in_source_order(self):
+        for workers, queue_size in ((1, 1), (4, 2), (8, 16)):
+            results = []
+            pipeline = Pipeline(workers, queue_size)
+            pipeline.run(range(200), slow_square, results.append)
+            self.assertEqual(results, [item * item for item in range(200)])
+
+            report = pipeline.report()
+            self.assertEqual(report['workers'], workers)
+            for stage in ('read', 'work', 'consume'):
+                self.assertEqual(pipeline.stats[stage].items, 200)
+                self.assertIn(stage, report)
+
+    def test_processes(self):
+        results = []
+        pipeline = Pipeline(3, 2, processes=True)
+        pipeline.run(range(50), slow_square, results.append)
+        self.assertEqual(results, [item * item for item in range(50)])
+
+    def test_items_in_flight_are_bounded(self):
+        workers, queue_size = 3, 2
+        limit = 2 * queue_size + workers
+        lock = threading.Lock()
+        state = {'read': 0, 'consumed': 0, 'peak': 0}
+
+        def source():
+            for item in range(300):
+                with lock:
+                    state['read'] += 1
+                    state['peak'] = max(state['peak'],
+                                        state['read'] - state['consumed'])
+                yield item
+
+        def consume(result):
+            # A slow consumer lets the other stages run ahead.
+            time.sleep(0.0005)
+            with lock:
+                state['consumed'] += 1
+
+        Pipeline(workers, queue_size).run(source(), slow_square, consume)
+        self.assertEqual(state['consumed'], 300)
+        self.assertLessEqual(state['peak'], limit + 1)
+
+    def test_errors_are_raised(self):
+        def broken_source():
+            yield 1
+            raise OSError('truncated')
+
+        def broken_consume(results, result):
+            if result == 9:
+                raise ValueError(result)
+
+        cases = ((range(20), fail_on_seven, list.append, KeyError),
+                 (broken_source(), slow_square, list.append, OSError),
+                 (range(20), slow_square, broken_consume, ValueError))
+        for source, work, consume, error in cases:
+            before = threading.active_count()
+            with self.assertRaises(error):
+                Pipeline(2, 1).run(source, work, partial(consume, []))
+            self.assertEqual(threading.active_count(), before)
+
+
+class PipelinedCountTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.dump = os.path.join(cls.directory, 'RS_test.bz2')
+        write_dump(cls.dump, 400, vocabulary_size=500, mean_words=20)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def check(self, counts, expected):
+        self.assertEqual(list(counts.items()), list(expected.items()))
+
+    def test_matches_serial(self):
+        topic = 'self.depression'
+        for nlines, start in ((None, 0), (150, 0), (220, 71)):
+            expected = Words(self.dump, topic).get_words(nlines,
+                                                         start=start)
+            for workers, chunk_size, processes in ((1, 400, False),
+                                                   (3, 17, False),
+                                                   (2, 50, True)):
+                counts = pipelined_count(self.dump, topic, nlines, workers,
+                                         chunk_size, queue_size=2,
+                                         processes=processes, start=start)
+                self.check(counts, expected)
+
+    def test_pipeline_option(self):
+        topic = 'self.AskReddit'
+        expected = Words(self.dump, topic).get_words(None)
+        for workers in (1, 2):
+            with recording('pipeline') as recorder:
+                counts = Words(self.dump, topic).get_words(
+                    None, workers, chunk_size=64, pipeline=True)
+            self.check(counts, expected)
+            report = recorder.values['pipeline']
+            self.assertEqual(report['workers'], workers)
+            self.assertEqual(report['read']['items'], 7)
+            self.assertEqual(recorder.counters['tokens'],
+                             sum(expected.values()))
+
+        self.check(DataGenerator(self.dump, topic).getwords(
+            300, workers=2, chunk_size=40, pipeline=True),
+            DataGenerator(self.dump, topic).getwords(300))
+
+
+if __name__ == '__main__':
+    unittest.main()
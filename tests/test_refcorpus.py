@@ -0,0 +1,81 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from app.refcorpus import FrequencyTable
+from app.rootloglikelihood import CommonWord, RootLogLikelihoodRatio
+from tests.test_rootloglikelihood import random_collections
+
+
+class FrequencyTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, 'count_1w')
+        self.counts = {'the': 23135851162, 'of': 13151942776, 'zebra': 7,
+                       'ñandú': 3, 'a': 1, 'ab': 2, 'x' * 30: 11}
+        self.source = os.path.join(self.directory, 'count_1w.txt')
+        with open(self.source, 'w', encoding='utf8') as f:
+            for word, count in self.counts.items():
+                f.write(f'{word}\t{count}\n')
+            # Malformed lines are skipped, repeated words keep the last.
+            f.write('broken line here\n\nzebra\t9\n')
+        self.counts['zebra'] = 9
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, table):
+        self.assertEqual(len(table), len(self.counts))
+        self.assertEqual(dict(table.items()), self.counts)
+        self.assertEqual(list(table.keys()), sorted(
+            self.counts, key=lambda word: word.encode('utf-8')))
+        for word, count in self.counts.items():
+            self.assertIn(word, table)
+            self.assertEqual(table[word], count)
+            self.assertEqual(table.get(word), count)
+        for word in ('', 'missing', 'zebras', 'x' * 31, 'ñ'):
+            self.assertNotIn(word, table)
+            self.assertEqual(table.get(word), 0)
+            self.assertEqual(table.get(word, None), None)
+            with self.assertRaises(KeyError):
+                table[word]
+
+    def test_convert_round_trip(self):
+        self.check(FrequencyTable.convert(self.source, self.prefix))
+        table = FrequencyTable.load(self.prefix)
+        self.assertIsInstance(table.counts, np.memmap)
+        self.check(table)
+
+    def test_lookup(self):
+        table = FrequencyTable.from_dict(self.counts, self.prefix)
+        words = ['zebra', 'missing', 'the', 'x' * 40, 'ñandú', 'zebra']
+        self.assertEqual(table.lookup(words).tolist(),
+                         [self.counts.get(word, 0) for word in words])
+        self.assertEqual(table.lookup([]).tolist(), [])
+
+    def test_llr_matches_dict(self):
+        reddit, common = random_collections(1)
+        table = FrequencyTable.from_dict(common, self.prefix)
+        expected = RootLogLikelihoodRatio(reddit, common).applyllr()
+        scores = RootLogLikelihoodRatio(reddit, table).applyllr()
+        self.assertEqual(scores, expected)
+
+    def test_common_word_store(self):
+        text = ''.join(f'{word}\t{count}\n'
+                       for word, count in self.counts.items())
+        response = io.BytesIO(text.encode('utf-8'))
+        with mock.patch('urllib.request.urlopen', return_value=response):
+            downloaded = CommonWord(self.prefix).getwords()
+        self.check(downloaded)
+
+        # The second run reads the store and never touches the network.
+        with mock.patch('urllib.request.urlopen', side_effect=OSError):
+            self.check(CommonWord(self.prefix).getwords())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import random
+import unittest
+import numpy as np
+from app.rootloglikelihood import RootLogLikelihoodRatio
+from app.vocabulary import Vocabulary
+
+
+def random_collections(seed, nwords=300):
+    # Reddit and reference counts, some words missing from the reference.
+    rng = random.Random(seed)
+    words = ['w%d' % i for i in range(nwords)]
+    reddit = {word: rng.randint(1, 1000) for word in words}
+    common = {word: rng.randint(1, 10 ** 6) for word in words
+              if rng.random() < 0.8}
+    common['unused'] = 5
+    return reddit, common
+
+
+class RootLogLikelihoodRatioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reddit, self.common = random_collections(0)
+        self.llr = RootLogLikelihoodRatio(self.reddit, self.common)
+        self.scores = self.llr.applyllr()
+
+    def test_matches_scalar_score(self):
+        c, d = len(self.reddit), len(self.common)
+        self.assertEqual(list(self.scores), list(self.reddit))
+        for word, score in self.scores.items():
+            expected = self.llr.calculate_score(
+                self.reddit[word], self.common.get(word, 0), c, d)
+            self.assertAlmostEqual(score, expected, places=9)
+
+    def test_vocabulary_input(self):
+        vocabulary = Vocabulary()
+        vocabulary.update(self.reddit)
+        scores = RootLogLikelihoodRatio(vocabulary, self.common).applyllr()
+        self.assertEqual(list(scores), list(self.scores))
+        np.testing.assert_allclose(list(scores.values()),
+                                   list(self.scores.values()))
+
+    def test_extremes_match_sorted_scores(self):
+        ranked = sorted(self.scores.items(), key=lambda item: item[1])
+        for k in (1, 10, 149):
+            extremes = self.llr.extremes(k)
+            self.assertEqual(list(extremes.values()),
+                             [score for _, score in ranked[:k] + ranked[-k:]])
+            for word, score in extremes.items():
+                self.assertEqual(self.scores[word], score)
+
+    def test_extremes_small_and_large_k(self):
+        for k in (0, -3):
+            self.assertEqual(len(self.llr.extremes(k)), 0)
+
+        ranked = sorted(self.scores.values())
+        for k in (150, 200, 1000):
+            extremes = self.llr.extremes(k)
+            self.assertEqual(len(extremes), len(self.scores))
+            self.assertEqual(list(extremes.values()), ranked)
+
+    def test_extremes_before_applyllr(self):
+        llr = RootLogLikelihoodRatio(self.reddit, self.common)
+        self.assertEqual(len(llr.extremes(5)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
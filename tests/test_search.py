@@ -0,0 +1,140 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from app.search import (IndexBuilder, InvertedIndex, encode_varints,
+                        decode_varints, bm25_idf, bm25_norms, bm25_tf)
+
+
+def exhaustive(posts, weights, k1=1.2, b=0.75):
+    # BM25 score of every post, computed term by term from the tokens.
+    lengths = np.array([len(tokens) for tokens in posts])
+    norms = bm25_norms(lengths, lengths.mean(), k1, b)
+    scores = np.zeros(len(posts))
+    for term, weight in weights.items():
+        tfs = np.array([tokens.count(term) for tokens in posts])
+        df = np.count_nonzero(tfs)
+        if not df:
+            continue
+        scores += weight * bm25_idf(df, len(posts)) * \
+            bm25_tf(tfs, norms, k1)
+    return scores
+
+
+class VarintTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = np.random.RandomState(0)
+        edges = np.array([0, 1, 127, 128, 255, 16383, 16384, 2 ** 32,
+                          2 ** 63 - 1, 2 ** 64 - 1], dtype=np.uint64)
+        values = np.concatenate((
+            edges, rng.randint(0, 300, 1000).astype(np.uint64),
+            rng.randint(0, 2 ** 40, 100, dtype=np.int64).astype(np.uint64)))
+        encoded = encode_varints(values)
+        self.assertEqual(encoded.dtype, np.uint8)
+        self.assertEqual(decode_varints(encoded).tolist(), values.tolist())
+
+    def test_sizes(self):
+        for value, size in ((0, 1), (127, 1), (128, 2), (16383, 2),
+                            (16384, 3), (2 ** 64 - 1, 10)):
+            encoded = encode_varints([value])
+            self.assertEqual(len(encoded), size)
+            self.assertTrue(encoded[-1] < 0x80)
+            self.assertTrue(all(byte >= 0x80 for byte in encoded[:-1]))
+
+    def test_empty(self):
+        self.assertEqual(len(encode_varints([])), 0)
+        self.assertEqual(len(decode_varints(np.zeros(0, np.uint8))), 0)
+
+
+class InvertedIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rng = random.Random(0)
+        words = ['w%d' % i for i in range(400)] + ['ñu']
+        weights = [1.0 / (rank + 1) for rank in range(len(words))]
+        cls.posts = [rng.choices(words, weights, k=rng.randint(1, 60))
+                     for _ in range(500)]
+        # A post far away so gaps need several varint bytes.
+        cls.posts += [[] for _ in range(300)] + [['w3', 'rare', 'rare']]
+
+        builder = IndexBuilder()
+        for number, tokens in enumerate(cls.posts):
+            builder.add(tokens, 10 * number, 'id%d' % number,
+                        ' '.join(tokens))
+        cls.path = os.path.join(cls.directory, 'index')
+        cls.index = builder.save(cls.path, meta={'topic': 'test'})
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_postings(self):
+        terms = sorted({term for tokens in self.posts for term in tokens},
+                       key=lambda term: term.encode('utf-8'))
+        self.assertEqual(len(self.index.terms), len(terms))
+        for i, term in enumerate(terms):
+            self.assertEqual(self.index.find(term), i)
+            docs, tfs = self.index.postings(term)
+            expected = [(doc, tokens.count(term))
+                        for doc, tokens in enumerate(self.posts)
+                        if term in tokens]
+            self.assertEqual(list(zip(docs.tolist(), tfs.tolist())),
+                             expected)
+            self.assertEqual(self.index.df[i], len(expected))
+        self.assertIsNone(self.index.find('missing'))
+        self.assertEqual(len(self.index.postings('missing')[0]), 0)
+
+    def check(self, weights, k):
+        scores = exhaustive(self.posts, weights)
+        results = self.index.search(weights, k)
+        expected = sorted(scores[scores > 0], reverse=True)[:k]
+        np.testing.assert_allclose([score for score, _ in results],
+                                   expected, rtol=1e-9)
+        for score, doc in results:
+            self.assertAlmostEqual(score, scores[doc], delta=1e-9 * score)
+
+    def test_search_matches_exhaustive(self):
+        rng = random.Random(1)
+        vocabulary = sorted({term for tokens in self.posts
+                             for term in tokens})
+        for _ in range(100):
+            terms = rng.sample(vocabulary, rng.randint(1, 6))
+            weights = {term: rng.choice((1.0, rng.random() * 3))
+                       for term in terms}
+            for k in (1, 5, 20):
+                self.check(weights, k)
+
+    def test_query_forms(self):
+        self.check({'w1': 1.0, 'w2': 2.0}, 10)
+        self.assertEqual(self.index.search(['w1', 'w2', 'w2'], 10),
+                         self.index.search({'w1': 1.0, 'w2': 2.0}, 10))
+        # Texts are tokenized, only alphabetic tokens are kept.
+        self.assertEqual(self.index.search('Rare w3 rare unknown', 10),
+                         self.index.search({'rare': 2.0}, 10))
+        self.assertEqual(self.index.search(['unknown'], 10), [])
+        self.assertEqual(self.index.search({'w1': 0.0}, 10), [])
+
+    def test_hits(self):
+        hits = self.index.hits(['rare'], 3)
+        self.assertEqual(len(hits), 1)
+        number = len(self.posts) - 1
+        self.assertEqual(hits[0]['line'], 10 * number)
+        self.assertEqual(hits[0]['id'], 'id%d' % number)
+        self.assertEqual(hits[0]['text'], 'w3 rare rare')
+
+    def test_load(self):
+        self.assertTrue(InvertedIndex.exists(self.path))
+        index = InvertedIndex.load(self.path)
+        self.assertEqual(len(index), len(self.posts))
+        self.assertEqual(index.meta['topic'], 'test')
+        self.assertEqual(index.search(['w5', 'w9'], 5),
+                         self.index.search(['w5', 'w9'], 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
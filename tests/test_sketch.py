@@ -0,0 +1,159 @@
+import zlib
+import pickle
+import unittest
+from collections import Counter
+import numpy as np
+from app.sketch import (ApproximateCounter, CountMinSketch, SpaceSaving,
+                        token_keys)
+from app.vocabulary import Vocabulary
+
+
+def zipf_tokens(seed, ntokens=60000, nwords=20000):
+    # A long tailed stream, most words are seen once or twice.
+    rng = np.random.RandomState(seed)
+    weights = 1.0 / np.arange(1, nwords + 1)
+    ranks = rng.choice(nwords, ntokens, p=weights / weights.sum())
+    return ['w%d' % rank for rank in ranks]
+
+
+class CountMinSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = zipf_tokens(0)
+        self.exact = Counter(self.tokens)
+        self.words = list(self.exact)
+        self.keys = token_keys(self.words)
+        self.truth = np.array([self.exact[word] for word in self.words])
+
+    def sketch(self, tokens, epsilon=1e-3, delta=1e-2):
+        sketch = CountMinSketch(epsilon, delta)
+        counts = Counter(tokens)
+        sketch.add(token_keys(list(counts)), list(counts.values()))
+        return sketch
+
+    def test_overcount_within_bound(self):
+        for epsilon in (1e-2, 1e-3):
+            sketch = self.sketch(self.tokens, epsilon)
+            self.assertLessEqual(sketch.epsilon, epsilon)
+            overcount = sketch.estimate(self.keys) - self.truth
+            self.assertGreaterEqual(overcount.min(), 0)
+            # Each estimate exceeds the bound with probability delta.
+            exceeded = overcount > sketch.epsilon * len(self.tokens)
+            self.assertLessEqual(exceeded.mean(), 0.01)
+            self.assertEqual(sketch.total, len(self.tokens))
+
+    def test_merge_is_exact(self):
+        half = len(self.tokens) // 2
+        merged = self.sketch(self.tokens[:half])
+        merged.merge(self.sketch(self.tokens[half:]))
+        whole = self.sketch(self.tokens)
+        self.assertTrue(np.array_equal(merged.table, whole.table))
+        self.assertEqual(merged.total, whole.total)
+        with self.assertRaises(ValueError):
+            merged.merge(CountMinSketch(1e-2))
+        with self.assertRaises(ValueError):
+            merged.merge(CountMinSketch(1e-3, 1e-2, seed=1))
+
+    def test_distinct(self):
+        sketch = self.sketch(self.tokens, 1e-4)
+        self.assertLess(abs(sketch.distinct() - len(self.exact)),
+                        0.05 * len(self.exact))
+
+    def test_keys_are_stable(self):
+        key = 'ñandú'.encode('utf-8')
+        self.assertEqual(token_keys(['ñandú']).tolist(),
+                         [zlib.crc32(key) << 32 | zlib.adler32(key)])
+        self.assertEqual(token_keys([]).dtype, np.uint64)
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def check(self, summary, exact, total):
+        threshold = total / summary.capacity
+        self.assertLessEqual(len(summary), summary.capacity)
+        for word, count in exact.items():
+            if count > threshold:
+                self.assertIn(word, summary.counts)
+        for word, count in summary.counts.items():
+            error = summary.errors[word]
+            self.assertLessEqual(error, threshold)
+            self.assertGreaterEqual(count, exact[word])
+            self.assertLessEqual(count - error, exact[word])
+
+    def test_guarantees(self):
+        tokens = zipf_tokens(1)
+        exact = Counter(tokens)
+        for capacity in (10, 500):
+            summary = SpaceSaving(capacity)
+            # Weighted updates, a few tokens at a time.
+            for start in range(0, len(tokens), 1000):
+                counts = Counter(tokens[start:start + 1000])
+                summary.update(counts.keys(), counts.values())
+            self.check(summary, exact, len(tokens))
+
+    def test_merge(self):
+        tokens = zipf_tokens(2)
+        summaries = []
+        for part in (tokens[:25000], tokens[25000:]):
+            summary = SpaceSaving(200)
+            counts = Counter(part)
+            summary.update(counts.keys(), counts.values())
+            summaries.append(summary)
+        summaries[0].merge(summaries[1])
+        self.check(summaries[0], Counter(tokens), len(tokens))
+
+
+class ApproximateCounterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = zipf_tokens(3)
+        self.exact = Counter(self.tokens)
+
+    def test_within_bounds(self):
+        counter = ApproximateCounter(capacity=1000, buffer_size=997)
+        for start in range(0, len(self.tokens), 50):
+            counter.update(self.tokens[start:start + 50])
+        bounds = counter.bounds()
+        self.assertEqual(bounds['total'], len(self.tokens))
+        self.assertLessEqual(bounds['probability'], 1e-3)
+
+        overcounts = []
+        for word, count in counter.items():
+            self.assertGreaterEqual(count, self.exact[word])
+            overcounts.append(count - self.exact[word])
+            self.assertEqual(counter[word], count)
+        self.assertLessEqual(max(overcounts), bounds['overcount'])
+        for word, count in self.exact.items():
+            self.assertGreaterEqual(counter.get(word), count)
+            if count > bounds['heavy_threshold']:
+                self.assertIn(word, counter)
+
+        top = [word for word, _ in self.exact.most_common(20)]
+        self.assertEqual([word for word, _ in counter.most_common(20)],
+                         top)
+
+    def test_update_forms(self):
+        vocabulary = Vocabulary(self.tokens)
+        expected = ApproximateCounter(self.tokens)
+        for other in (vocabulary, dict(self.exact), iter(self.tokens)):
+            counter = ApproximateCounter()
+            counter.update(other)
+            self.assertEqual(counter.most_common(), expected.most_common())
+
+        halves = ApproximateCounter(self.tokens[:30000])
+        halves.update(ApproximateCounter(self.tokens[30000:]))
+        self.assertEqual(halves.total, expected.total)
+        self.assertTrue(np.array_equal(halves.sketch.table,
+                                       expected.sketch.table))
+
+    def test_pickle_flushes(self):
+        counter = ApproximateCounter(buffer_size=1 << 20)
+        counter.update(self.tokens[:1000])
+        copy = pickle.loads(pickle.dumps(counter))
+        self.assertEqual(copy.total, 1000)
+        self.assertEqual(list(copy.items()), list(counter.items()))
+        self.assertEqual(ApproximateCounter().get('missing', None), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
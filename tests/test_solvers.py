@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import scipy.sparse as sp
+from app import solvers
+from app.textrank import normalize_columns
+
+
+def random_graph(n, density, seed, sparse=True):
+    # Column normalized symmetric graph with random weights.
+    graph = sp.random(n, n, density=density, random_state=seed,
+                      format='csr')
+    graph = graph + graph.T
+    if not sparse:
+        graph = graph.toarray()
+    return normalize_columns(graph)
+
+
+class SolveTest(unittest.TestCase):
+
+    tol = 1e-10
+    d = 0.85
+
+    def graphs(self):
+        for seed in range(6):
+            yield random_graph(200 + 50 * seed, 0.02 + 0.01 * (seed % 3),
+                               seed, sparse=seed % 2 == 0)
+
+    def test_methods_reach_power_vector(self):
+        # The error of an iterate is at most d / (1 - d) times its step.
+        bound = self.tol * self.d / (1 - self.d)
+        for g_matrix in self.graphs():
+            exact = solvers.solve(g_matrix, self.d, 1e-14, 1000).x
+            for method in solvers.METHODS:
+                for norm in solvers.NORMS:
+                    result = solvers.solve(g_matrix, self.d, self.tol, 1000,
+                                           method, norm)
+                    self.assertLess(result.residual, self.tol)
+                    error = solvers.residual_norm(result.x - exact, norm)
+                    self.assertLess(error, bound + 1e-12)
+
+    def test_extrapolation_needs_no_more_iterations(self):
+        for g_matrix in self.graphs():
+            power = solvers.solve(g_matrix, self.d, self.tol, 1000)
+            for method in ('aitken', 'quadratic'):
+                result = solvers.solve(g_matrix, self.d, self.tol, 1000,
+                                       method)
+                self.assertLessEqual(result.iterations, power.iterations)
+
+    def test_residual_is_last_step(self):
+        g_matrix = random_graph(100, 0.05, 7)
+        for method in solvers.METHODS:
+            result = solvers.solve(g_matrix, self.d, self.tol, 1000, method)
+            step = (1 - self.d) + self.d * g_matrix.dot(result.x)
+            self.assertLess(solvers.residual_norm(step - result.x),
+                            self.d * result.residual + 1e-12)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            solvers.solve(np.eye(3), method='jacobi')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,489 @@
+import os
+import bz2
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+import numpy as np
+from nltk.tokenize import sent_tokenize, word_tokenize
+from app import solvers
+from app.corpus import CorpusStore
+from app.textrank import (TextCleaner, TextRank, TokenPairCounter, Words,
+                          knn_graph, normalize_columns, symmetrize,
+                          unit_rows)
+from app.vectorstore import EmbeddingStore
+from benchmarks.synthetic import write_dump
+
+
+def random_sentences(seed, nsentences=300, nwords=200):
+    # Sentences over a skewed vocabulary, as cleaned text gives them.
+    rng = random.Random(seed)
+    words = ['w%d' % i for i in range(nwords)]
+    weights = [1.0 / (rank + 1) for rank in range(nwords)]
+    return [rng.choices(words, weights, k=rng.randint(1, 15))
+            for _ in range(nsentences)]
+
+
+def random_text(seed, nsentences=300):
+    # Sentences mixing contractions, quotes, numbers and punctuation.
+    rng = random.Random(seed)
+    words = ['I', "can't", "won't", "it's", 'feel', 'Alone', 'the',
+             'e.g.', '"quoted"', "'single'", '``ticks``', 'x', 'a',
+             'well-being', 'U.S.', '3', '$20', 'ok...', 'Dr.', "they're",
+             'ñandú', 'C++', "y'all", 'happy', 'SAD', 'night']
+    ends = ['.', '!', '?', '...', '']
+    return ' '.join(' '.join(rng.choice(words)
+                             for _ in range(rng.randint(1, 20)))
+                    + rng.choice(ends) for _ in range(nsentences))
+
+
+def staged(text):
+    # The cleaning chain the fused generator replaced.
+    sentences = sent_tokenize(text)
+    sentences = [sentence.lower() for sentence in
+                 TextCleaner.fix_contractions(sentences)]
+    sentences = [word_tokenize(sentence) for sentence in sentences]
+    sentences = TextCleaner.clean_sentences(sentences)
+    return TextCleaner.remove_stopwords_sent(sentences)
+
+
+def window_pairs(sentences, window_size):
+    # Pairs of the original TextRank loop, with repetitions.
+    pairs = []
+    for sentence in sentences:
+        for i, word in enumerate(sentence):
+            for j in range(i + 1, i + window_size):
+                if j >= len(sentence):
+                    break
+                pairs.append((word, sentence[j]))
+    return pairs
+
+
+def dense_matrix(text_rank):
+    # The transition matrix as the original dense loop built it.
+    vocab = text_rank.get_vocabulary()
+    g = np.zeros((len(vocab), len(vocab)), dtype='float')
+    for word1, word2 in text_rank.get_token_pairs():
+        g[vocab[word1], vocab[word2]] = 1
+    g = symmetrize(g)
+    norm = np.sum(g, axis=0)
+    return np.divide(g, norm, out=np.zeros_like(g), where=norm != 0)
+
+
+class TokenPairCounterTest(unittest.TestCase):
+
+    def counted(self, counter):
+        rows, cols, counts = counter.edges()
+        return dict(zip(zip(rows.tolist(), cols.tolist()), counts.tolist()))
+
+    def test_counts_match_window_loop(self):
+        rng = random.Random(2)
+        sentences = [[rng.randrange(50) for _ in range(rng.randint(0, 12))]
+                     for _ in range(300)]
+        for window_size in (1, 2, 4, 20):
+            expected = Counter(window_pairs(sentences, window_size))
+            # A small buffer compacts many times on the way.
+            for buffer_size in (7, 1 << 20):
+                counter = TokenPairCounter(buffer_size)
+                for sentence in sentences:
+                    counter.add_sentence(sentence, window_size)
+                self.assertEqual(self.counted(counter), dict(expected))
+                self.assertEqual(len(counter), len(expected))
+                self.assertEqual(counter.keys.tolist(),
+                                 sorted(counter.keys.tolist()))
+
+    def test_large_ids(self):
+        counter = TokenPairCounter()
+        # Keys are signed, rows hold 31 bits.
+        big = (1 << 31) - 1
+        counter.add_sentence([big, 0, big], 3)
+        self.assertEqual(self.counted(counter),
+                         {(big, 0): 1, (0, big): 1, (big, big): 1})
+
+    def test_add_counts(self):
+        first, second = TokenPairCounter(), TokenPairCounter()
+        first.add_sentence([1, 2, 3], 2)
+        second.add_sentence([2, 3, 1], 2)
+        second.compact()
+        first.add_counts(second.keys, second.counts)
+        self.assertEqual(self.counted(first),
+                         {(1, 2): 1, (2, 3): 2, (3, 1): 1})
+
+    def test_token_pairs(self):
+        sentences = random_sentences(3, 100, 30)
+        text_rank = TextRank(sentences)
+        pairs = window_pairs(sentences, text_rank.window_size)
+        self.assertEqual(text_rank.get_token_pairs(),
+                         list(dict.fromkeys(pairs)))
+
+        vocab = text_rank.get_vocabulary()
+        expected = Counter((vocab[a], vocab[b]) for a, b in pairs)
+        self.assertEqual(self.counted(text_rank.get_pair_counter()),
+                         dict(expected))
+
+
+class SparseGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sentences = random_sentences(1)
+
+    def test_matrix_matches_dense_loop(self):
+        expected = dense_matrix(TextRank(self.sentences))
+        for sparse in (True, False):
+            g = TextRank(self.sentences, sparse=sparse).get_matrix()
+            self.assertEqual(hasattr(g, 'toarray'), sparse)
+            g = g.toarray() if sparse else g
+            np.testing.assert_allclose(g, expected, rtol=0, atol=1e-15)
+
+    def test_weighted_matrices_agree(self):
+        dense = TextRank(self.sentences, sparse=False, weighted=True)
+        sparse = TextRank(self.sentences, sparse=True, weighted=True)
+        g = sparse.get_matrix()
+        np.testing.assert_allclose(g.toarray(), dense.get_matrix(),
+                                   rtol=0, atol=1e-15)
+        np.testing.assert_allclose(g.sum(axis=0), 1.0)
+        self.assertFalse(np.allclose(g.toarray(),
+                                     TextRank(self.sentences).get_matrix()
+                                     .toarray()))
+
+    def test_ranks_agree(self):
+        for weighted in (False, True):
+            ranks = []
+            for sparse in (True, False):
+                text_rank = TextRank(self.sentences, sparse, weighted)
+                text_rank.iterate(text_rank.get_matrix())
+                ranks.append(text_rank.node_weight)
+            self.assertEqual(list(ranks[0]), list(ranks[1]))
+            np.testing.assert_allclose(list(ranks[0].values()),
+                                       list(ranks[1].values()),
+                                       rtol=1e-12)
+
+    def test_isolated_words(self):
+        # One word sentences give nodes without edges, and zero columns.
+        text_rank = TextRank([['a'], ['b', 'c'], ['a']])
+        g = text_rank.get_matrix().toarray()
+        np.testing.assert_allclose(g, dense_matrix(text_rank))
+        self.assertEqual(g[:, 0].tolist(), [0.0, 0.0, 0.0])
+        text_rank.iterate(text_rank.get_matrix())
+        self.assertAlmostEqual(text_rank.node_weight['a'], 1 - text_rank.d)
+
+
+def exhaustive_knn(embeddings, k):
+    # Top k cosine neighbours from the full similarity matrix.
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    x = np.divide(embeddings, norms, out=np.zeros_like(embeddings),
+                  where=norms != 0)
+    sims = x.dot(x.T)
+    np.fill_diagonal(sims, -np.inf)
+    g = np.zeros_like(sims)
+    for i, row in enumerate(sims):
+        for j in np.argsort(-row)[:k]:
+            if row[j] > 0:
+                g[i, j] = row[j]
+    return np.maximum(g, g.T)
+
+
+def random_store(words, dim=16, seed=0):
+    # In memory EmbeddingStore with a random vector per word.
+    keys = np.array(sorted(word.encode('utf-8') for word in words))
+    vectors = np.random.RandomState(seed).normal(size=(len(keys), dim))
+    return EmbeddingStore(keys, vectors.astype('float32'))
+
+
+class SimilarityGraphTest(unittest.TestCase):
+
+    def test_knn_graph_matches_exhaustive(self):
+        embeddings = np.random.RandomState(4).normal(size=(60, 8))
+        embeddings[7] = 0
+        for k in (1, 5, 59, 100):
+            for block_size in (7, 256):
+                g = knn_graph(embeddings, k, block_size)
+                np.testing.assert_allclose(
+                    g.toarray(), exhaustive_knn(embeddings, k), atol=1e-6)
+                self.assertEqual(g.diagonal().tolist(), [0.0] * 60)
+                self.assertEqual(g.getrow(7).nnz, 0)
+
+    def test_knn_graph_single_node(self):
+        self.assertEqual(knn_graph(np.ones((1, 4)), 10).shape, (1, 1))
+        self.assertEqual(knn_graph(np.ones((1, 4)), 10).nnz, 0)
+
+    def test_word_nodes(self):
+        text_rank = TextRank(random_sentences(5, 100, 40))
+        words = text_rank.get_labels()
+        # The first words have no vector.
+        store = random_store(words[3:])
+        g = text_rank.get_similarity_matrix(store, k=4, block_size=9)
+        expected = exhaustive_knn(store.matrix(words).astype(float), 4)
+        np.testing.assert_allclose(g.toarray(),
+                                   normalize_columns(expected), atol=1e-6)
+
+        text_rank.iterate(g, text_rank.get_labels())
+        self.assertEqual(list(text_rank.node_weight), words)
+        for word in words[:3]:
+            self.assertAlmostEqual(text_rank.node_weight[word],
+                                   1 - text_rank.d)
+
+    def test_sentence_nodes(self):
+        sentences = random_sentences(6, 30, 40)
+        text_rank = TextRank(sentences)
+        store = random_store(text_rank.get_labels())
+        g = text_rank.get_similarity_matrix(store, k=3, nodes='sentences')
+        # Sentences average the unit vectors of their words.
+        averages = np.array([np.mean(unit_rows(store.matrix(sentence)),
+                                     axis=0) for sentence in sentences])
+        np.testing.assert_allclose(
+            g.toarray(), normalize_columns(exhaustive_knn(averages, 3)),
+            atol=1e-5)
+
+        labels = text_rank.get_labels('sentences')
+        self.assertEqual(labels, [' '.join(s) for s in sentences])
+        with self.assertRaises(ValueError):
+            text_rank.get_similarity_matrix(store, nodes='documents')
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sentences = random_sentences(7, 600, 300)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def full(self, sentences):
+        text_rank = TextRank(sentences)
+        text_rank.min_diff = 1e-12
+        text_rank.iterate(text_rank.get_matrix())
+        return text_rank
+
+    def assertGraphEqual(self, first, second):
+        self.assertEqual(first.get_vocabulary(), second.get_vocabulary())
+        self.assertEqual(first.vocab.counts.tolist(),
+                         second.vocab.counts.tolist())
+        first_pairs, second_pairs = first.pairs.edges(), second.pairs.edges()
+        for first_array, second_array in zip(first_pairs, second_pairs):
+            self.assertEqual(first_array.tolist(), second_array.tolist())
+
+    def assertRanksEqual(self, first, second):
+        self.assertEqual(list(first.node_weight), list(second.node_weight))
+        np.testing.assert_allclose(first.pr, second.pr, rtol=0, atol=1e-9)
+
+    def test_update_matches_full_recompute(self):
+        text_rank = self.full(self.sentences[:200])
+        for start, stop in ((200, 400), (400, 600)):
+            stats = text_rank.update(self.sentences[start:stop])
+            expected = self.full(self.sentences[:stop])
+            self.assertGraphEqual(text_rank, expected)
+            self.assertRanksEqual(text_rank, expected)
+            self.assertEqual(stats['nodes'], len(expected.vocab))
+            self.assertEqual(stats['edges'], len(expected.pairs))
+            self.assertEqual(stats['iterations'], text_rank.iterations)
+
+    def test_update_counts_new_nodes(self):
+        text_rank = self.full([['a', 'b', 'c']])
+        stats = text_rank.update([['c', 'd'], ['e']])
+        self.assertEqual(stats['new_nodes'], 2)
+        self.assertEqual(stats['nodes_touched'], 3)
+        self.assertEqual(text_rank.get_labels(), ['a', 'b', 'c', 'd', 'e'])
+
+    def test_save_load_update(self):
+        path = os.path.join(self.directory, 'graph.npz')
+        self.full(self.sentences[:300]).save(path)
+        text_rank = TextRank.load(path)
+        text_rank.min_diff = 1e-12
+        self.assertGraphEqual(text_rank, self.full(self.sentences[:300]))
+        text_rank.update(self.sentences[300:])
+        expected = self.full(self.sentences)
+        self.assertGraphEqual(text_rank, expected)
+        self.assertRanksEqual(text_rank, expected)
+
+    def test_merge_matches_single_graph(self):
+        merged = TextRank(self.sentences[:250])
+        merged.merge(TextRank(self.sentences[250:]))
+        self.assertGraphEqual(merged, TextRank(self.sentences))
+
+        other = TextRank(self.sentences)
+        other.window_size = 2
+        with self.assertRaises(ValueError):
+            merged.merge(other)
+
+
+class PersonalizedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.text_rank = TextRank(random_sentences(0))
+        self.text_rank.min_diff = 1e-10
+        self.g_matrix = self.text_rank.get_matrix()
+        every = ['w%d' % i for i in range(200)]
+        self.seeds = {'one': ['w3'], 'two': ['w10', 'w20'],
+                      'weighted': {'w1': 3.0, 'w50': 1.0},
+                      'missing': ['nowhere'], 'all': every}
+
+    def test_batch_equals_separate_solves(self):
+        text_rank = self.text_rank
+        teleport = text_rank.teleport_matrix(self.seeds)
+        batch = solvers.solve_batch(self.g_matrix, teleport, text_rank.d,
+                                    text_rank.min_diff, text_rank.steps)
+        for j in range(teleport.shape[1]):
+            single = solvers.solve(self.g_matrix, text_rank.d,
+                                   text_rank.min_diff, text_rank.steps,
+                                   teleport=teleport[:, j])
+            np.testing.assert_allclose(batch.x[:, j], single.x, rtol=0,
+                                       atol=1e-12)
+            self.assertEqual(batch.iterations[j], single.iterations)
+            self.assertAlmostEqual(batch.residuals[j], single.residual)
+        self.assertEqual(batch.matvecs, int(batch.iterations.sum()))
+
+    def test_iterate_personalized(self):
+        text_rank = self.text_rank
+        text_rank.iterate_personalized(self.g_matrix, self.seeds)
+        self.assertEqual(text_rank.seed_names, list(self.seeds))
+        labels = text_rank.get_labels()
+        for j, seeds in enumerate(self.seeds.values()):
+            teleport = text_rank.teleport_matrix({'seed': seeds})[:, 0]
+            single = solvers.solve(self.g_matrix, text_rank.d,
+                                   text_rank.min_diff, text_rank.steps,
+                                   teleport=teleport)
+            np.testing.assert_allclose(text_rank.personalized_pr[:, j],
+                                       single.x, rtol=0, atol=1e-12)
+
+        keywords = text_rank.get_personalized_keywords(5)
+        self.assertEqual(list(keywords), list(self.seeds))
+        self.assertEqual(next(iter(keywords['one'])), 'w3')
+        for ranks in keywords.values():
+            self.assertEqual(len(ranks), 5)
+            self.assertTrue(set(ranks) <= set(labels))
+
+    def test_uniform_teleport_is_iterate(self):
+        text_rank = self.text_rank
+        teleport = text_rank.teleport_matrix(self.seeds)
+        names = list(self.seeds)
+        for name in ('missing', 'all'):
+            np.testing.assert_allclose(teleport[:, names.index(name)], 1.0)
+        np.testing.assert_allclose(teleport.sum(axis=0), len(teleport))
+
+        text_rank.iterate(self.g_matrix)
+        text_rank.iterate_personalized(self.g_matrix,
+                                       {'all': self.seeds['all']})
+        np.testing.assert_allclose(text_rank.personalized_pr[:, 0],
+                                   text_rank.pr, rtol=0, atol=1e-12)
+
+
+class TextCleanerTest(unittest.TestCase):
+
+    def test_matches_staged_chain(self):
+        for seed in range(3):
+            text = random_text(seed)
+            cleaner = TextCleaner(text)
+            self.assertEqual(cleaner.process_text_sentences(),
+                             staged(text))
+            self.assertEqual(list(cleaner.iter_sentences()), staged(text))
+
+    def test_sentence_cleaner(self):
+        texts = [random_text(seed, 20) for seed in range(4)]
+        clean_text = TextCleaner(None).sentence_cleaner()
+        for text in texts:
+            self.assertEqual(list(clean_text(text)), staged(text))
+
+    def test_stages(self):
+        text = random_text(5, 50)
+        self.assertEqual(
+            list(TextCleaner(text).iter_sentences(())),
+            [word_tokenize(sentence) for sentence in sent_tokenize(text)])
+
+        sentences = [word_tokenize(sentence.lower())
+                     for sentence in sent_tokenize(text)]
+        self.assertEqual(
+            list(TextCleaner(text).iter_sentences(('lower', 'clean'))),
+            TextCleaner.clean_sentences(sentences))
+
+        with self.assertRaises(ValueError):
+            list(TextCleaner(text).iter_sentences(('lower', 'stem')))
+
+    def test_split_sentences(self):
+        text = random_text(6, 100)
+        self.assertEqual(list(TextCleaner.split_sentences(text)),
+                         sent_tokenize(text))
+        self.assertEqual(list(TextCleaner('').iter_sentences()), [])
+
+
+class DocumentStreamTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.dump = os.path.join(cls.directory, 'RS_test.bz2')
+        write_dump(cls.dump, 200, vocabulary_size=300, mean_words=15)
+        with bz2.open(cls.dump, 'rt') as f:
+            cls.posts = [json.loads(line) for line in f]
+        cls.store = os.path.join(cls.directory, 'store')
+        CorpusStore.convert(cls.dump, cls.store)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def expected(self, topic, start=0, stop=None):
+        return [(post['id'], post['selftext'],
+                 {'line': number, 'domain': topic})
+                for number, post in enumerate(self.posts[start:stop], start)
+                if post['domain'] == topic]
+
+    def test_documents_match_dump(self):
+        topic = 'self.depression'
+        for path in (self.dump, self.store):
+            words = Words(path, topic)
+            self.assertEqual(list(words.iter_documents()),
+                             self.expected(topic))
+            self.assertEqual(list(words.iter_documents(70, 40)),
+                             self.expected(topic, 40, 110))
+
+    def test_limits(self):
+        words = Words(self.dump, 'self.AskReddit')
+        expected = self.expected('self.AskReddit')
+        self.assertEqual(list(words.iter_documents(max_posts=5)),
+                         expected[:5])
+        sizes = [len(text.encode('utf-8')) for _, text, _ in expected]
+        limit = sum(sizes[:7]) + sizes[7] // 2
+        self.assertEqual(list(words.iter_documents(max_bytes=limit)),
+                         expected[:7])
+
+    def test_text_only(self):
+        topic = 'self.depression'
+        for nlines in (None, 50):
+            text = ''.join(post['selftext']
+                           for post in self.posts[:nlines]
+                           if post['domain'] == topic)
+            self.assertEqual(Words(self.dump, topic).get_text_only(nlines),
+                             text)
+            self.assertEqual(Words(self.store, topic).get_text_only(nlines),
+                             text)
+
+    def test_documents_are_not_glued(self):
+        documents = list(Words(self.dump, 'self.depression')
+                         .iter_documents(max_posts=20))
+        clean_text = TextCleaner(None).sentence_cleaner()
+        expected = [sentence for _, text, _ in documents
+                    for sentence in clean_text(text)]
+        self.assertEqual(list(TextCleaner(documents).iter_sentences()),
+                         expected)
+        texts = [text for _, text, _ in documents]
+        self.assertEqual(list(TextCleaner(texts).iter_sentences()),
+                         expected)
+
+    def test_streamed_graph_matches_list(self):
+        documents = Words(self.dump, 'self.depression').iter_documents()
+        streamed = TextRank(TextCleaner(documents).iter_sentences())
+        sentences = list(TextCleaner(
+            Words(self.dump, 'self.depression').iter_documents())
+            .iter_sentences())
+        listed = TextRank(sentences)
+        for text_rank in (streamed, listed):
+            text_rank.iterate(text_rank.get_matrix())
+        self.assertEqual(streamed.node_weight, listed.node_weight)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import json
+import bz2
+import shutil
+import tempfile
+import unittest
+from app.textrank import Words
+from app.topics import TopicAggregator, topic_file_name
+from benchmarks.synthetic import write_dump
+
+
+class TopicFileNameTest(unittest.TestCase):
+
+    def test_safe_domain_is_kept(self):
+        self.assertEqual(topic_file_name('self.depression'),
+                         'self.depression')
+
+    def test_sanitized_domains_do_not_collide(self):
+        domains = ['a_b', 'a b', 'a/b', 'a:b', '', '..', '_']
+        stems = [topic_file_name(domain) for domain in domains]
+        self.assertEqual(len(set(stems)), len(domains))
+        for stem in stems:
+            self.assertRegex(stem, r'^[\w.-]+$')
+
+
+class TopicAggregatorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, 'RS_test.bz2')
+        write_dump(cls.path, 400, vocabulary_size=500, mean_words=20)
+        with bz2.open(cls.path, 'rt') as f:
+            cls.posts = [json.loads(line) for line in f]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_counts_match_words(self):
+        with TopicAggregator(self.path, clean=False) as aggregator:
+            aggregator.run()
+            topics = aggregator.topic_names()
+            self.assertTrue(topics)
+            for topic in topics:
+                expected = Words(self.path, topic).get_words(None)
+                self.assertEqual(dict(aggregator.counts[topic].items()),
+                                 dict(expected.items()))
+
+    def test_posts_without_text_open_no_topic(self):
+        with TopicAggregator(self.path, clean=False) as aggregator:
+            aggregator.run()
+            with_text = {post['domain'] for post in self.posts
+                         if post['selftext'].strip()}
+            self.assertEqual(set(aggregator.topic_names()), with_text)
+            self.assertNotIn('i.imgur.com', aggregator.topic_names())
+
+    def test_topic_cutoffs(self):
+        with TopicAggregator(self.path, max_topics=1) as aggregator:
+            aggregator.run()
+            self.assertEqual(len(aggregator.topic_names()), 1)
+            self.assertEqual(list(aggregator.streams),
+                             aggregator.topic_names())
+
+        posts = {}
+        for post in self.posts:
+            if post['selftext'].strip():
+                posts[post['domain']] = posts.get(post['domain'], 0) + 1
+        min_posts = max(posts.values())
+        with TopicAggregator(self.path, buffer_bytes=1,
+                             min_posts=min_posts) as aggregator:
+            aggregator.run()
+            kept = [topic for topic in posts if posts[topic] >= min_posts]
+            self.assertEqual(aggregator.topic_names(), kept)
+            self.assertEqual(list(aggregator.counts), kept)
+            spills = os.listdir(aggregator._directory)
+            self.assertEqual(len(spills), len(kept))
+
+
+if __name__ == '__main__':
+    unittest.main()
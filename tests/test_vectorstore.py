@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from app.textrank import VectorRepr
+from app.vectorstore import EmbeddingStore
+from benchmarks.synthetic import write_glove
+
+
+class EmbeddingStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, 'glove.test')
+        self.source = os.path.join(self.directory, 'glove.test.txt')
+        self.words = ['the', 'zebra', 'ñandú', 'a', 'ab', 'x' * 30]
+        write_glove(self.source, self.words, dim=8)
+        # Repeated words keep their first vector.
+        with open(self.source, 'a', encoding='utf8') as f:
+            f.write('zebra' + ' 9.0' * 8 + '\n')
+        with mock.patch.object(VectorRepr, 'glove_vectors_file',
+                               self.source):
+            self.model = VectorRepr.load_glove_vectors()
+        self.model['zebra'] = self.first_vector('zebra')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def first_vector(self, word):
+        with open(self.source, encoding='utf8') as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] == word:
+                    return np.array(parts[1:], dtype=float)
+
+    def check(self, store, atol):
+        self.assertEqual(len(store), len(self.words))
+        self.assertEqual(store.dim, 8)
+        for word in self.words:
+            self.assertIn(word, store)
+            np.testing.assert_allclose(store[word], self.model[word],
+                                       rtol=0, atol=atol)
+            np.testing.assert_allclose(store.get(word), self.model[word],
+                                       rtol=0, atol=atol)
+        for word in ('', 'missing', 'x' * 31):
+            self.assertNotIn(word, store)
+            self.assertIsNone(store.get(word))
+            with self.assertRaises(KeyError):
+                store[word]
+
+    def test_convert_round_trip(self):
+        self.check(EmbeddingStore.convert(self.source, self.prefix), 1e-6)
+        store = EmbeddingStore.load(self.prefix)
+        self.assertIsInstance(store.vectors, np.memmap)
+        self.assertEqual(store.vectors.dtype, np.float32)
+        self.check(store, 1e-6)
+
+    def test_float16(self):
+        store = EmbeddingStore.convert(self.source, self.prefix, 'float16')
+        self.assertEqual(store.vectors.dtype, np.float16)
+        self.check(store, 5e-3)
+
+    def test_matrix(self):
+        store = EmbeddingStore.convert(self.source, self.prefix)
+        words = ['zebra', 'missing', 'the', 'ñandú']
+        rows, found = store.lookup(words)
+        self.assertEqual(found.tolist(), [True, False, True, True])
+        matrix = store.matrix(words)
+        self.assertEqual(matrix.shape, (4, 8))
+        for i, word in enumerate(words):
+            expected = self.model.get(word, np.zeros(8))
+            np.testing.assert_allclose(matrix[i], expected, atol=1e-6)
+        self.assertEqual(store.matrix([]).shape, (0, 8))
+
+    def test_vector_repr_converts_once(self):
+        with mock.patch.object(VectorRepr, 'glove_vectors_file',
+                               self.source):
+            vectors = VectorRepr(self.prefix).glove_vectors
+        self.check(vectors, 1e-6)
+        self.assertTrue(os.path.exists(self.prefix +
+                                       EmbeddingStore.VECTORS_SUFFIX))
+
+        # The store is mapped from then on, the text model is not read.
+        with mock.patch.object(EmbeddingStore, 'convert',
+                               side_effect=AssertionError):
+            self.check(VectorRepr(self.prefix).glove_vectors, 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
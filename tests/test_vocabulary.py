@@ -0,0 +1,104 @@
+import pickle
+import random
+import unittest
+from collections import Counter
+from app.vocabulary import Vocabulary
+
+
+def random_documents(seed, ndocuments=200, nwords=300):
+    # Documents of a skewed vocabulary, with a few very long tokens.
+    rng = random.Random(seed)
+    words = ['w%d' % i for i in range(nwords)] + ['ñandú', 'x' * 40]
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    return [rng.choices(words, weights, k=rng.randint(0, 30))
+            for _ in range(ndocuments)]
+
+
+class VocabularyTest(unittest.TestCase):
+
+    def check(self, vocabulary, counter):
+        self.assertEqual(len(vocabulary), len(counter))
+        self.assertEqual(list(vocabulary.items()), list(counter.items()))
+        self.assertEqual(list(vocabulary), list(counter))
+
+    def test_intern(self):
+        vocabulary = Vocabulary(freeze_size=4)
+        tokens = ['b', 'a', 'b', 'c', 'x' * 40, 'a', 'd', 'e', 'f', 'b']
+        ids = vocabulary.intern(tokens)
+        first = list(dict.fromkeys(tokens))
+        self.assertEqual(ids, [first.index(token) for token in tokens])
+        self.assertEqual(vocabulary.intern(['f', 'g']), [6, 7])
+        self.assertEqual(vocabulary.counts.tolist(), [0] * 8)
+        self.assertEqual(vocabulary.lookup(['g', 'z', 'b']).tolist(),
+                         [7, -1, 0])
+        self.assertEqual(vocabulary.index('x' * 40), 3)
+        self.assertIsNone(vocabulary.index('z'))
+
+    def test_update_matches_counter(self):
+        for freeze_size in (1, 7, 1 << 16):
+            vocabulary = Vocabulary(freeze_size=freeze_size)
+            counter = Counter()
+            for document in random_documents(freeze_size):
+                vocabulary.update(document)
+                counter.update(document)
+            self.check(vocabulary, counter)
+            for token in ('w0', 'ñandú', 'x' * 40, 'missing'):
+                self.assertEqual(vocabulary[token], counter[token])
+                self.assertEqual(token in vocabulary, token in counter)
+
+    def test_add_and_update_share_ids(self):
+        vocabulary = Vocabulary(freeze_size=3, buffer_size=5)
+        counter = Counter()
+        for k, document in enumerate(random_documents(1, 50)):
+            if k % 2:
+                ids = vocabulary.add(document)
+                self.assertEqual(ids, vocabulary.lookup(document).tolist())
+            else:
+                vocabulary.update(document)
+            counter.update(document)
+        self.check(vocabulary, counter)
+
+    def test_mapping_update(self):
+        vocabulary = Vocabulary(['a', 'b', 'a'])
+        vocabulary.update({'c': 3, 'a': 2})
+        self.assertEqual(dict(vocabulary.items()),
+                         {'a': 4, 'b': 1, 'c': 3})
+
+    def test_merge_matches_serial_count(self):
+        documents = random_documents(2)
+        serial = Vocabulary(documents[0])
+        for document in documents[1:]:
+            serial.update(document)
+
+        merged = Vocabulary(freeze_size=5)
+        for part in (documents[:70], documents[70:150], documents[150:]):
+            partial = Vocabulary()
+            for document in part:
+                partial.update(document)
+            merged.merge(partial)
+
+        self.assertEqual(list(merged.items()), list(serial.items()))
+
+    def test_most_common(self):
+        counter = Counter()
+        vocabulary = Vocabulary()
+        for document in random_documents(3):
+            vocabulary.update(document)
+            counter.update(document)
+        self.assertEqual(vocabulary.most_common(), counter.most_common())
+        self.assertEqual(vocabulary.most_common(10),
+                         counter.most_common(10))
+        self.assertEqual(Vocabulary(['b', 'a']).most_common(),
+                         [('b', 1), ('a', 1)])
+        self.assertEqual(Vocabulary().most_common(3), [])
+
+    def test_pickle(self):
+        vocabulary = Vocabulary()
+        for document in random_documents(4, 20):
+            vocabulary.update(document)
+        copy = pickle.loads(pickle.dumps(vocabulary))
+        self.assertEqual(list(copy.items()), list(vocabulary.items()))
+
+
+if __name__ == '__main__':
+    unittest.main()